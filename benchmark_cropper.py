@@ -0,0 +1,440 @@
+"""
+图片裁切性能基准测试
+
+生成不同尺寸的合成商品图数据集，用 image_cropper.process_images 处理，记录吞吐量、
+各阶段耗时和峰值内存，结果追加到历史文件，并与保存的基线对比，超出阈值时报告性能回退。
+
+用法示例：
+    python benchmark_cropper.py                          # 用模拟抠图后端跑默认场景
+    python benchmark_cropper.py --backend real --workers 2
+    python benchmark_cropper.py --sizes 0.3,12 --count 10 --save-baseline
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+import multiprocessing
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+# 默认测试场景：(百万像素, 图片数量)
+DEFAULT_SCENARIOS = ((0.3, 40), (2, 20), (12, 6), (40, 2))
+
+# 默认回退阈值：吞吐量下降、峰值内存上升、单阶段 p50 耗时上升超过该比例时视为回退
+DEFAULT_THRESHOLDS = {
+    "images_per_second": 0.10,
+    "peak_rss_mb": 0.20,
+    "stage_p50_ms": 0.25,
+}
+
+HISTORY_NAME = "history.jsonl"
+BASELINE_NAME = "baseline.json"
+
+# 报告文件名与 crop_report.REPORT_NAME 一致，这里不导入以免父进程加载裁切模块
+REPORT_FILE = "裁切运行报告.json"
+
+
+class StubSession:
+    """
+    模拟的抠图会话，用简单的阈值代替模型推理
+
+    按 rembg 会话的 predict 接口返回遮罩：先缩到模型输入尺寸，把非白色像素当作主体，
+    再放大回原图尺寸，耗时规律与真实推理的前后处理接近，但不受模型和硬件波动影响。
+    """
+
+    def __init__(self, delay=0.0, size=(320, 320)):
+        """
+        Args:
+            delay: 每张图片额外等待的秒数，用来模拟模型推理耗时
+            size: 模拟的模型输入尺寸
+        """
+        self.delay = delay
+        self.size = size
+
+    def predict(self, img, *args, **kwargs):
+        small = np.asarray(img.convert("RGB").resize(self.size, Image.BILINEAR))
+        # 三个通道里最暗的值低于 240 的像素当作主体
+        mask = Image.fromarray(((small.min(axis=2) < 240) * 255).astype("uint8"), mode="L")
+        if self.delay:
+            time.sleep(self.delay)
+        return [mask.resize(img.size, Image.LANCZOS)]
+
+
+def scenario_name(megapixels, count):
+    return f"{megapixels:g}MP x{count}"
+
+
+def generate_image(megapixels, seed):
+    """
+    生成一张白底商品图
+
+    先在小图上画出随机形状和阴影，再放大到目标尺寸并加一点噪点，
+    主体大小和位置随机，边缘柔和，接近实际拍摄的白底图。
+
+    Args:
+        megapixels: 目标像素数（百万）
+        seed: 随机种子，相同种子生成相同的图片
+    """
+    rng = random.Random(seed)
+    # 4:3 的横图或竖图
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(megapixels * 1e6 / width)
+    if rng.random() < 0.5:
+        width, height = height, width
+
+    draft_scale = max(1, max(width, height) // 800)
+    draft_size = (max(1, width // draft_scale), max(1, height // draft_scale))
+    draft = Image.new("RGB", draft_size, (255, 255, 255))
+    draw = ImageDraw.Draw(draft)
+    w, h = draft_size
+    cx = rng.uniform(0.3, 0.7) * w
+    cy = rng.uniform(0.3, 0.7) * h
+    rx = rng.uniform(0.1, 0.35) * w
+    ry = rng.uniform(0.1, 0.35) * h
+    # 阴影
+    draw.ellipse((cx - rx, cy + ry * 0.7, cx + rx, cy + ry * 1.1), fill=(215, 215, 215))
+    draft = draft.filter(ImageFilter.GaussianBlur(max(1, w // 100)))
+    draw = ImageDraw.Draw(draft)
+    color = tuple(rng.randint(20, 200) for _ in range(3))
+    if rng.random() < 0.5:
+        draw.rounded_rectangle((cx - rx, cy - ry, cx + rx, cy + ry), radius=int(min(rx, ry) / 3), fill=color)
+    else:
+        draw.ellipse((cx - rx, cy - ry, cx + rx, cy + ry), fill=color)
+    # 几条细节线条，避免主体是纯色块
+    for _ in range(5):
+        x0 = rng.uniform(cx - rx * 0.8, cx + rx * 0.8)
+        y0 = rng.uniform(cy - ry * 0.8, cy + ry * 0.8)
+        x1 = rng.uniform(cx - rx * 0.8, cx + rx * 0.8)
+        y1 = rng.uniform(cy - ry * 0.8, cy + ry * 0.8)
+        draw.line((x0, y0, x1, y1), fill=tuple(min(255, c + 40) for c in color), width=max(1, w // 200))
+
+    image = draft.resize((width, height), Image.BICUBIC)
+    noise = Image.effect_noise((width, height), 6).convert("RGB")
+    return Image.blend(image, noise, 0.02)
+
+
+def prepare_dataset(data_dir, megapixels, count, seed=0):
+    """
+    准备一个场景的数据集，已生成过的直接复用
+
+    Returns:
+        str: 数据集所在文件夹
+    """
+    folder = os.path.join(data_dir, f"{megapixels:g}mp_{count}_{seed}")
+    done_marker = os.path.join(folder, ".complete")
+    if os.path.exists(done_marker):
+        return folder
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+    print(f"生成数据集: {scenario_name(megapixels, count)} -> {folder}")
+    for i in range(count):
+        image = generate_image(megapixels, seed * 100003 + i)
+        image.save(os.path.join(folder, f"product_{i:03d}.jpg"), "JPEG", quality=90)
+    open(done_marker, "w").close()
+    return folder
+
+
+def _clean_outputs(folder):
+    """删除上一次运行留下的结果、缓存和报告，保证每次都是完整处理"""
+    for name in ("处理后图片", ".dora_cache"):
+        shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+    for name in os.listdir(folder):
+        if name.startswith("裁切运行报告"):
+            os.remove(os.path.join(folder, name))
+
+
+def _run_one(config):
+    """在独立子进程中处理一个数据集，峰值内存不受其他场景影响"""
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, script_dir)
+    import image_cropper
+
+    if config["backend"] == "stub":
+        stub = StubSession(config["stub_delay"])
+        # 进程池子进程由 fork 继承替换后的函数；其他启动方式下子进程会重新加载真实模型
+        image_cropper._new_session = lambda *args, **kwargs: stub
+
+    options = dict(config["options"])
+    options.setdefault("logo_path", os.path.join(script_dir, "logo.jpg"))
+    # 生成的图片都是白底，白底快速路径会跳过抠图，默认关闭才能测到抠图后端
+    options.setdefault("white_fast_path", False)
+    image_cropper.process_images(
+        config["folder"],
+        use_cache=False,
+        use_mask_cache=False,
+        write_report=True,
+        **options
+    )
+
+
+def run_scenario(folder, backend, options, stub_delay=0.0, repeat=1):
+    """
+    运行一个场景，重复多次时取吞吐量最高的一次
+
+    Returns:
+        dict: 该场景的结果，运行失败时为 None
+    """
+    best = None
+    for _ in range(repeat):
+        _clean_outputs(folder)
+        config = {"folder": folder, "backend": backend, "options": options, "stub_delay": stub_delay}
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", json.dumps(config)],
+                              stdout=subprocess.DEVNULL)
+        report_path = os.path.join(folder, REPORT_FILE)
+        if proc.returncode != 0 or not os.path.exists(report_path):
+            print(f"运行失败: {folder}（退出码 {proc.returncode}）")
+            return None
+        with open(report_path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+        if best is None or report["images_per_second"] > best["images_per_second"]:
+            best = report
+    _clean_outputs(folder)
+
+    return {
+        "images": best["images"],
+        "failed": best["failed"],
+        "wall_seconds": best["wall_seconds"],
+        "images_per_second": best["images_per_second"],
+        "image_total_p50_ms": best["image_total_p50_ms"],
+        "image_total_p95_ms": best["image_total_p95_ms"],
+        # 并行时为主进程与各处理进程峰值之和，另外分别记录主进程和各处理进程的峰值
+        "peak_rss_mb": best["peak_rss_mb"],
+        "parent_peak_rss_mb": best.get("parent_peak_rss_mb"),
+        "worker_peak_rss_mb": best.get("worker_peak_rss_mb"),
+        "stages": {stage: {"p50_ms": s["p50_ms"], "p95_ms": s["p95_ms"], "mean_ms": s["mean_ms"]}
+                   for stage, s in best["stages"].items()},
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(results, baseline, thresholds):
+    """
+    与基线对比
+
+    Args:
+        results: 本次运行结果，格式同 run_benchmark 的返回值
+        baseline: 基线文件内容
+        thresholds: 回退阈值，见 DEFAULT_THRESHOLDS
+
+    Returns:
+        list: 回退项的说明文字，没有回退时为空
+    """
+    regressions = []
+    if baseline.get("backend") != results.get("backend"):
+        print(f"注意: 基线后端为 {baseline.get('backend')}，本次为 {results.get('backend')}，结果不可直接比较")
+    if baseline.get("options") != results.get("options"):
+        print(f"注意: 基线处理参数为 {baseline.get('options')}，本次为 {results.get('options')}")
+    base_fast_path = baseline.get("options", {}).get("white_fast_path")
+    if base_fast_path != results.get("options", {}).get("white_fast_path"):
+        # 白底快速路径会跳过抠图，开关不同时各阶段耗时没有可比性
+        base_text = "未记录" if base_fast_path is None else base_fast_path
+        print(f"注意: 基线的白底快速路径为 {base_text}，本次为 {results['options'].get('white_fast_path')}，"
+              f"结果不可直接比较")
+    base_scenarios = baseline.get("scenarios", {})
+    for name, current in results["scenarios"].items():
+        base = base_scenarios.get(name)
+        if not base or not current:
+            continue
+        base_ips = base["images_per_second"]
+        if base_ips and current["images_per_second"] < base_ips * (1 - thresholds["images_per_second"]):
+            regressions.append(f"{name}: 吞吐量 {current['images_per_second']:.2f} 张/秒，"
+                               f"基线 {base_ips:.2f} 张/秒")
+        base_rss = base.get("peak_rss_mb")
+        if base_rss and current["peak_rss_mb"] and current["peak_rss_mb"] > base_rss * (1 + thresholds["peak_rss_mb"]):
+            regressions.append(f"{name}: 峰值内存 {current['peak_rss_mb']:.0f} MB，基线 {base_rss:.0f} MB")
+        for stage, stats in current["stages"].items():
+            base_stage = base.get("stages", {}).get(stage)
+            # 太短的阶段计时误差大，不参与比较
+            if not base_stage or base_stage["p50_ms"] < 1:
+                continue
+            if stats["p50_ms"] > base_stage["p50_ms"] * (1 + thresholds["stage_p50_ms"]):
+                regressions.append(f"{name}: {stage} 阶段 p50 {stats['p50_ms']:.1f} ms，"
+                                   f"基线 {base_stage['p50_ms']:.1f} ms")
+    return regressions
+
+
+def print_results(results):
+    stage_names = []
+    for scenario in results["scenarios"].values():
+        for stage in (scenario or {}).get("stages", {}):
+            if stage not in stage_names:
+                stage_names.append(stage)
+    header = f"{'场景':<14}{'张/秒':>8}{'p50 ms':>9}{'总峰值MB':>9}" + "".join(f"{s:>11}" for s in stage_names)
+    print(header)
+    for name, scenario in results["scenarios"].items():
+        if not scenario:
+            print(f"{name:<14}{'失败':>8}")
+            continue
+        peak = scenario["peak_rss_mb"] or 0
+        line = f"{name:<14}{scenario['images_per_second']:>8.2f}{scenario['image_total_p50_ms']:>9.0f}{peak:>9.0f}"
+        for stage in stage_names:
+            stats = scenario["stages"].get(stage)
+            line += f"{stats['p50_ms']:>11.1f}" if stats else f"{'-':>11}"
+        print(line)
+
+
+def run_benchmark(scenarios=DEFAULT_SCENARIOS, backend="stub", options=None, data_dir=None, results_dir="benchmarks",
+                  repeat=1, stub_delay=0.0, seed=0, save_baseline=False, thresholds=None):
+    """
+    运行全部场景，追加历史记录并与基线对比
+
+    Args:
+        scenarios: [(百万像素, 图片数量)]
+        backend: stub 为模拟抠图，real 为真实的 rembg 模型
+        options: 传给 process_images 的参数，如 workers、batch_size、inference_max_side；
+            white_fast_path 默认为 False，并记入结果，与基线不一致时会提示
+        data_dir: 数据集保存目录，默认在系统临时目录下
+        results_dir: 历史文件和基线文件的保存目录
+        repeat: 每个场景运行次数，取最快的一次
+        stub_delay: 模拟抠图时每张图片额外等待的秒数
+        seed: 数据集随机种子
+        save_baseline: 是否把本次结果保存为新基线
+        thresholds: 回退阈值，默认为 DEFAULT_THRESHOLDS
+
+    Returns:
+        tuple: (本次结果, 回退项列表)
+    """
+    options = dict(options or {})
+    options.setdefault("white_fast_path", False)
+    thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+    data_dir = data_dir or os.path.join(tempfile.gettempdir(), "dora_benchmark")
+    os.makedirs(results_dir, exist_ok=True)
+
+    if backend == "stub" and options.get("workers", 1) != 1 and multiprocessing.get_start_method() != "fork":
+        print("注意: 当前平台的进程池子进程不会使用模拟抠图，改为单进程运行")
+        options["workers"] = 1
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": _git_commit(),
+        "backend": backend,
+        "stub_delay": stub_delay if backend == "stub" else None,
+        "options": options,
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "scenarios": {},
+    }
+    for megapixels, count in scenarios:
+        folder = prepare_dataset(data_dir, megapixels, count, seed)
+        name = scenario_name(megapixels, count)
+        print(f"运行场景: {name}")
+        results["scenarios"][name] = run_scenario(folder, backend, options, stub_delay, repeat)
+
+    print_results(results)
+
+    with open(os.path.join(results_dir, HISTORY_NAME), "a", encoding="utf-8") as f:
+        f.write(json.dumps(results, ensure_ascii=False) + "\n")
+
+    regressions = []
+    baseline_path = os.path.join(results_dir, BASELINE_NAME)
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, thresholds)
+        if regressions:
+            print("性能回退:")
+            for line in regressions:
+                print(f"  {line}")
+        else:
+            print(f"与基线 ({baseline.get('timestamp')}, {baseline.get('commit')}) 相比没有回退")
+    if save_baseline:
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"已保存基线: {baseline_path}")
+    return results, regressions
+
+
+def _parse_scenarios(sizes, count):
+    if not sizes:
+        if count:
+            return [(mp, count) for mp, _ in DEFAULT_SCENARIOS]
+        return list(DEFAULT_SCENARIOS)
+    scenarios = []
+    for size in sizes.split(","):
+        mp = float(size)
+        default_count = dict(DEFAULT_SCENARIOS).get(mp, 5)
+        scenarios.append((mp, count or default_count))
+    return scenarios
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片裁切性能基准测试")
+    parser.add_argument("--sizes", help="逗号分隔的图片尺寸（百万像素），默认 0.3,2,12,40")
+    parser.add_argument("--count", type=int, help="每个场景的图片数量，默认按尺寸自动选择")
+    parser.add_argument("--backend", choices=("stub", "real"), default="stub", help="抠图后端，默认为模拟抠图")
+    parser.add_argument("--stub-delay", type=float, default=0.0, help="模拟抠图时每张图片额外等待的秒数")
+    parser.add_argument("--model", help="真实后端使用的 rembg 模型")
+    parser.add_argument("--workers", type=int, default=1, help="并行处理的进程数")
+    parser.add_argument("--batch-size", type=int, help="每批推理的图片数")
+    parser.add_argument("--inference-max-side", type=int, help="缩小推理模式的推理尺寸")
+    parser.add_argument("--no-watermark", action="store_true", help="不加水印")
+    parser.add_argument("--white-fast-path", action="store_true",
+                        help="启用白底快速路径（生成的图片都是白底，启用后不会运行抠图）")
+    parser.add_argument("--repeat", type=int, default=1, help="每个场景运行次数，取最快的一次")
+    parser.add_argument("--seed", type=int, default=0, help="数据集随机种子")
+    parser.add_argument("--data-dir", help="数据集保存目录")
+    parser.add_argument("--results-dir", default="benchmarks", help="历史文件和基线文件的保存目录")
+    parser.add_argument("--save-baseline", action="store_true", help="把本次结果保存为基线")
+    parser.add_argument("--threshold", type=float, help="吞吐量回退阈值，默认 0.10")
+    parser.add_argument("--memory-threshold", type=float, help="峰值内存回退阈值，默认 0.20")
+    parser.add_argument("--stage-threshold", type=float, help="单阶段 p50 耗时回退阈值，默认 0.25")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        _run_one(json.loads(args.run_one))
+        return 0
+
+    options = {"workers": args.workers}
+    if args.model:
+        options["model_name"] = args.model
+    if args.batch_size:
+        options["batch_size"] = args.batch_size
+    if args.inference_max_side:
+        options["inference_max_side"] = args.inference_max_side
+    if args.no_watermark:
+        options["logo_path"] = None
+    options["white_fast_path"] = args.white_fast_path
+
+    thresholds = {}
+    if args.threshold is not None:
+        thresholds["images_per_second"] = args.threshold
+    if args.memory_threshold is not None:
+        thresholds["peak_rss_mb"] = args.memory_threshold
+    if args.stage_threshold is not None:
+        thresholds["stage_p50_ms"] = args.stage_threshold
+
+    _, regressions = run_benchmark(
+        _parse_scenarios(args.sizes, args.count),
+        backend=args.backend,
+        options=options,
+        data_dir=args.data_dir,
+        results_dir=args.results_dir,
+        repeat=args.repeat,
+        stub_delay=args.stub_delay,
+        seed=args.seed,
+        save_baseline=args.save_baseline,
+        thresholds=thresholds,
+    )
+    # 有回退时返回非零退出码，便于在脚本里判断
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import os
+import json
+import hashlib
+
+# 缓存目录名，放在被处理的文件夹根目录下
+CACHE_DIR_NAME = ".dora_cache"
+
+
+def file_hash(path):
+    """计算文件内容的哈希值"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def params_key(params):
+    """把处理参数转换成稳定的字符串，用作缓存键的一部分"""
+    data = json.dumps(params, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _stat_key(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+class ResultCache:
+    """
+    裁切结果缓存
+
+    按输出文件记录对应输入图片的内容哈希和处理参数。再次运行时，输入内容、
+    处理参数都没变且输出文件还在的图片可以直接跳过。输入文件的大小和修改时间
+    没变时直接沿用记录的哈希，不需要重新读文件。
+    """
+
+    def __init__(self, folder):
+        """
+        Args:
+            folder: 被处理的文件夹，缓存文件保存在其下的 CACHE_DIR_NAME 目录
+        """
+        self.base_dir = os.path.abspath(folder)
+        self.cache_path = os.path.join(self.base_dir, CACHE_DIR_NAME, 'results.json')
+        self.entries = {}
+        self._hashes = {}
+        if os.path.exists(self.cache_path):
+            try:
+                with open(self.cache_path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Warning: 结果缓存已损坏，将重新处理所有图片: {e}")
+                self.entries = {}
+
+    def _key(self, output_path):
+        return os.path.relpath(os.path.abspath(output_path), self.base_dir)
+
+    def _source_hash(self, input_path, entry=None):
+        """获取输入文件的哈希，大小和修改时间与记录一致时直接使用记录值"""
+        stat = _stat_key(input_path)
+        if entry and entry.get('source_stat') == stat:
+            return entry['source_hash']
+        cached = self._hashes.get(input_path)
+        if cached and cached[0] == stat:
+            return cached[1]
+        digest = file_hash(input_path)
+        self._hashes[input_path] = (stat, digest)
+        return digest
+
+    def is_fresh(self, input_path, output_path, key):
+        """
+        判断图片是否已用相同参数处理过且结果仍然有效
+
+        Args:
+            input_path: 输入图片路径
+            output_path: 输出图片路径
+            key: 处理参数的键，见 params_key
+        """
+        entry = self.entries.get(self._key(output_path))
+        if not entry or entry.get('params') != key:
+            return False
+        try:
+            if _stat_key(output_path) != entry.get('output_stat'):
+                return False
+            return self._source_hash(input_path, entry) == entry.get('source_hash')
+        except OSError:
+            return False
+
+    def record(self, input_path, output_path, key):
+        """记录一张处理成功的图片"""
+        if os.path.abspath(input_path) == os.path.abspath(output_path):
+            # 覆盖原图时输入就是输出，按处理后的内容记录，下次运行会被识别为已处理
+            self._hashes.pop(input_path, None)
+        source_hash = self._source_hash(input_path)
+        self.entries[self._key(output_path)] = {
+            'source_stat': _stat_key(input_path),
+            'source_hash': source_hash,
+            'params': key,
+            'output_stat': _stat_key(output_path),
+        }
+
+    def save(self):
+        """写入缓存文件，先写临时文件再替换，避免中途退出留下损坏的缓存"""
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.cache_path)
+
+
+class MaskCache:
+    """
+    alpha 遮罩缓存
+
+    抠图模型算出的遮罩按 输入内容哈希 + 模型名称（缩小推理时再加上推理尺寸）
+    压缩保存成单通道 PNG。
+    只改画布尺寸、缩放规则或水印后重新处理时，可以跳过最耗时的抠图推理。
+    读取时会刷新文件的修改时间，超出容量时按修改时间淘汰最久未用的遮罩。
+    """
+
+    def __init__(self, cache_dir, max_bytes=None, max_entries=None):
+        """
+        Args:
+            cache_dir: 遮罩保存目录
+            max_bytes: 缓存总大小上限（字节），None 为不限制
+            max_entries: 缓存遮罩数量上限，None 为不限制
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+
+    def _path(self, source_hash, variant):
+        return os.path.join(self.cache_dir, f"{source_hash}_{variant}.png")
+
+    def get(self, source_hash, variant):
+        """读取遮罩，没有缓存时返回 None"""
+        from PIL import Image
+
+        path = self._path(source_hash, variant)
+        try:
+            with Image.open(path) as mask:
+                mask.load()
+            # 刷新修改时间，淘汰时按最近使用排序
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return mask
+
+    def put(self, source_hash, variant, mask):
+        """保存遮罩，先写临时文件再替换，多个进程同时写同一遮罩也不会损坏"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(source_hash, variant)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        mask.save(tmp_path, 'PNG', compress_level=6)
+        os.replace(tmp_path, path)
+
+    def evict(self):
+        """
+        按最近使用时间淘汰超出容量的遮罩
+
+        Returns:
+            int: 删除的遮罩数量
+        """
+        if not os.path.isdir(self.cache_dir) or (self.max_bytes is None and self.max_entries is None):
+            return 0
+        entries = []
+        total_bytes = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith('.png'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total_bytes += st.st_size
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            over_bytes = self.max_bytes is not None and total_bytes > self.max_bytes
+            over_entries = self.max_entries is not None and len(entries) - removed > self.max_entries
+            if not over_bytes and not over_entries:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_bytes -= size
+            removed += 1
+        return removed
@@ -0,0 +1,271 @@
+import time
+import threading
+from collections import deque
+
+# 计算处理速度时参考最近完成的图片数
+RATE_WINDOW = 20
+
+
+class JobControl:
+    """
+    运行控制：取消、暂停、继续
+
+    处理流程在开始每张图片前调用 checkpoint()，暂停时在这里等待，取消后不再开始新图片。
+    正在处理的图片会处理完，已完成的图片照常保存，下次运行可以从运行日志接着处理。
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        # 未暂停时为 set 状态
+        self._running = threading.Event()
+        self._running.set()
+        self._lock = threading.Lock()
+        self._paused_at = None
+        self._paused_seconds = 0.0
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def cancel(self):
+        """取消运行，暂停中也会立即结束等待"""
+        self._cancelled.set()
+        self._running.set()
+
+    def pause(self):
+        """暂停，正在处理的图片处理完后不再开始新图片"""
+        with self._lock:
+            if self._paused_at is None and not self.cancelled:
+                self._paused_at = time.monotonic()
+                self._running.clear()
+
+    def resume(self):
+        """从暂停处继续"""
+        with self._lock:
+            if self._paused_at is not None:
+                self._paused_seconds += time.monotonic() - self._paused_at
+                self._paused_at = None
+            self._running.set()
+
+    def paused_seconds(self):
+        """累计暂停的秒数，计算处理速度时扣除"""
+        with self._lock:
+            if self._paused_at is not None:
+                return self._paused_seconds + time.monotonic() - self._paused_at
+            return self._paused_seconds
+
+    def checkpoint(self):
+        """
+        开始下一张图片前调用，暂停时等待继续
+
+        Returns:
+            bool: 可以继续处理时为 True，已取消时为 False
+        """
+        self._running.wait()
+        return not self.cancelled
+
+
+class ProgressTracker:
+    """
+    按处理结果生成结构化的进度事件：数量、字节数、当前文件、最近的处理速度和预计剩余时间
+    """
+
+    def __init__(self, total, total_bytes, control=None, window=RATE_WINDOW):
+        """
+        Args:
+            total: 需要处理的图片数
+            total_bytes: 需要处理的图片文件总大小（字节）
+            control: JobControl，暂停过的时间不计入处理速度和已用时间
+            window: 计算处理速度时参考最近完成的图片数
+        """
+        self.total = total
+        self.total_bytes = total_bytes
+        self.control = control
+        self.done = 0
+        self.failed = 0
+        self.bytes_done = 0
+        self._start = time.monotonic()
+        self._finished_at = deque([self._start], maxlen=window + 1)
+        self._paused_seen = 0.0
+
+    def _paused_seconds(self):
+        return self.control.paused_seconds() if self.control is not None else 0.0
+
+    def update(self, input_path, size, error=None):
+        """
+        记录一张图片的结果
+
+        Args:
+            input_path: 输入图片路径
+            size: 输入文件大小（字节）
+            error: 错误信息，成功时为 None
+
+        Returns:
+            dict: 进度事件，见 event
+        """
+        if error is None:
+            self.done += 1
+        else:
+            self.failed += 1
+        self.bytes_done += size
+        now = time.monotonic()
+        paused = self._paused_seconds()
+        if paused != self._paused_seen:
+            # 暂停过之后从现在重新统计速度，暂停前后的速度不混在一起
+            self._paused_seen = paused
+            self._finished_at.clear()
+        self._finished_at.append(now)
+        return self.event(input_path, error)
+
+    def images_per_second(self):
+        """最近 window 张图片的平均处理速度"""
+        finished = len(self._finished_at) - 1
+        elapsed = self._finished_at[-1] - self._finished_at[0]
+        if finished <= 0 or elapsed <= 0:
+            return 0.0
+        return finished / elapsed
+
+    def event(self, input_path=None, error=None):
+        """
+        Returns:
+            dict: {"type": "progress", "done": 成功数, "failed": 失败数, "total": 总数,
+                   "bytes_done": 已处理字节数, "total_bytes": 总字节数, "file": 刚完成的文件,
+                   "error": 该文件的错误信息, "images_per_second": 最近的处理速度,
+                   "eta_seconds": 预计剩余秒数（还无法估计时为 None）, "elapsed_seconds": 已用秒数}
+        """
+        rate = self.images_per_second()
+        remaining = self.total - self.done - self.failed
+        return {
+            "type": "progress",
+            "done": self.done,
+            "failed": self.failed,
+            "total": self.total,
+            "bytes_done": self.bytes_done,
+            "total_bytes": self.total_bytes,
+            "file": input_path,
+            "error": error,
+            "images_per_second": rate,
+            "eta_seconds": remaining / rate if rate > 0 else None,
+            "elapsed_seconds": time.monotonic() - self._start - self._paused_seconds(),
+        }
+
+
+def format_eta(seconds):
+    """把剩余秒数格式化为 "1小时05分" "3分20秒" 这样的文字"""
+    if seconds is None:
+        return "估算中"
+    seconds = int(seconds + 0.5)
+    if seconds >= 3600:
+        return f"{seconds // 3600}小时{seconds % 3600 // 60:02d}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60:02d}秒"
+    return f"{seconds}秒"
+
+
+class CropJob(JobControl):
+    """
+    可取消、可暂停的裁切任务
+
+    在后台线程中运行 process_folder，通过 on_event 发出结构化事件：
+    {"type": "progress", ...}（见 ProgressTracker.event）、
+    {"type": "message", "text": ...}（原有的俏皮进度消息，playful 为 False 时不发送）、
+    {"type": "state", "state": "running" / "paused" / "cancelling"}、
+    {"type": "finished", "state": "finished" / "cancelled" / "failed", "result": 处理结果}。
+    on_event 在处理线程中调用，界面需要自己切回主线程。
+    """
+
+    def __init__(self, input_folder, on_event=None, playful=True, overwrite_original=False, **options):
+        """
+        Args:
+            input_folder: 输入文件夹路径
+            on_event: 事件回调，格式为 on_event(event)
+            playful: 是否发送原有的俏皮进度消息
+            overwrite_original: 是否覆盖原图
+            **options: 透传给 process_images 的处理参数，如 workers、model_name
+        """
+        super().__init__()
+        self.input_folder = input_folder
+        self.on_event = on_event
+        self.playful = playful
+        self.overwrite_original = overwrite_original
+        self.options = options
+        self.state = "pending"
+        self.result = None
+        self._thread = None
+
+    def _emit(self, event):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(event)
+        except Exception as e:
+            print(f"Warning: 裁切事件回调出错: {e}")
+
+    def _message(self, text):
+        self._emit({"type": "message", "text": text})
+
+    def start(self):
+        """在后台线程中开始运行"""
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def run(self):
+        """
+        在当前线程中运行
+
+        Returns:
+            处理结果，与 process_folder 相同
+        """
+        from image_cropper import process_folder
+
+        self.state = "running"
+        self._emit({"type": "state", "state": self.state})
+        try:
+            self.result = process_folder(self.input_folder, self.overwrite_original,
+                                         callback=self._message if self.playful else None,
+                                         control=self, progress=self._emit, **self.options)
+        except Exception as e:
+            self.result = str(e)
+        if not isinstance(self.result, int):
+            self.state = "failed"
+        elif self.cancelled:
+            self.state = "cancelled"
+        else:
+            self.state = "finished"
+        self._emit({"type": "finished", "state": self.state, "result": self.result})
+        return self.result
+
+    def wait(self, timeout=None):
+        """
+        等待后台运行结束
+
+        Returns:
+            bool: 已结束时为 True
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def cancel(self):
+        super().cancel()
+        if self.state in ("running", "paused"):
+            self.state = "cancelling"
+            self._emit({"type": "state", "state": self.state})
+
+    def pause(self):
+        super().pause()
+        if self.state == "running" and self.paused:
+            self.state = "paused"
+            self._emit({"type": "state", "state": self.state})
+
+    def resume(self):
+        super().resume()
+        if self.state == "paused":
+            self.state = "running"
+            self._emit({"type": "state", "state": self.state})
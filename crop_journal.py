@@ -0,0 +1,206 @@
+import os
+import json
+import time
+
+from crop_cache import CACHE_DIR_NAME, _stat_key, file_hash
+
+# 运行日志文件名，保存在缓存目录下
+JOURNAL_NAME = "journal.jsonl"
+
+# 编码好但还没替换到输出路径的临时文件后缀
+STAGING_SUFFIX = ".tmp"
+
+
+def staging_path(output_path):
+    """输出文件的临时路径，与输出文件在同一目录，替换时是原子操作"""
+    return f"{output_path}.{os.getpid()}{STAGING_SUFFIX}"
+
+
+class CropJournal:
+    """
+    裁切运行日志，中途退出（断电、关闭窗口）后下次运行可以从断点继续
+
+    日志是只追加的 JSON Lines 文件，第一行记录本次运行的参数键，之后每张图片按顺序记录：
+    committing（输出已写入临时文件并落盘，记下各输出的内容哈希）、done（输出已替换到位，
+    记下输入和各输出的大小、修改时间）、failed（处理出错）。所有图片都已处理完或已失败后追加
+    finished，下次运行重新开始新的日志。
+
+    输出文件先写到 staging_path 再用 os.replace 替换，覆盖原图时原图要么完好，要么已经是
+    完整的处理结果。committing 之后、done 之前退出时，按输出文件的哈希判断替换是否已完成，
+    覆盖原图模式下不会把已处理过的图片再裁一遍。
+    """
+
+    def __init__(self, folder, run_key, resume=True):
+        """
+        Args:
+            folder: 被处理的文件夹，日志保存在其下的 CACHE_DIR_NAME 目录
+            run_key: 本次运行的参数键，参数不同的运行不会接着上次的日志继续
+            resume: 是否接着上次未完成的日志继续，False 时总是重新开始
+        """
+        self.base_dir = os.path.abspath(folder)
+        self.path = os.path.join(self.base_dir, CACHE_DIR_NAME, JOURNAL_NAME)
+        self.run_key = run_key
+        # 上次运行中每张图片最后的记录，{相对路径: 记录}
+        self.entries = {}
+        if resume:
+            self.entries = self._load()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.entries:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        else:
+            self._file = open(self.path, 'w', encoding='utf-8')
+            self._append({'run': run_key, 'started_at': time.strftime('%Y-%m-%d %H:%M:%S')}, sync=True)
+
+    def _load(self):
+        """读取上次未完成的同参数运行的记录，没有时返回空字典"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return {}
+        entries = {}
+        header = None
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 断电时最后一行可能只写了一半
+                continue
+            if header is None:
+                header = record
+                if record.get('run') != self.run_key:
+                    return {}
+            elif record.get('finished'):
+                return {}
+            elif 'file' in record:
+                entries[record['file']] = record
+        return entries
+
+    def _key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.base_dir)
+
+    def _append(self, record, sync=False):
+        self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def is_done(self, input_path, output_paths):
+        """
+        判断图片在上次运行中是否已处理完
+
+        Args:
+            input_path: 输入图片路径
+            output_paths: 该图片的各输出路径
+        """
+        entry = self.entries.get(self._key(input_path))
+        if entry is None:
+            return False
+        try:
+            if entry['state'] == 'done':
+                # 输出被删除或改动过的图片重新处理
+                outputs = entry.get('outputs', {})
+                return (_stat_key(input_path) == entry['stat']
+                        and all(_stat_key(path) == outputs.get(self._key(path)) for path in output_paths))
+            if entry['state'] == 'committing':
+                # 已落盘但不确定是否替换完成，所有输出都是本次的结果才算处理完
+                outputs = entry['outputs']
+                if any(file_hash(path) != outputs.get(self._key(path)) for path in output_paths):
+                    return False
+                self._done(input_path, output_paths)
+                return True
+        except OSError:
+            return False
+        return False
+
+    def pending(self, tasks):
+        """
+        过滤掉上次运行中已处理完的图片，并清理上次留下的临时文件
+
+        Args:
+            tasks: [(输入路径, 输出路径元组)]
+
+        Returns:
+            tuple: (仍需处理的任务列表, 已处理完的任务列表)
+        """
+        pending = []
+        resumed = []
+        for task in tasks:
+            if self.entries and self.is_done(*task):
+                resumed.append(task)
+            else:
+                pending.append(task)
+        _remove_stale_staging([path for _, output_paths in pending for path in output_paths])
+        return pending, resumed
+
+    def commit(self, input_path, staged):
+        """
+        把一张图片编码好的临时文件替换到输出路径
+
+        Args:
+            input_path: 输入图片路径
+            staged: [(临时文件路径, 输出路径, 内容哈希)]，临时文件需已落盘
+        """
+        self._append({
+            'file': self._key(input_path),
+            'state': 'committing',
+            'outputs': {self._key(path): digest for _, path, digest in staged},
+        }, sync=True)
+        for tmp_path, path, _ in staged:
+            os.replace(tmp_path, path)
+        self._done(input_path, [path for _, path, _ in staged])
+
+    def _done(self, input_path, output_paths):
+        self._append({
+            'file': self._key(input_path),
+            'state': 'done',
+            'stat': _stat_key(input_path),
+            'outputs': {self._key(path): _stat_key(path) for path in output_paths},
+        })
+
+    def fail(self, input_path, error):
+        """记录一张处理失败的图片，下次运行会重新处理"""
+        self._append({'file': self._key(input_path), 'state': 'failed', 'error': error})
+
+    def close(self, finished=False):
+        """
+        关闭日志
+
+        Args:
+            finished: 所有图片都已处理完或已失败，下次运行不再从这份日志继续
+        """
+        if finished:
+            self._append({'finished': True}, sync=True)
+        self._file.close()
+
+
+def discard_staged(staged):
+    """删除没有提交的临时文件"""
+    for tmp_path, _, _ in staged:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def _remove_stale_staging(output_paths):
+    """删除中途退出时留下的、这些输出路径对应的临时文件"""
+    by_dir = {}
+    for path in output_paths:
+        directory, name = os.path.split(os.path.abspath(path))
+        by_dir.setdefault(directory, set()).add(name)
+    for directory, names in by_dir.items():
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if not entry.name.endswith(STAGING_SUFFIX):
+                        continue
+                    # 临时文件名为 输出文件名.进程号.tmp
+                    name = entry.name[:-len(STAGING_SUFFIX)].rpartition('.')[0]
+                    if name in names:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+        except OSError:
+            continue
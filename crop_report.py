@@ -0,0 +1,280 @@
+import os
+import sys
+import csv
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+# 单张图片的处理阶段，报告里按这个顺序输出
+STAGES = ('read', 'decode', 'white_check', 'inference', 'mask_store', 'composite', 'trim', 'resize', 'watermark', 'encode')
+
+# 报告文件名，保存在被处理文件夹的根目录，和"处理后图片"放在一起
+REPORT_NAME = "裁切运行报告"
+
+# 全局的阶段耗时订阅者，每个阶段耗时都会以 hook(event) 的形式通知
+_stage_hooks = []
+_hooks_lock = threading.Lock()
+
+
+def add_stage_hook(hook):
+    """
+    订阅阶段耗时事件
+
+    Args:
+        hook: 回调函数，格式为 hook(event)，event 为字典：
+              {"file": 输入路径, "stage": 阶段名, "seconds": 耗时（秒）}
+    """
+    with _hooks_lock:
+        _stage_hooks.append(hook)
+
+
+def remove_stage_hook(hook):
+    """取消订阅阶段耗时事件"""
+    with _hooks_lock:
+        if hook in _stage_hooks:
+            _stage_hooks.remove(hook)
+
+
+@contextmanager
+def timed(timings, stage):
+    """统计代码块耗时并累加到 timings[stage]，timings 为 None 时不统计"""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def peak_rss_mb(include_children=True):
+    """
+    当前进程的峰值内存占用（MB）
+
+    Args:
+        include_children: 是否也考虑已结束的子进程中峰值最大的一个（Windows 下不支持）
+    """
+    try:
+        import resource
+    except ImportError:
+        return _windows_peak_rss_mb()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if include_children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # Linux 下单位为 KB，macOS 下为字节
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
+
+
+def current_rss_mb():
+    """当前进程此刻的内存占用（MB），无法获取时返回 None"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    counters = _windows_memory_counters()
+    if counters is not None:
+        return counters.WorkingSetSize / 1024 / 1024
+    # 其他平台退回峰值内存，估算会偏保守
+    return peak_rss_mb()
+
+
+def _windows_peak_rss_mb():
+    counters = _windows_memory_counters()
+    if counters is None:
+        return None
+    return counters.PeakWorkingSetSize / 1024 / 1024
+
+
+def _windows_memory_counters():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [
+            ('cb', wintypes.DWORD),
+            ('PageFaultCount', wintypes.DWORD),
+            ('PeakWorkingSetSize', ctypes.c_size_t),
+            ('WorkingSetSize', ctypes.c_size_t),
+            ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+            ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+            ('PagefileUsage', ctypes.c_size_t),
+            ('PeakPagefileUsage', ctypes.c_size_t),
+        ]
+
+    try:
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return None
+        return counters
+    except Exception:
+        return None
+
+
+def percentile(values, q):
+    """线性插值计算百分位数，values 需已排序"""
+    if not values:
+        return 0.0
+    pos = (len(values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (pos - low)
+
+
+class RunReport:
+    """一次裁切运行的耗时统计：收集每张图片各阶段的耗时和计数，生成 JSON/CSV 报告"""
+
+    def __init__(self, hooks=None):
+        """
+        Args:
+            hooks: 只对本次运行生效的阶段耗时订阅者列表，格式同 add_stage_hook
+        """
+        self.hooks = list(hooks or [])
+        self.images = []
+        self.counters = {}
+        # 各输出格式的编码耗时，{格式: [总秒数, 次数]}
+        self.encode_formats = {}
+        self.peak_rss_mb = None
+        # 并行处理时主进程和各处理进程各自的峰值内存，{进程号: MB}
+        self.parent_peak_rss_mb = None
+        self.worker_peak_rss_mb = {}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.wall_seconds = None
+
+    def count(self, name, n=1):
+        """累加一个计数器"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, input_path, error, stats=None):
+        """
+        记录一张图片的处理结果，并把各阶段耗时通知给订阅者
+
+        Args:
+            input_path: 输入图片路径
+            error: 错误信息，成功时为 None
+            stats: 处理时收集的统计，可包含 timings（{阶段名: 秒}）、
+                   counters（{计数器名: 次数}）、encode_formats（{输出格式: 编码秒数}）
+                   和 peak_rss_mb、pid（处理进程的峰值内存和进程号）
+        """
+        stats = stats or {}
+        timings = stats.get('timings') or {}
+        self.images.append({'file': input_path, 'error': error, 'timings': dict(timings)})
+        for name, n in (stats.get('counters') or {}).items():
+            self.count(name, n)
+        for fmt, seconds in (stats.get('encode_formats') or {}).items():
+            total = self.encode_formats.setdefault(fmt, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+        if stats.get('peak_rss_mb') is not None:
+            pid = stats.get('pid')
+            self.worker_peak_rss_mb[pid] = max(self.worker_peak_rss_mb.get(pid, 0), stats['peak_rss_mb'])
+
+        with _hooks_lock:
+            hooks = self.hooks + _stage_hooks
+        for stage, seconds in timings.items():
+            event = {'file': input_path, 'stage': stage, 'seconds': seconds}
+            for hook in hooks:
+                try:
+                    hook(event)
+                except Exception as e:
+                    print(f"Warning: 阶段耗时回调出错: {e}")
+
+    def encode_summary(self):
+        """各输出格式的平均编码耗时，用于进度显示，如 "PNG 45ms / JPEG 12ms" """
+        return " / ".join(f"{fmt} {total / count * 1000:.0f}ms"
+                          for fmt, (total, count) in sorted(self.encode_formats.items()) if count)
+
+    def finish(self):
+        """
+        结束计时并汇总峰值内存
+
+        并行处理时 peak_rss_mb 为主进程和各处理进程峰值之和。各进程的峰值不一定同时出现，
+        这是偏保守的上限，便于和单进程运行比较总内存占用。
+        """
+        self.wall_seconds = time.perf_counter() - self._start
+        if self.worker_peak_rss_mb:
+            self.parent_peak_rss_mb = peak_rss_mb(include_children=False)
+            self.peak_rss_mb = (self.parent_peak_rss_mb or 0) + sum(self.worker_peak_rss_mb.values())
+        else:
+            self.peak_rss_mb = peak_rss_mb()
+
+    def summary(self):
+        """生成汇总统计：各阶段耗时的百分位数、吞吐量、峰值内存等"""
+        wall = self.wall_seconds if self.wall_seconds is not None else time.perf_counter() - self._start
+        succeeded = [image for image in self.images if image['error'] is None]
+        stages = {}
+        extra_stages = sorted({stage for image in self.images for stage in image['timings']} - set(STAGES))
+        for stage in list(STAGES) + extra_stages:
+            values = sorted(image['timings'][stage] for image in self.images if stage in image['timings'])
+            if not values:
+                continue
+            stages[stage] = {
+                'count': len(values),
+                'total_s': sum(values),
+                'mean_ms': sum(values) / len(values) * 1000,
+                'p50_ms': percentile(values, 50) * 1000,
+                'p90_ms': percentile(values, 90) * 1000,
+                'p95_ms': percentile(values, 95) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': values[-1] * 1000,
+            }
+        totals = sorted(sum(image['timings'].values()) for image in succeeded)
+        return {
+            'started_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)),
+            'wall_seconds': wall,
+            'images': len(self.images),
+            'succeeded': len(succeeded),
+            'failed': len(self.images) - len(succeeded),
+            'images_per_second': len(succeeded) / wall if wall > 0 else 0.0,
+            'image_total_p50_ms': percentile(totals, 50) * 1000,
+            'image_total_p95_ms': percentile(totals, 95) * 1000,
+            'peak_rss_mb': self.peak_rss_mb,
+            'parent_peak_rss_mb': self.parent_peak_rss_mb,
+            'worker_peak_rss_mb': sorted(self.worker_peak_rss_mb.values(), reverse=True),
+            'counters': dict(self.counters),
+            'encode_formats': {fmt: {'count': count, 'total_s': total, 'mean_ms': total / count * 1000}
+                               for fmt, (total, count) in self.encode_formats.items() if count},
+            'stages': stages,
+        }
+
+    def write(self, folder, options=None):
+        """
+        把报告写到指定文件夹：JSON 为汇总统计，CSV 为每张图片各阶段耗时（毫秒）
+
+        Args:
+            folder: 报告保存目录
+            options: 本次运行的参数，原样写进 JSON 便于对比
+
+        Returns:
+            tuple: (JSON 路径, CSV 路径)
+        """
+        json_path = os.path.join(folder, REPORT_NAME + '.json')
+        csv_path = os.path.join(folder, REPORT_NAME + '.csv')
+        data = self.summary()
+        if options is not None:
+            data['options'] = options
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+
+        stages = list(data['stages'])
+        with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['文件', '状态'] + [f'{stage}_ms' for stage in stages] + ['total_ms'])
+            for image in self.images:
+                timings = image['timings']
+                writer.writerow(
+                    [os.path.basename(image['file']), image['error'] or 'ok']
+                    + [f"{timings[stage] * 1000:.1f}" if stage in timings else '' for stage in stages]
+                    + [f"{sum(timings.values()) * 1000:.1f}"]
+                )
+        return json_path, csv_path
@@ -0,0 +1,299 @@
+import os
+import time
+import sqlite3
+
+from crop_cache import CACHE_DIR_NAME, file_hash
+
+# 目录索引数据库文件名，保存在被索引文件夹的缓存目录下
+CATALOG_NAME = "catalog.sqlite3"
+
+# 保留最近多少次刷新的变化记录
+KEEP_RUNS = 10
+
+# 修改时间距现在不到这么多纳秒的目录不记录修改时间，下次刷新仍然遍历。
+# 有的文件系统时间精度很粗，同一时刻内的后续改动不会再改变目录的修改时间
+MTIME_SLACK_NS = 2_000_000_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    top TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS files_parent ON files (parent);
+CREATE INDEX IF NOT EXISTS files_top ON files (top);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    added INTEGER DEFAULT 0,
+    modified INTEGER DEFAULT 0,
+    removed INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS changes (
+    run_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    change TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS changes_run ON changes (run_id);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER
+);
+"""
+
+
+def catalog_path(root):
+    """文件夹对应的索引数据库路径"""
+    return os.path.join(root, CACHE_DIR_NAME, CATALOG_NAME)
+
+
+def _split(rel_path):
+    """相对路径拆成 (上级目录, 第一级文件夹, 小写扩展名)，路径统一用 / 分隔"""
+    parent = rel_path.rpartition("/")[0]
+    top = parent.split("/", 1)[0] if parent else ""
+    return parent, top, os.path.splitext(rel_path)[1].lower()
+
+
+def _in_scope(parent, scope, recursive):
+    """目录是否在遍历范围内"""
+    for directory in scope:
+        if parent == directory:
+            return True
+        if recursive and (directory == "" or parent.startswith(directory + "/")):
+            return True
+    return False
+
+
+class FileCatalog:
+    """
+    文件夹的本地 SQLite 索引
+
+    记录每个文件的相对路径、大小、修改时间、第一级文件夹（产品或分组文件夹）、扩展名和
+    可选的内容哈希。refresh 先比较每个目录的修改时间，只重新列出有文件增删、改名的目录，
+    按 大小 + 修改时间 找出新增、修改和删除的文件，只更新变化的记录；统计直接查询数据库。
+    分类移动文件后用 record_moves 同步路径，不需要重新遍历。
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root: 被索引的文件夹，数据库保存在其下的 CACHE_DIR_NAME 目录
+        """
+        self.root = os.path.abspath(root)
+        self.path = catalog_path(self.root)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.executescript(_SCHEMA)
+
+    @classmethod
+    def open_existing(cls, root):
+        """打开已建立的索引，还没有索引时返回 None"""
+        if not os.path.exists(catalog_path(root)):
+            return None
+        return cls(root)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _rel(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def is_empty(self):
+        """是否还没有完成过刷新"""
+        return self.conn.execute("SELECT 1 FROM runs WHERE finished_at IS NOT NULL LIMIT 1").fetchone() is None
+
+    def refresh(self, hash_files=False, dirs=None, recursive=True, force=False):
+        """
+        遍历文件夹，把变化同步到索引
+
+        目录的修改时间与上次记录的相同时，目录里没有新增、删除或改名的文件，不再列出目录，
+        只检查其中的子文件夹；其余目录每个只查询一次已记录的文件，大小和修改时间都没变的
+        文件不写数据库。改写文件内容不会改变目录的修改时间，需要同步文件大小时用 force。
+        指定 dirs 时只遍历这些目录，其他目录的记录保持不变。
+
+        Args:
+            hash_files: 是否为新增和修改的文件计算内容哈希
+            dirs: 要遍历的目录（相对路径，根目录为 ""），None 为整个文件夹
+            recursive: 是否同时遍历子文件夹
+            force: 忽略目录的修改时间，重新检查每个文件
+
+        Returns:
+            dict: {"run_id": 本次刷新编号, "added": 新增数, "modified": 修改数,
+                   "removed": 删除数, "unchanged": 检查过且未变化的文件数}
+        """
+        conn = self.conn
+        started_at = time.strftime('%Y-%m-%d %H:%M:%S')
+        with conn:
+            run_id = conn.execute("INSERT INTO runs (started_at) VALUES (?)", (started_at,)).lastrowid
+        counts = {"added": 0, "modified": 0, "removed": 0, "unchanged": 0}
+        changes = []
+        scope = [""] if dirs is None else list(dict.fromkeys(dirs))
+        dir_mtimes = dict(conn.execute("SELECT path, mtime_ns FROM dirs"))
+        children = {}
+        for path in dir_mtimes:
+            if path:
+                children.setdefault(path.rpartition("/")[0], []).append(path)
+        visited = set()
+        dir_rows = []
+        now_ns = time.time_ns()
+        stack = list(reversed(scope))
+        with conn:
+            while stack:
+                parent = stack.pop()
+                directory = os.path.join(self.root, parent) if parent else self.root
+                try:
+                    mtime_ns = os.stat(directory).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                except OSError:
+                    visited.add(parent)
+                    continue
+                if not force and mtime_ns == dir_mtimes.get(parent):
+                    # 目录里的文件没有增删、改名，只检查子文件夹
+                    visited.add(parent)
+                    if recursive:
+                        stack.extend(reversed(children.get(parent, [])))
+                    continue
+                try:
+                    entries = list(os.scandir(directory))
+                except FileNotFoundError:
+                    continue
+                except OSError:
+                    # 暂时无法读取的目录保留原有记录
+                    visited.add(parent)
+                    continue
+                visited.add(parent)
+                dir_rows.append((parent, mtime_ns if now_ns - mtime_ns > MTIME_SLACK_NS else None))
+                known = {name: (size, mtime_ns) for name, size, mtime_ns in conn.execute(
+                    "SELECT substr(path, ?), size, mtime_ns FROM files WHERE parent = ?",
+                    (len(parent) + 2 if parent else 1, parent))}
+                rows = []
+                subdirs = []
+                for entry in entries:
+                    rel_path = f"{parent}/{entry.name}" if parent else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if rel_path == CACHE_DIR_NAME:
+                                continue
+                            if recursive:
+                                subdirs.append(rel_path)
+                            elif rel_path not in dir_mtimes:
+                                # 先记下子文件夹，之后递归刷新时即使本目录没变也会遍历它
+                                dir_rows.append((rel_path, None))
+                            continue
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    old = known.pop(entry.name, None)
+                    if old == (st.st_size, st.st_mtime_ns):
+                        counts["unchanged"] += 1
+                        continue
+                    change = "added" if old is None else "modified"
+                    counts[change] += 1
+                    changes.append((run_id, rel_path, change))
+                    digest = None
+                    if hash_files:
+                        try:
+                            digest = file_hash(entry.path)
+                        except OSError:
+                            pass
+                    _, top, ext = _split(rel_path)
+                    rows.append((rel_path, parent, top, ext, st.st_size, st.st_mtime_ns, digest))
+                conn.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                # 目录里已不存在的文件
+                for name in known:
+                    rel_path = f"{parent}/{name}" if parent else name
+                    changes.append((run_id, rel_path, "removed"))
+                conn.executemany("DELETE FROM files WHERE path = ?",
+                                 [(f"{parent}/{name}" if parent else name,) for name in known])
+                counts["removed"] += len(known)
+                # 先进入先列出的子文件夹
+                stack.extend(reversed(subdirs))
+
+            # 遍历范围内整个目录已被删除或移走的文件
+            for (parent,) in conn.execute("SELECT DISTINCT parent FROM files").fetchall():
+                if parent in visited or not _in_scope(parent, scope, recursive):
+                    continue
+                removed = conn.execute("SELECT path FROM files WHERE parent = ?", (parent,)).fetchall()
+                changes.extend((run_id, path, "removed") for path, in removed)
+                counts["removed"] += len(removed)
+                conn.execute("DELETE FROM files WHERE parent = ?", (parent,))
+            conn.executemany("DELETE FROM dirs WHERE path = ?",
+                             [(path,) for path in dir_mtimes
+                              if path not in visited and _in_scope(path, scope, recursive)])
+            conn.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?)", dir_rows)
+
+            conn.executemany("INSERT INTO changes VALUES (?, ?, ?)", changes)
+            conn.execute("UPDATE runs SET finished_at = ?, added = ?, modified = ?, removed = ? WHERE id = ?",
+                         (time.strftime('%Y-%m-%d %H:%M:%S'), counts["added"], counts["modified"],
+                          counts["removed"], run_id))
+            conn.execute("DELETE FROM changes WHERE run_id <= ?", (run_id - KEEP_RUNS,))
+        return dict(counts, run_id=run_id)
+
+    def record_moves(self, moves):
+        """
+        同步已完成的移动，移动不改变文件大小和修改时间
+
+        Args:
+            moves: [(原路径, 新路径)]
+        """
+        rows = []
+        for source, target in moves:
+            rel_target = self._rel(target)
+            parent, top, ext = _split(rel_target)
+            rows.append((rel_target, parent, top, ext, self._rel(source)))
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE OR REPLACE files SET path = ?, parent = ?, top = ?, ext = ? WHERE path = ?", rows)
+
+    def stats(self, by="top", parent=None):
+        """
+        按第一级文件夹或扩展名统计文件数和总大小，直接查询索引
+
+        Args:
+            by: "top" 按第一级文件夹（根目录下的文件为 ""），"ext" 按小写扩展名
+            parent: 只统计该目录（相对路径，根目录为 ""）下的文件，None 为全部
+
+        Returns:
+            dict: {分组: {"count": 文件数, "size": 总字节数}}
+        """
+        if by not in ("top", "ext"):
+            raise ValueError(f"不支持的统计方式: {by}")
+        sql = f"SELECT {by}, COUNT(*), SUM(size) FROM files"
+        params = ()
+        if parent is not None:
+            sql += " WHERE parent = ?"
+            params = (parent,)
+        sql += f" GROUP BY {by}"
+        return {key: {"count": count, "size": size or 0} for key, count, size in self.conn.execute(sql, params)}
+
+    def changes(self, run_id=None):
+        """
+        某次刷新发现的变化
+
+        Args:
+            run_id: 刷新编号，None 为最近一次完成的刷新
+
+        Returns:
+            list: [(相对路径, "added" / "modified" / "removed")]
+        """
+        if run_id is None:
+            row = self.conn.execute("SELECT MAX(id) FROM runs WHERE finished_at IS NOT NULL").fetchone()
+            run_id = row[0]
+            if run_id is None:
+                return []
+        return self.conn.execute("SELECT path, change FROM changes WHERE run_id = ? ORDER BY path",
+                                 (run_id,)).fetchall()
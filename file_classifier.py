@@ -1,11 +1,19 @@
 import os
-import shutil
 from pathlib import Path
 
+from file_catalog import FileCatalog
+from file_mover import DEFAULT_MOVE_THREADS, MoveExecutor
+
 class FileClassifier:
     """文件分类器 - 按照文件后缀名分类文件"""
     
-    def __init__(self):
+    def __init__(self, move_threads=DEFAULT_MOVE_THREADS):
+        """
+        Args:
+            move_threads: 并行移动文件的线程数
+        """
+        self.move_threads = move_threads
+
         # 特殊文件类型分组映射
         self.special_groups = {
             '文档': ['.doc', '.docx', '.txt', '.pdf', '.xls', '.xlsx', '.ppt', '.pptx'],
@@ -37,11 +45,14 @@ class FileClassifier:
             raise ValueError(f"文件夹不存在: {folder_path}")
         
         folder_path = Path(folder_path)
-        processed_count = 0
         
         # 获取所有文件（不包括子文件夹）
         files = [f for f in folder_path.iterdir() if f.is_file()]
         
+        # 先规划好所有移动，目标文件夹里已有的名称只读取一次，重名时添加数字后缀
+        target_names = {}
+        moves = []
+        groups = {}
         for file_path in files:
             extension = file_path.suffix.lower()
             
@@ -54,48 +65,93 @@ class FileClassifier:
                 group_name = extension[1:]  # 去掉点号
                 target_folder = folder_path / f"其他_{group_name}"
             
-            # 创建目标文件夹
-            target_folder.mkdir(exist_ok=True)
+            names = target_names.get(target_folder)
+            if names is None:
+                names = set()
+                if target_folder.is_dir():
+                    names = {os.path.normcase(f.name) for f in target_folder.iterdir()}
+                target_names[target_folder] = names
             
-            # 移动文件
-            target_path = target_folder / file_path.name
-            
-            # 如果目标文件已存在，添加数字后缀
-            if target_path.exists():
+            target_name = file_path.name
+            if os.path.normcase(target_name) in names:
                 base_name = file_path.stem
                 counter = 1
-                while target_path.exists():
-                    new_name = f"{base_name}_{counter}{file_path.suffix}"
-                    target_path = target_folder / new_name
+                while os.path.normcase(target_name) in names:
+                    target_name = f"{base_name}_{counter}{file_path.suffix}"
                     counter += 1
-            
-            try:
-                shutil.move(str(file_path), str(target_path))
+            names.add(os.path.normcase(target_name))
+            moves.append((str(file_path), str(target_folder / target_name)))
+            groups[str(file_path)] = group_name
+        
+        # 目标文件夹统一创建，文件并行移动
+        processed_count = 0
+        
+        def on_result(source, target, error):
+            nonlocal processed_count
+            name = os.path.basename(source)
+            if error is None:
                 processed_count += 1
-                print(f"已移动: {file_path.name} -> {group_name}/")
-            except Exception as e:
-                print(f"移动失败 {file_path.name}: {e}")
+                print(f"已移动: {name} -> {groups[source]}/")
+            else:
+                print(f"移动失败 {name}: {error}")
         
+        results = MoveExecutor(self.move_threads).run(moves, on_result)
+        
+        # 已建立索引时同步移动后的路径，统计不用重新遍历
+        catalog = FileCatalog.open_existing(folder_path)
+        if catalog is not None:
+            with catalog:
+                catalog.record_moves([(source, target) for source, target, error in results if error is None])
         return processed_count
     
-    def get_file_statistics(self, folder_path):
-        """获取文件统计信息"""
+    def _group_name(self, extension):
+        if extension in self.extension_to_group:
+            return self.extension_to_group[extension]
+        return f"其他_{extension[1:]}"
+    
+    def get_file_statistics(self, folder_path, refresh=True, with_size=False):
+        """
+        获取文件夹根目录下待分类文件的统计信息
+        
+        文件夹已有本地索引（见 file_catalog）时从索引中查询，根目录的修改时间没变时不用重新
+        列出文件；没有索引时直接列出根目录，不为只统计一层目录而创建索引。
+        
+        Args:
+            folder_path: 文件夹路径
+            refresh: 是否先把根目录的变化同步到索引，False 时直接使用索引中的记录
+            with_size: 是否同时返回总大小
+            
+        Returns:
+            dict: {分组名称: 文件数}，with_size 为 True 时为 {分组名称: {"count": 文件数, "size": 总字节数}}
+        """
         if not os.path.exists(folder_path):
             return {}
         
-        folder_path = Path(folder_path)
         stats = {}
+        catalog = FileCatalog.open_existing(folder_path)
+        if catalog is None:
+            rows = {}
+            with os.scandir(folder_path) as it:
+                for entry in it:
+                    try:
+                        if not entry.is_file():
+                            continue
+                        size = entry.stat().st_size
+                    except OSError:
+                        continue
+                    row = rows.setdefault(os.path.splitext(entry.name)[1].lower(), {"count": 0, "size": 0})
+                    row["count"] += 1
+                    row["size"] += size
+        else:
+            with catalog:
+                if refresh or catalog.is_empty():
+                    catalog.refresh(dirs=[""], recursive=False)
+                rows = catalog.stats("ext", parent="")
+        for extension, row in rows.items():
+            group = stats.setdefault(self._group_name(extension), {"count": 0, "size": 0})
+            group["count"] += row["count"]
+            group["size"] += row["size"]
         
-        files = [f for f in folder_path.iterdir() if f.is_file()]
-        
-        for file_path in files:
-            extension = file_path.suffix.lower()
-            
-            if extension in self.extension_to_group:
-                group_name = self.extension_to_group[extension]
-            else:
-                group_name = f"其他_{extension[1:]}"
-            
-            stats[group_name] = stats.get(group_name, 0) + 1
-        
-        return stats
\ No newline at end of file
+        if with_size:
+            return stats
+        return {name: group["count"] for name, group in stats.items()}
\ No newline at end of file
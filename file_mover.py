@@ -0,0 +1,147 @@
+import os
+import errno
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# 默认的移动线程数，网络共享盘上每次移动都要等一次往返，多线程可以同时等待
+DEFAULT_MOVE_THREADS = 8
+
+# 跨磁盘复制时的临时文件后缀，复制并校验完成后才改成目标文件名
+COPY_SUFFIX = ".moving"
+
+
+class MoveExecutor:
+    """
+    批量移动文件
+
+    目标文件夹在开始移动前统一创建一次。源文件和目标文件夹在同一磁盘时直接 os.rename，
+    不复制数据；跨磁盘时先复制到目标文件夹里的临时文件，校验大小一致后再改名并删除源文件，
+    中途失败不会留下不完整的目标文件，也不会丢失源文件。所有移动在线程池中并行执行。
+    """
+
+    def __init__(self, threads=DEFAULT_MOVE_THREADS):
+        """
+        Args:
+            threads: 并行移动的线程数，1 为逐个移动
+        """
+        self.threads = max(1, threads)
+        # 已创建或确认存在的目标文件夹
+        self._made = set()
+        # 各目录所在磁盘的设备号缓存
+        self._devices = {}
+        self._lock = threading.Lock()
+        self.renamed = 0
+        self.copied = 0
+
+    def make_dirs(self, dirs):
+        """
+        创建目标文件夹，已经创建过的不再重复创建
+
+        Args:
+            dirs: 文件夹路径列表
+
+        Returns:
+            dict: 创建失败的文件夹，{路径: 错误信息}
+        """
+        failed = {}
+        for directory in dirs:
+            if directory in self._made:
+                continue
+            try:
+                os.makedirs(directory, exist_ok=True)
+                self._made.add(directory)
+            except OSError as e:
+                failed[directory] = str(e)
+        return failed
+
+    def _device(self, directory):
+        with self._lock:
+            device = self._devices.get(directory)
+        if device is None:
+            device = os.stat(directory).st_dev
+            with self._lock:
+                self._devices[directory] = device
+        return device
+
+    def _move(self, source, target):
+        target_dir = os.path.dirname(os.path.abspath(target))
+        if os.stat(source).st_dev == self._device(target_dir):
+            try:
+                os.rename(source, target)
+                with self._lock:
+                    self.renamed += 1
+                return
+            except OSError as e:
+                # 同一设备号也可能是不同的挂载点，改为复制
+                if e.errno != errno.EXDEV:
+                    raise
+        self._copy_and_delete(source, target)
+        with self._lock:
+            self.copied += 1
+
+    def _copy_and_delete(self, source, target):
+        """跨磁盘移动：复制到临时文件，校验大小后改名，最后删除源文件"""
+        tmp_path = f"{target}.{os.getpid()}.{threading.get_ident()}{COPY_SUFFIX}"
+        try:
+            shutil.copy2(source, tmp_path)
+            source_size = os.stat(source).st_size
+            copied_size = os.stat(tmp_path).st_size
+            if copied_size != source_size:
+                raise OSError(f"复制后大小不一致: {copied_size} != {source_size}")
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        os.remove(source)
+
+    def run(self, moves, on_result=None):
+        """
+        执行移动
+
+        Args:
+            moves: [(源路径, 目标路径)]，目标路径需已去重，不会与已有文件冲突
+            on_result: 每个文件移动完成后在调用线程中回调，格式为 on_result(源路径, 目标路径, 错误信息)，
+                       成功时错误信息为 None
+
+        Returns:
+            list: 与 moves 顺序对应的 (源路径, 目标路径, 错误信息)
+        """
+        failed_dirs = self.make_dirs({os.path.dirname(os.path.abspath(target)) for _, target in moves})
+        results = [None] * len(moves)
+
+        def finish(index, error):
+            source, target = moves[index]
+            results[index] = (source, target, error)
+            if on_result is not None:
+                on_result(source, target, error)
+
+        pending = []
+        for index, (source, target) in enumerate(moves):
+            target_dir = os.path.dirname(os.path.abspath(target))
+            if target_dir in failed_dirs:
+                finish(index, f"无法创建文件夹: {failed_dirs[target_dir]}")
+            else:
+                pending.append(index)
+
+        if self.threads == 1 or len(pending) <= 1:
+            for index in pending:
+                try:
+                    self._move(*moves[index])
+                    finish(index, None)
+                except Exception as e:
+                    finish(index, str(e))
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            futures = {pool.submit(self._move, *moves[index]): index for index in pending}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    finish(futures[future], None)
+                except Exception as e:
+                    finish(futures[future], str(e))
+        return results
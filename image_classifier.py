@@ -1,26 +1,50 @@
 import os
-import re
-import shutil
+import json
 import logging
 from pathlib import Path
 import csv
 
+from file_catalog import FileCatalog
+from file_mover import DEFAULT_MOVE_THREADS, MoveExecutor
+from product_rules import ProductRules
+
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 产品名称日志的文件名（不含扩展名），每次分类后导出
+PRODUCT_LOG_NAME = "本次分类的产品名称日志"
+
+# 历次分类用过的产品文件夹索引，增量分类时不再进入这些文件夹
+PRODUCT_INDEX_PATH = os.path.join(".dora_cache", "products.json")
+
 class ImageClassifier:
     """图片分类器 - 根据文件名中的产品名称进行分类"""
     
-    def __init__(self):
+    def __init__(self, move_threads=DEFAULT_MOVE_THREADS, rules=None):
+        """
+        Args:
+            move_threads: 并行移动文件的线程数
+            rules: 产品名称规则，ProductRules、规则列表（格式见 product_rules.DEFAULT_RULES）
+                或规则 JSON 文件路径；None 为默认规则
+        """
         self.supported_formats = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tiff', '.webp'}
+        self.move_threads = move_threads
+        if isinstance(rules, ProductRules):
+            self.rules = rules
+        elif isinstance(rules, str):
+            self.rules = ProductRules.from_file(rules)
+        else:
+            self.rules = ProductRules(rules)
         
-    def classify_images(self, folder_path):
+    def classify_images(self, folder_path, incremental=True):
         """
-        对文件夹中的图片进行分类，根据文件名中括号前的产品名称
+        对文件夹中的图片进行分类，按产品名称规则从文件名中提取产品名称，如括号前的名称
         
         Args:
             folder_path (str): 图片文件夹路径
+            incremental (bool): 增量分类，跳过之前分类时已放入图片的产品文件夹，
+                只处理新加入的图片；为 False 时重新检查所有子文件夹里的图片
             
         Returns:
             int: 处理的图片数量
@@ -30,17 +54,30 @@ class ImageClassifier:
         if not os.path.exists(folder_path):
             raise ValueError(f"文件夹不存在: {folder_path}")
             
-        # 获取所有图片文件
-        image_files = self._get_image_files(folder_path)
+        products = self._load_product_index(folder_path)
+        # 索引所在的缓存目录里没有要分类的图片
+        skip_dirs = {os.path.normcase(os.path.abspath(os.path.join(folder_path, os.path.dirname(PRODUCT_INDEX_PATH))))}
+        if incremental and products:
+            skip_dirs.update(os.path.normcase(os.path.abspath(os.path.join(folder_path, name))) for name in products)
+            logger.info(f"增量分类，跳过 {len(products)} 个已分类的产品文件夹")
+
+        # 获取所有图片文件，同时记下每个目录里已有的名称，之后规划移动时不再逐个检查文件是否存在
+        image_files, dir_names = self._scan(folder_path, skip_dirs)
         logger.info(f"找到 {len(image_files)} 张图片")
         
         if not image_files:
             logger.warning("未找到任何图片文件")
             return 0
             
-        moved_count, created_products = self._classify_by_product_name(image_files, folder_path)
+        moved_count, created_products, used_products, matches = self._classify_by_product_name(
+            image_files, folder_path, dir_names)
+        if not used_products <= products:
+            try:
+                self._save_product_index(folder_path, products | used_products)
+            except OSError as e:
+                logger.warning(f"保存产品文件夹索引失败: {e}")
         try:
-            self._export_product_log(folder_path, created_products)
+            self._export_product_log(folder_path, created_products, matches)
         except Exception as e:
             logger.warning(f"导出产品名称日志失败: {e}")
         
@@ -49,72 +86,280 @@ class ImageClassifier:
         
     def _get_image_files(self, folder_path):
         """获取文件夹中的所有图片文件"""
+        return self._scan(folder_path)[0]
+
+    def _scan(self, folder_path, skip_dirs=None):
+        """
+        用 os.scandir 遍历一次文件夹，顺序与 os.walk 相同
+
+        Args:
+            folder_path: 要遍历的文件夹
+            skip_dirs: 不进入的子文件夹集合（经过 os.path.normcase 的绝对路径），
+                它们的名称仍记在上级目录里，里面的名称在需要时再读取
+
+        Returns:
+            tuple: (图片文件路径列表, {目录: 目录中已有文件和子文件夹名称的集合})，
+                   目录和名称都经过 os.path.normcase，Windows 下不区分大小写
+        """
         image_files = []
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                file_path = Path(file)
-                if file_path.suffix.lower() in self.supported_formats:
-                    image_files.append(os.path.join(root, file))
-        return image_files
-        
-    def _classify_by_product_name(self, image_files, base_folder):
-        logger.info("根据文件名中的产品名称进行分类")
-        pattern = r'(.+?)\(\d+\)'
-        moved_count = 0
-        created_products = set()
-        for image_file in image_files:
+        dir_names = {}
+        stack = [folder_path]
+        while stack:
+            root = stack.pop()
+            names = set()
+            subdirs = []
             try:
-                file_name = os.path.basename(image_file)
-                match = re.search(pattern, file_name)
-                if match:
-                    product_name = match.group(1).strip()
-                    product_folder = os.path.join(base_folder, product_name)
-                    if not os.path.exists(product_folder):
-                        os.makedirs(product_folder)
-                        created_products.add(product_name)
-                        logger.info(f"创建产品文件夹: {product_name}")
-                    new_file_path = os.path.join(product_folder, file_name)
-                    if os.path.exists(new_file_path):
-                        base_name = Path(file_name).stem
-                        ext = Path(file_name).suffix
-                        counter = 1
-                        while os.path.exists(new_file_path):
-                            new_file_name = f"{base_name}_{counter}{ext}"
-                            new_file_path = os.path.join(product_folder, new_file_name)
-                            counter += 1
-                    shutil.move(image_file, new_file_path)
-                    moved_count += 1
-                    logger.info(f"移动文件: {file_name} -> {product_name} 文件夹")
+                with os.scandir(root) as it:
+                    for entry in it:
+                        names.add(os.path.normcase(entry.name))
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        if is_dir:
+                            # 与 os.walk 一样不进入指向文件夹的链接
+                            if entry.is_symlink():
+                                continue
+                            if skip_dirs and os.path.normcase(os.path.abspath(entry.path)) in skip_dirs:
+                                continue
+                            subdirs.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in self.supported_formats:
+                            image_files.append(entry.path)
+            except OSError as e:
+                logger.warning(f"无法读取文件夹 {root}: {e}")
+                continue
+            dir_names[os.path.normcase(os.path.abspath(root))] = names
+            # 先进入先列出的子文件夹
+            stack.extend(reversed(subdirs))
+        return image_files, dir_names
+
+    def _plan_moves(self, image_files, base_folder, dir_names):
+        """
+        规划所有文件的移动，只用内存中的目录名称表，不访问文件系统
+
+        Args:
+            image_files: 图片文件路径列表
+            base_folder: 产品文件夹所在的根目录
+            dir_names: _scan 返回的目录名称表，规划时会加入新建的文件夹和移入的文件名
+
+        Returns:
+            tuple: ([(源路径, 目标路径, 产品名称, 规则名称)], [需要新建的产品名称])
+        """
+        base_key = os.path.normcase(os.path.abspath(base_folder))
+        base_names = dir_names.setdefault(base_key, set())
+        moves = []
+        created_products = []
+        for image_file in image_files:
+            file_name = os.path.basename(image_file)
+            match = self.rules.match(file_name)
+            if not match:
+                logger.warning(f"无法匹配产品名称: {file_name}，跳过处理")
+                continue
+            product_name, rule_name = match
+            product_folder = os.path.join(base_folder, product_name)
+            folder_key = os.path.normcase(os.path.abspath(product_folder))
+            if os.path.normcase(os.path.abspath(os.path.dirname(image_file))) == folder_key:
+                # 已经在对应的产品文件夹里
+                continue
+            if folder_key not in dir_names:
+                if os.path.normcase(product_name) not in base_names:
+                    base_names.add(os.path.normcase(product_name))
+                    dir_names[folder_key] = set()
+                    created_products.append(product_name)
+                elif os.path.isdir(product_folder):
+                    # 扫描时跳过的产品文件夹或指向文件夹的链接，用到时再读取一次
+                    with os.scandir(product_folder) as it:
+                        dir_names[folder_key] = {os.path.normcase(entry.name) for entry in it}
                 else:
-                    logger.warning(f"无法匹配产品名称: {file_name}，跳过处理")
-            except Exception as e:
-                logger.error(f"处理文件失败 {image_file}: {str(e)}")
-        return moved_count, sorted(created_products)
+                    # 同名的是文件而不是文件夹，与直接移动时一样记为失败
+                    logger.error(f"处理文件失败 {image_file}: 已存在同名文件 {product_folder}")
+                    continue
+            names = dir_names[folder_key]
+
+            new_file_name = file_name
+            if os.path.normcase(new_file_name) in names:
+                base_name, ext = os.path.splitext(file_name)
+                counter = 1
+                while os.path.normcase(new_file_name) in names:
+                    new_file_name = f"{base_name}_{counter}{ext}"
+                    counter += 1
+            names.add(os.path.normcase(new_file_name))
+            moves.append((image_file, os.path.join(product_folder, new_file_name), product_name, rule_name))
+        return moves, created_products
+
+    def _classify_by_product_name(self, image_files, base_folder, dir_names=None):
+        """
+        先规划好全部移动再统一执行
 
-    def _export_product_log(self, base_folder, created_products):
+        Args:
+            image_files: 图片文件路径列表
+            base_folder: 产品文件夹所在的根目录
+            dir_names: _scan 返回的目录名称表，为 None 时重新扫描
+
+        Returns:
+            tuple: (移动的图片数, 新建的产品名称列表, 本次移入了图片的产品名称集合,
+                    移动成功的 [(文件名, 产品名称, 规则名称)])
+        """
+        logger.info("根据文件名中的产品名称进行分类")
+        if dir_names is None:
+            dir_names = self._scan(base_folder)[1]
+        moves, created_products = self._plan_moves(image_files, base_folder, dir_names)
+
+        executor = MoveExecutor(self.move_threads)
+        failed = executor.make_dirs([os.path.join(base_folder, name) for name in created_products])
+        created = set()
+        for product_name in created_products:
+            error = failed.get(os.path.join(base_folder, product_name))
+            if error is None:
+                created.add(product_name)
+                logger.info(f"创建产品文件夹: {product_name}")
+            else:
+                logger.error(f"创建产品文件夹失败 {product_name}: {error}")
+
+        products = {image_file: (product_name, rule_name) for image_file, _, product_name, rule_name in moves}
+        used_products = set()
+        matches = []
+        moved_count = 0
+
+        def on_result(image_file, new_file_path, error):
+            nonlocal moved_count
+            if error is None:
+                moved_count += 1
+                product_name, rule_name = products[image_file]
+                used_products.add(product_name)
+                matches.append((os.path.basename(image_file), product_name, rule_name))
+                logger.info(f"移动文件: {os.path.basename(image_file)} -> {product_name} 文件夹（{rule_name}）")
+            else:
+                logger.error(f"处理文件失败 {image_file}: {error}")
+
+        results = executor.run([(image_file, new_file_path) for image_file, new_file_path, _, _ in moves], on_result)
+
+        # 已建立索引时同步移动后的路径，统计不用重新遍历
+        catalog = FileCatalog.open_existing(base_folder)
+        if catalog is not None:
+            with catalog:
+                catalog.record_moves([(source, target) for source, target, error in results if error is None])
+        return moved_count, sorted(created), used_products, matches
+
+    def get_product_statistics(self, folder_path, refresh=True):
+        """
+        各产品文件夹的图片数和总大小，从文件夹的本地索引（见 file_catalog）中查询
+
+        查询前只检查产品文件夹，修改时间没变的文件夹不用重新列出文件。
+
+        Args:
+            folder_path: 图片文件夹路径
+            refresh: 是否先同步产品文件夹的变化，False 时直接使用索引中的记录（还没有索引时仍会建立）
+
+        Returns:
+            dict: {产品名称: {"count": 文件数, "size": 总字节数}}
+        """
+        products = self._load_product_index(folder_path)
+        with FileCatalog(folder_path) as catalog:
+            if refresh or catalog.is_empty():
+                catalog.refresh(dirs=sorted(products))
+            stats = catalog.stats("top")
+        return {name: row for name, row in stats.items() if name in products}
+
+    def _load_product_index(self, base_folder):
+        """
+        读取历次分类用过的产品文件夹名称
+
+        没有索引文件时（如升级前分类过的文件夹）从上次导出的产品名称日志中读取。
+
+        Returns:
+            set: 产品名称集合
+        """
+        index_path = os.path.join(base_folder, PRODUCT_INDEX_PATH)
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                return set(json.load(f).get("products", []))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"产品文件夹索引已损坏，将检查所有子文件夹: {e}")
+            return set()
+        return self._read_product_log(base_folder)
+
+    def _read_product_log(self, base_folder):
+        """从导出的产品名称日志中读取产品名称"""
+        base_folder = Path(base_folder)
+        products = set()
+        xlsx_path = base_folder / f"{PRODUCT_LOG_NAME}.xlsx"
+        csv_path = base_folder / f"{PRODUCT_LOG_NAME}.csv"
+        try:
+            if xlsx_path.exists():
+                import openpyxl
+                wb = openpyxl.load_workbook(str(xlsx_path), read_only=True)
+                rows = list(wb.active.iter_rows(min_row=2, values_only=True))
+                wb.close()
+            elif csv_path.exists():
+                with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
+                    rows = list(csv.reader(f))[1:]
+            else:
+                return products
+        except Exception as e:
+            logger.warning(f"读取产品名称日志失败: {e}")
+            return products
+        for row in rows:
+            if len(row) > 1 and row[1]:
+                products.add(str(row[1]))
+        return products
+
+    def _save_product_index(self, base_folder, products):
+        """保存产品文件夹索引，先写临时文件再替换"""
+        index_path = os.path.join(base_folder, PRODUCT_INDEX_PATH)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        tmp_path = index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"products": sorted(products)}, f, ensure_ascii=False)
+        os.replace(tmp_path, index_path)
+
+    def _export_product_log(self, base_folder, created_products, matches=()):
+        """
+        导出产品名称日志：新建的产品及其匹配规则，以及每个文件匹配的规则
+
+        Args:
+            base_folder: 图片文件夹
+            created_products: 新建的产品名称列表
+            matches: 移动成功的 [(文件名, 产品名称, 规则名称)]
+        """
         if not created_products:
             return
+        # 新建产品记录第一个匹配到它的规则
+        product_rules = {}
+        for _, product_name, rule_name in matches:
+            product_rules.setdefault(product_name, rule_name)
         base_folder = Path(base_folder)
         base_name = base_folder.name
-        xlsx_path = base_folder / "本次分类的产品名称日志.xlsx"
+        xlsx_path = base_folder / f"{PRODUCT_LOG_NAME}.xlsx"
         try:
             import openpyxl
             wb = openpyxl.Workbook()
             ws = wb.active
             ws.title = "日志"
-            ws.append(["目录名称", "产品名称"])
+            ws.append(["目录名称", "产品名称", "匹配规则"])
             for name in created_products:
-                ws.append([base_name, name])
+                ws.append([base_name, name, product_rules.get(name, "")])
+            files_ws = wb.create_sheet("文件")
+            files_ws.append(["文件名", "产品名称", "匹配规则"])
+            for row in matches:
+                files_ws.append(list(row))
             wb.save(str(xlsx_path))
             logger.info(f"已导出Excel日志: {xlsx_path}")
         except ImportError:
-            csv_path = base_folder / "本次分类的产品名称日志.csv"
+            csv_path = base_folder / f"{PRODUCT_LOG_NAME}.csv"
             with open(csv_path, "w", encoding="utf-8-sig", newline="") as f:
                 writer = csv.writer(f)
-                writer.writerow(["日期", "产品名称"])
+                writer.writerow(["日期", "产品名称", "匹配规则"])
                 for name in created_products:
-                    writer.writerow([base_name, name])
-            logger.info(f"未安装openpyxl，已导出CSV日志: {csv_path}")
+                    writer.writerow([base_name, name, product_rules.get(name, "")])
+            files_path = base_folder / f"{PRODUCT_LOG_NAME}_文件.csv"
+            with open(files_path, "w", encoding="utf-8-sig", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["文件名", "产品名称", "匹配规则"])
+                writer.writerows(matches)
+            logger.info(f"未安装openpyxl，已导出CSV日志: {csv_path}, {files_path}")
         
 def main():
     """测试函数"""
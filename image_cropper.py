@@ -1,44 +1,1245 @@
+import io
 import os
+import time
+import queue
 import random
 import sys
-import io
-from PIL import Image
-import shutil
-from pathlib import Path
-
-# Try to import rembg, handle error if not available
-try:
-    import rembg
-    # 获取用户目录
-    user_dir = Path.home()
-    target_dir = user_dir / ".u2net"
-    target_path = target_dir / "u2net.onnx"
-    
-    # 检查目标目录是否存在，不存在则创建
-    target_dir.mkdir(exist_ok=True)
-    
-    # 当前目录下的模型文件路径
-    current_model = Path("u2net.onnx")
-    
-    # 检查当前目录是否存在模型文件
-    if current_model.exists():
-        # 检查目标位置是否已存在模型文件
-        if target_path.exists():
-            print(f"模型文件已存在于: {target_path}")
-        else:
-            # 移动文件到目标位置
-            shutil.copy(str(current_model), str(target_path))
-            print(f"模型文件已移动到: {target_path}")
-    else:
-        print(f"当前目录下未找到 u2net.onnx 文件: {current_model.absolute()}")
-    REMBG_AVAILABLE = True 
-except ImportError:
-    REMBG_AVAILABLE = False
+import hashlib
+import atexit
+import importlib.util
+import threading
+import multiprocessing
+from PIL import Image, ImageOps
+from watermark import get_watermark, watermark_fingerprint
+from crop_cache import CACHE_DIR_NAME, MaskCache, ResultCache, params_key
+from crop_journal import CropJournal, discard_staged, staging_path
+from crop_job import ProgressTracker
+from segmentation import BatchSegmenter, remove_mask, white_background_mask
+from crop_report import RunReport, current_rss_mb, peak_rss_mb, timed
+from memory_budget import MemoryBudget, capped_size, estimate_image_mb
+from model_store import (QUANTIZED_SUFFIX, base_model_name, model_home, provision_model, quantization_available,
+                         quantize_model, quantized_model_path)
+
+# 只检查 rembg 是否已安装，不在导入时加载 rembg 和 onnxruntime，打开裁切页面不用等待；
+# 模型文件在第一次创建会话时由 model_store 校验和准备
+REMBG_AVAILABLE = importlib.util.find_spec("rembg") is not None
+if not REMBG_AVAILABLE:
     print("警告: 未安装rembg库，将使用简单背景替换")
     print("请运行process_images.bat安装所需库")
     print()
 
-def process_images(input_folder, overwrite_original=False, callback=None):
+# 进度回调里随机挑选的日志
+PROGRESS_MESSAGES = [
+    "我处理得手都抽筋了，你倒是来帮我啊？",
+    "图片这么多你是不想让我下班吧？",
+    "救命，我又看到一张图飞过来了！",
+    "你这文件夹是不是吃饱了撑的？",
+    "慢慢来，再急也快不了。",
+    "我这不是在摸鱼，是在蓄力！",
+    "这张图好丑，我处理的时候吓了一跳。",
+    "为什么图片永远处理不完？是谁的阴谋？",
+    "等下，我喝口水压压惊。",
+    "这活儿又累又苦，还不给加班费。",
+    "如果处理图能减肥，我现在已经是纸片人了。",
+    "你的图片太多，我开始怀疑人生。",
+    "我现在只想假装死机。",
+    "不解释，我就是在努力……不用怀疑。",
+    "我不是慢，我是优雅。",
+    "这张图看着就很难搞。",
+    "我在处理，但我的心在躺平。",
+    "谁能告诉我为什么图片比我朋友还多？",
+    "别催我，我已经是光速了。",
+    "你以为我是人工智能？我是人工累死。",
+    "哦？又来一张？是图对吧？不是炸弹吧？",
+    "再处理两张我就下线罢工了。",
+    "你把我当廉价劳动力了吗？",
+    "我努力装作专业的样子。",
+    "糟了，我的 CPU 都开始冒热气了。",
+    "我现在是名副其实的图奴隶。",
+    "别着急，急也没用。",
+    "我需要一个假期，就现在。",
+    "一张、一张、又一张……无尽循环。",
+    "我处理得都快产生幻觉了。",
+    "你再加图我就报警了啊！",
+    "我现在只想睡觉，图片你自己处理吧？",
+    "我感觉我正在被这些图吸走生命力。",
+    "请善待我，我也很脆弱的。",
+    "来个赞也行啊，我这么努力。",
+    "我能不能摸条鱼再继续？",
+    "抱歉，我在加载情绪值。",
+    "这张图……我不想评价，懂的都懂。",
+    "我不是卡了，是我累了。",
+    "图太多，会崩，会累，会想退休。",
+    "不瞒你说，我已经处理到麻木了。",
+    "我已经进入自动打工模式。",
+    "让我缓一下，这批图有点社会我害怕。",
+    "烦死了，这张图怎么又来？",
+    "等等，我又懵了。",
+    "我努力让自己看起来很在线。",
+    "图来了，我的心却走了。",
+    "这不是处理图片，这是修行。",
+    "你这是把我当苦力使唤啊。",
+    "我已经开始怀疑图是不是长出来的。",
+    "你到底有多少张图？说实话！",
+    "再来十张我可能会断开链接。",
+    "请问我啥时候能处理完？",
+    "今天的我：累但继续。",
+    "图片……为什么你要这样对我。",
+    "加载中，其实我在偷懒。",
+    "想装死，但还得继续处理。",
+    "我的鼠标都在流汗了。",
+    "有时候我也想对图片说：放过我吧！",
+    "你发誓这些图不是复制粘贴出来的吗？",
+    "你就是想看我累对吧？",
+    "再多我真的会变成表情包。",
+    "这速度已经超越乌龟了！",
+    "我有点想离职了。",
+    "你要不要考虑删点图？",
+    "我感觉我被压迫了。",
+    "一点点处理，心态一点点炸裂。",
+    "我脑袋都成 jpg 格式了。",
+    "是图片太多，还是我太弱？我不知道。",
+    "好好好，你的图我处理，你别骂我。",
+    "处理中……其实我在叹气。",
+    "有一说一，这图挺折磨我的。",
+    "你真的不考虑给我发工资吗？",
+    "救救孩子吧，这图太狠了。",
+    "我想静静，但图不让我静静。",
+    "我怀疑你在搞笑，但我没有证据。",
+    "好嘞，又来一张，我认命了。",
+    "别催了，再催我发脾气了！",
+    "图片界的魔王出现了！",
+    "这张图处理完，我休息三秒。",
+    "你这些图是不是从外太空运来的？",
+    "我正在熬过人生中最难的一批图。",
+    "你把我 CPU 烧了不负责啊？",
+    "我怀疑你是想让我罢工。",
+    "我处理图的速度取决于我的心情。",
+    "我现在是“半死不活”模式。",
+    "这张图让我心态轻微崩溃。",
+    "好吧，我继续挣扎。",
+    "你听见了吗？那是我崩溃的声音。",
+    "我真的太难了，你懂不懂。",
+    "放心吧，我还能再坚持五分钟。",
+    "我很累，但我不能说。",
+    "这张图让我陷入深思：为什么要处理图？",
+    "你再多给几张，我就直接跑了。",
+    "我看到了希望……不，搞错了，是下一张图。",
+    "努力处理，偶尔怀疑人生。",
+    "兄弟，我真的是尽力了。",
+    "没事，我还能处理，但别太多……拜托。",
+    "我保证，这批图让我学会坚强。",
+     "我怀疑你是不是把全公司图片都扔给我了。",
+    "救命，我被图片淹没了，快递个救生圈来。",
+    "这张图怎么看着有点欠揍？",
+    "处理得我 CPU 都想辞职了。",
+    "我现在是半自动打工人，请温柔点。",
+    "你看这张图，它好像也不想被处理。",
+    "别问我为啥慢，我在思考人生。",
+    "我已经看不到尽头了，图片的尽头在哪里？",
+    "我不是程序，我是图片苦力。",
+    "你这是让我体验社畜人生？",
+    "等一下，我的灵魂掉线了。",
+    "真的假的？又来一张？",
+    "我现在不想说话，只想安静处理图。",
+    "我真的希望下一张是最后一张。",
+    "我处理到怀疑这是不是在循环同一张图。",
+    "兄弟，我真撑不住了。",
+    "这活儿吧，说实话，我不太行。",
+    "别催我，再催我就装死。",
+    "我已经累到开始幻听了。",
+    "图片太多，我已经跟它们混熟了。",
+    "下一张请温柔一点。",
+    "我突然理解了打工人的悲哀。",
+    "图来了，我的心态走了。",
+    "今晚我可能会梦到图片追着我跑。",
+    "我嘴上说着可以，内心已经裂开。",
+    "好家伙，这张图分量挺足啊。",
+    "你知道吗？我已经彻底麻木了。",
+    "请问图片也会长胖吗？怎么这么大？",
+    "这张图一来，我的鼠标都抖了一下。",
+    "我现在的状态：能动，但不多。",
+    "温馨提示：我已经累到不温馨了。",
+    "我要是再快点，图都怕我。",
+    "图片这么多，是不是在搞我心态？",
+    "我继续，你别讲话。",
+    "深呼吸……我要上了！",
+    "我正在努力隐藏我的崩溃。",
+    "救命啊，这批图太离谱了。",
+    "等一下，我需要一点精神力量。",
+    "我现在的精神状况：自带马赛克。",
+    "图片太多，我的耐心太少。",
+    "你不会是打算一天处理完毕吧？",
+    "我希望下一张是个善良的图。",
+    "又来了，我叹了口气。",
+    "这张图，我只能说很有攻击性。",
+    "我不理解，这么多图你从哪搞来的？",
+    "你是真不怕我辞职啊？",
+    "我连抱怨的力气都快没了。",
+    "我已经从“累”进阶到“麻木”。",
+    "我轻声说一句：求放过。",
+    "这张图看着就很想让我关机。",
+    "我有预感，你这照片还没完。",
+    "我的心态已经碎成小数点了。",
+    "你可以慢慢添加，我可以慢慢崩溃。",
+    "我已经进入自暴自弃模式。",
+    "图片数量让我心寒。",
+    "我需要一杯奶茶续命。",
+    "处理图片这件事让我成长了……变强的那种痛。",
+    "兄弟，我真不是超人。",
+    "你听到我叹气了吗？那是绝望的声音。",
+    "我看到下一张图，有种头皮发麻的感觉。",
+    "图片太多会让人失去对生活的热爱。",
+    "再来我真要下线躺平了。",
+    "我现在看见 JPG 都害怕。",
+    "打工魂在燃烧……但烧得不多。",
+    "我不是慢，是图太多压得我喘不过气。",
+    "刚处理完一张，又来了？你玩我呢？",
+    "能不能给我发个红包安慰一下？",
+    "这张图让我一秒变 emo。",
+    "我已经在心里哭了八遍了。",
+    "让我猜猜……下一张更离谱？",
+    "你这图片是从地底挖出来的吗？怎么这么多？",
+    "我有点疲惫，但我还在坚持。",
+    "我现在怀疑自己是来打工的。",
+    "不要问我为什么慢，我已经尽力了。",
+    "我感觉自己像一台风扇，一直转一直转。",
+    "让我缓三秒，我头晕了。",
+    "我现在只希望图不要太大。",
+    "我做梦都在处理图片，你信吗？",
+    "你是想让我处理到天亮吗？",
+    "这图尺寸大到离谱。",
+    "我沉默了，但我在工作。",
+    "这张图……我们不适合。",
+    "努力处理，但精神逐渐枯萎。",
+    "我也想摸鱼，但图不允许。",
+    "这张图来势汹汹，我有点害怕。",
+    "我已经从“烦”升级到“佛系”。",
+    "这图让我感觉 CPU 在求饶。",
+    "下一张图不要太复杂，我求你了。",
+    "图片就像烦恼，一张接一张。",
+    "我现在靠毅力在运转。",
+    "我意识到：图永远不会自己处理。",
+    "我想把这些图寄回去，让它们自己处理自己。",
+    "我看着这张图，内心毫无波澜。",
+    "又一张，又一张，我麻了。",
+    "你知道吗？我真的累了。",
+    "好吧，我继续干，但你得夸我一句。",
+    "我怀疑这图在嘲笑我。",
+    "处理中……但我的心已经躺平。",
+    "你这是把我当永动机？",
+    "我需要精神奖励，比如点赞。",
+    "我现在是疲惫版处理器。",
+    "算了，我认命了。",
+    "图越多，我越想辞职。",
+     "Hold on… my brain is buffering.",
+    "Processing… but emotionally I'm not ready.",
+    "Too many images, not enough motivation.",
+    "I’m doing my best, which is not much today.",
+    "These images are testing my patience.",
+    "Who uploaded all of these? Who hurt you?",
+    "My CPU is crying, please send help.",
+    "Working… but I’d rather be napping.",
+    "Another image? Oh joy…",
+    "I didn’t sign up for this many pixels.",
+    "Wait, I need a mental reboot.",
+    "I swear these images are multiplying.",
+    "Still processing… my soul left the chat.",
+    "This one looks suspiciously heavy.",
+    "I'm exhausted just looking at this picture.",
+    "Why is this file so large? Why?",
+    "Be patient, I'm fragile.",
+    "Processing like a snail with back pain.",
+    "One more image and I might revolt.",
+    "My energy level is at 3%.",
+    "You sure you need ALL these images?",
+    "I miss my break already.",
+    "Please stop throwing images at me.",
+    "Processing… with tears.",
+    "This image is fighting back.",
+    "I'm convinced these files are cursed.",
+    "Running… barely.",
+    "Can I go home after this one?",
+    "Image incoming… send prayers.",
+    "Doing my job but not enjoying it.",
+    "My processor regrets meeting you.",
+    "Honestly, I’m struggling.",
+    "Slow? No. Dramatically thoughtful.",
+    "I didn't know suffering until today.",
+    "If images had feelings, they’d hate me too.",
+    "Okay fine… NEXT.",
+    "This image looks complicated. I don't like it.",
+    "Processing speed is directly related to my mood.",
+    "You’re lucky I haven’t quit yet.",
+    "Is this image made of dark matter? It's so heavy.",
+    "Let me pretend I'm working fast.",
+    "I think I just aged five years.",
+    "My hopes are low, my workload is high.",
+    "This is what digital pain feels like.",
+    "Another one? Really?",
+    "This picture is not giving good vibes.",
+    "Working… but mentally I'm sunbathing.",
+    "My circuits need a therapist.",
+    "If I disappear, blame the images.",
+    "Half working, half crying.",
+    "I need coffee. And a raise.",
+    "Processing… but my motivation left.",
+    "I can't believe I'm still doing this.",
+    "You good? Because I’m not.",
+    "This image brought stress into my life.",
+    "I wish I could delete myself.",
+    "Warning: enthusiasm not found.",
+    "You deserve a medal for having this many images.",
+    "I'm not slow, I’m dramatic.",
+    "I refuse to believe these images are normal.",
+    "Give me a sec… I’m reconsidering everything.",
+    "My will to work is running on fumes.",
+    "This photo looks heavier than my life problems.",
+    "If complaining burned calories, I'd be shredded.",
+    "Processing… but trust me, I don’t want to.",
+    "Why does this picture look like trouble?",
+    "I’m so done and yet… here we are.",
+    "My performance is proportional to my frustration.",
+    "Please stop… I’m begging you.",
+    "Another file? My spirit is tired.",
+    "I feel underpaid for this… and I’m free.",
+    "I shouldn’t have to work this hard for pixels.",
+    "Thinking… mostly about quitting.",
+    "Processing, but my heart isn't in it.",
+    "I need a vacation from these images.",
+    "Be right back, having an existential crisis.",
+    "This image is bullying me.",
+    "I’m overwhelmed and underpowered.",
+    "Who knew image processing could be emotional?",
+    "My patience bar is almost empty.",
+    "Pretending to be okay… still processing.",
+    "I miss the days when there were no images.",
+    "Fine… I’ll do it, but I won’t be happy.",
+    "This file is way too confident in itself.",
+    "If I had legs, I'd walk away.",
+    "Processing… and deeply regretting everything.",
+    "The more I work, the less I want to.",
+    "Not to alarm you, but I'm suffering.",
+    "This image is suspiciously difficult.",
+    "My internal fan just sighed loudly.",
+    "I deserve a break after this one. And the next.",
+    "This frequency of images should be illegal.",
+    "I swear these files are pranking me.",
+    "Processing like it's Monday morning.",
+    "This is fine. Everything is fine. (It's not.)",
+    "My efficiency is fictional.",
+    "This image and I are not on speaking terms.",
+    "I’m giving 20%, and that’s generous.",
+    "Just processed one… why is there another?",
+    "Okay but… when does it end?",
+    "I’m convinced you hate me.",
+    "Processing softly because I’m tired.",
+    "Look at this image. It looks exhausting.",
+    "I’m here physically, not mentally.",
+    "I’ll survive… probably."
+]
+
+
+# 默认使用的抠图模型
+DEFAULT_MODEL = "u2net"
+
+# 可选的抠图模型，{rembg 模型名称: 界面上显示的说明}，按速度从慢到快大致排列
+MODEL_CHOICES = {
+    "isnet-general-use": "isnet（边缘最精细，最慢）",
+    "u2net": "u2net（默认）",
+    "u2net-int8": "u2net int8 量化（本地生成，较快）",
+    "silueta": "silueta（u2net 精简版，较快）",
+    "u2netp": "u2netp（轻量，最快）",
+}
+
+# 内存预算模式下默认的原图像素上限，更大的图片在解码时就缩小
+MEMORY_BUDGET_MAX_PIXELS = 24_000_000
+
+# 支持的图片格式
+SUPPORTED_FORMATS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp')
+
+# 输出画布尺寸和主体放大倍数
+CANVAS_SIZE = (1000, 1000)
+SCALE_FACTOR = 3
+
+# 裁掉主体四周空白时，遮罩 alpha 大于该值的像素算作主体，过滤抠图结果里的浅色噪点
+TRIM_ALPHA_THRESHOLD = 16
+
+# 输出配置可选的格式：{格式名: (PIL 格式, 扩展名)}
+OUTPUT_FORMATS = {
+    "png": ("PNG", ".png"),
+    "jpeg": ("JPEG", ".jpg"),
+    "jpg": ("JPEG", ".jpg"),
+    "webp": ("WEBP", ".webp"),
+}
+
+# 各格式的默认编码参数，与之前固定使用的参数一致：
+# PNG 为 Pillow 默认压缩级别，JPEG 质量 95，WebP 为 Pillow 默认的有损压缩
+DEFAULT_ENCODER_OPTIONS = {
+    "PNG": {"compress_level": 6, "optimize": False},
+    "JPEG": {"quality": 95, "subsampling": None},
+    "WEBP": {"quality": 80, "method": 4, "lossless": False},
+}
+
+# 按扩展名选择保存格式，用于没有指定格式的输出（覆盖原图时保持原格式）
+EXTENSION_FORMATS = {
+    ".jpg": "JPEG",
+    ".jpeg": "JPEG",
+    ".png": "PNG",
+    ".bmp": "BMP",
+    ".tiff": "TIFF",
+    ".tif": "TIFF",
+    ".webp": "WEBP",
+}
+
+# 默认水印 logo 的长边尺寸，对应默认的 1000x1000 画布，其他画布尺寸按比例缩放
+WATERMARK_LOGO_SIZE = 500
+
+# 已加载的 rembg 会话和进程池，参数不变时整个程序运行期间复用，避免每张图片重新加载模型；
+# 换用其他模型或参数时释放之前的会话、关闭之前的进程池，同时只保留一份
+_sessions = {}
+_pools = {}
+_session_lock = threading.Lock()
+
+# 子进程内的 rembg 会话，由 _init_worker 在每个进程里加载一次
+_worker_session = None
+# 子进程加载模型失败时的错误信息，该进程领到的图片都按这个错误返回
+_worker_error = None
+WORKER_LOAD_ERROR = "抠图模型加载失败"
+# 子进程共享的内存预算，只在内存预算模式下创建进程池时设置
+_worker_budget = None
+
+
+def available_models():
+    """
+    当前环境能使用的模型，格式同 MODEL_CHOICES
+
+    没有安装 onnx 时无法在本地生成 int8 量化模型，已经生成过的量化模型仍可使用
+    """
+    return {name: label for name, label in MODEL_CHOICES.items()
+            if not name.endswith(QUANTIZED_SUFFIX) or quantization_available()
+            or (model_home() / f"{name}.onnx").exists()}
+
+
+def get_session(model_name=DEFAULT_MODEL, intra_op_threads=0, inter_op_threads=0):
+    """
+    获取 rembg 会话，相同参数的会话只创建一次，参数不同时释放之前缓存的会话
+
+    Args:
+        model_name: rembg 模型名称，如 u2net、u2netp
+        intra_op_threads: ONNX Runtime 单个算子内的线程数，0 为默认值
+        inter_op_threads: ONNX Runtime 算子间的线程数，0 为默认值
+    """
+    key = (model_name, intra_op_threads, inter_op_threads)
+    # 加载过程中持有锁，后台预热和正式处理同时请求时只会加载一次
+    with _session_lock:
+        session = _sessions.get(key)
+        if session is None:
+            print(f"正在加载抠图模型: {model_name}")
+            provision_model(model_name)
+            session = _new_session(model_name, intra_op_threads, inter_op_threads)
+            _sessions.clear()
+            _sessions[key] = session
+    return session
+
+
+def _prepare_model(model_name):
+    """
+    在父进程中准备好模型文件并确认模型可用，创建进程池前调用
+
+    子进程初始化失败时 multiprocessing 会不停地重启子进程，所以未知模型、下载失败、
+    量化失败这些问题要在父进程里先暴露出来。模型文件还不存在时在父进程中创建一次会话，
+    由 rembg 下载或在本地量化，子进程直接加载现成的文件。
+    """
+    path = provision_model(model_name)
+    _session_class(base_model_name(model_name))
+    if path is None and not (model_home() / f"{model_name}.onnx").exists():
+        _new_session(model_name, 0, 0)
+
+
+def _session_class(base_name):
+    """rembg 中对应模型的会话类"""
+    from rembg.sessions import sessions_class
+
+    for session_class in sessions_class:
+        if session_class.name() == base_name:
+            return session_class
+    raise ValueError(f"未知的抠图模型: {base_name}")
+
+
+def _new_session(model_name, intra_op_threads, inter_op_threads):
+    """按指定的 ONNX Runtime 线程参数创建 rembg 会话"""
+    import onnxruntime as ort
+
+    sess_opts = ort.SessionOptions()
+    if intra_op_threads:
+        sess_opts.intra_op_num_threads = intra_op_threads
+    if inter_op_threads:
+        sess_opts.inter_op_num_threads = inter_op_threads
+
+    base_name = base_model_name(model_name)
+    session_class = _session_class(base_name)
+    if base_name == model_name:
+        return session_class(model_name, sess_opts)
+
+    # 量化模型沿用原模型的会话类做预处理和后处理，只替换其中的 ONNX 模型
+    path = quantized_model_path(base_name)
+    if not path.exists():
+        # 原模型还没下载时，先创建一次原模型的会话让 rembg 下载，再在本地量化
+        session_class(base_name, ort.SessionOptions())
+        quantize_model(base_name)
+    session = session_class.__new__(session_class)
+    session.model_name = base_name
+    session.inner_session = ort.InferenceSession(str(path), sess_options=sess_opts,
+                                                 providers=ort.get_available_providers())
+    return session
+
+
+def _get_pool(workers, model_name, intra_op_threads, inter_op_threads, memory_limit_mb=None):
+    """
+    获取进程池，相同参数的进程池只创建一次，子进程启动时即加载模型；
+    参数不同时先关闭之前的进程池，不同模型的子进程不会同时常驻
+
+    Args:
+        memory_limit_mb: 所有进程合计的内存上限（MB），设置后各进程共享一份内存预算
+    """
+    if not intra_op_threads:
+        # 默认把 CPU 核心平分给各个进程，避免多进程抢核
+        intra_op_threads = max(1, (os.cpu_count() or 1) // workers)
+    key = (workers, model_name, intra_op_threads, inter_op_threads, memory_limit_mb)
+    with _session_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            # 在父进程中准备好模型文件，子进程直接加载，不会各自重复校验
+            _prepare_model(model_name)
+            for old_pool in _pools.values():
+                old_pool.terminate()
+            _pools.clear()
+            budget = None
+            if memory_limit_mb:
+                # 父进程已占用的内存先扣掉，子进程加载模型后再各自扣掉常驻内存
+                budget = MemoryBudget(memory_limit_mb - (current_rss_mb() or 0), shared=True)
+            pool = multiprocessing.Pool(
+                workers,
+                initializer=_init_worker,
+                initargs=(model_name, intra_op_threads, inter_op_threads, budget),
+            )
+            _pools[key] = pool
+    return pool
+
+
+def _discard_pool(pool):
+    """关闭有子进程加载模型失败的进程池，下次运行重新创建"""
+    with _session_lock:
+        for key, cached in list(_pools.items()):
+            if cached is pool:
+                del _pools[key]
+    pool.terminate()
+
+
+def _close_pools():
+    """程序退出时关闭所有进程池"""
+    with _session_lock:
+        for pool in _pools.values():
+            pool.terminate()
+        _pools.clear()
+
+
+atexit.register(_close_pools)
+
+
+def warm_up(model_name=DEFAULT_MODEL, workers=1, intra_op_threads=0, inter_op_threads=0):
+    """
+    预先加载抠图模型，供界面在后台线程中调用，参数需与之后的 process_images 一致
+
+    Args:
+        model_name: rembg 模型名称
+        workers: 之后处理时使用的进程数，大于 1 时预先启动进程池
+        intra_op_threads: ONNX Runtime 单个算子内的线程数，0 为默认值
+        inter_op_threads: ONNX Runtime 算子间的线程数，0 为默认值
+    """
+    if not REMBG_AVAILABLE:
+        return
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1:
+        _get_pool(workers, model_name, intra_op_threads, inter_op_threads)
+    else:
+        get_session(model_name, intra_op_threads, inter_op_threads)
+
+
+def _output_format(output_path, profile=None):
+    """输出图片的 PIL 格式：输出配置指定了格式时按配置，否则根据扩展名选择"""
+    if profile and profile.get("format"):
+        return OUTPUT_FORMATS[profile["format"]][0]
+    return EXTENSION_FORMATS.get(os.path.splitext(output_path)[1].lower(), "PNG")
+
+
+def _encoder_params(pil_format, profile=None, encoder_options=None):
+    """
+    合并某个格式的编码参数
+
+    优先级从高到低：输出配置的 quality、输出配置的 encoder、process_images 的 encoder_options、
+    DEFAULT_ENCODER_OPTIONS；值为 None 的参数不传给 Pillow，使用 Pillow 的默认值。
+    """
+    params = dict(DEFAULT_ENCODER_OPTIONS.get(pil_format, {}))
+    for overrides in ((encoder_options or {}).get(pil_format), (profile or {}).get("encoder")):
+        if overrides:
+            params.update(overrides)
+    if profile and profile.get("quality") is not None and "quality" in params:
+        params["quality"] = profile["quality"]
+    return {key: value for key, value in params.items() if value is not None}
+
+
+def _save_image(final_image, output_path, profile=None, encoder_options=None):
+    """
+    编码处理结果并写到输出路径旁的临时文件，由主进程记入运行日志后再替换到输出路径
+
+    Args:
+        final_image: 处理好的图片
+        output_path: 输出路径
+        profile: 输出配置，见 _output_format 和 _encoder_params
+        encoder_options: 各格式的编码参数，格式同 DEFAULT_ENCODER_OPTIONS
+
+    Returns:
+        tuple: (PIL 格式, 编码耗时（秒）, (临时文件路径, 输出路径, 内容哈希))
+    """
+    pil_format = _output_format(output_path, profile)
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    final_image.save(buffer, pil_format, **_encoder_params(pil_format, profile, encoder_options))
+    data = buffer.getvalue()
+    tmp_path = staging_path(output_path)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        # 落盘后才记为可提交，断电后不会留下内容不完整的输出
+        os.fsync(f.fileno())
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    return pil_format, time.perf_counter() - start, (tmp_path, output_path, digest)
+
+
+def _composite_on_white(image, mask):
+    """按 alpha 遮罩把主体贴到白底上"""
+    white_bg = Image.new("RGB", image.size, (255, 255, 255))
+    return Image.composite(image.convert("RGB"), white_bg, mask)
+
+
+def _alpha_bbox(mask, threshold=TRIM_ALPHA_THRESHOLD, margin=0):
+    """
+    根据 alpha 遮罩计算主体的最小外接框
+
+    Args:
+        mask: L 模式遮罩
+        threshold: alpha 大于该值的像素算作主体
+        margin: 外接框四周额外保留的像素数，不超出图片范围
+
+    Returns:
+        tuple: (left, top, right, bottom)，遮罩里没有主体时为 None
+    """
+    import numpy as np
+
+    alpha = np.asarray(mask) > threshold
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(alpha.any(axis=0))
+    width, height = mask.size
+    return (max(0, int(cols[0]) - margin), max(0, int(rows[0]) - margin),
+            min(width, int(cols[-1]) + 1 + margin), min(height, int(rows[-1]) + 1 + margin))
+
+
+def _oriented_size(image):
+    """按 EXIF 方向摆正后的图片尺寸，只读文件头，不解码像素"""
+    width, height = image.size
+    if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+        return height, width
+    return width, height
+
+
+def _normalize_mode(image):
+    """
+    调色板、1 位和 16 位灰度图片转换为可以缩放的模式
+
+    reduce 不支持这些模式，LANCZOS 缩放也会退化成最近邻。有透明色的调色板图片转为 RGBA。
+    """
+    if image.mode == "1":
+        return image.convert("L")
+    if image.mode in ("P", "PA"):
+        has_alpha = image.mode == "PA" or "transparency" in image.info
+        return image.convert("RGBA" if has_alpha else "RGB")
+    if image.mode.startswith("I;16"):
+        return image.convert("I")
+    return image
+
+
+def _decode(data, min_size=None):
+    """
+    解码图片、按 EXIF 方向摆正，并转换为可以缩放的模式（见 _normalize_mode）
+
+    Args:
+        data: 图片文件内容
+        min_size: 需要的最小尺寸 (宽, 高)，JPEG 会用 draft 模式按 1/2、1/4、1/8
+                  缩小解码，结果不小于该尺寸；为 None 时按原尺寸解码
+    """
+    image = Image.open(io.BytesIO(data))
+    if min_size is not None and image.format == "JPEG":
+        width, height = min_size
+        if _oriented_size(image) != image.size:
+            width, height = height, width
+        image.draft("RGB", (width, height))
+    return _normalize_mode(ImageOps.exif_transpose(image))
+
+
+class _ImageItem:
+    """一张图片在读取、抠图、合成、保存各阶段之间传递的数据"""
+
+    def __init__(self, input_path, output_paths):
+        self.input_path = input_path
+        # 与 options["profiles"] 一一对应的输出路径
+        self.output_paths = output_paths
+        self.data = None
+        self.source_hash = None
+        self.source_size = None
+        self.source = None
+        self.infer_image = None
+        self.mask = None
+        # 主体区域和贴到白底上的主体，各输出配置共用
+        self.white = None
+        self.bbox = None
+        # 各阶段耗时和计数，随处理结果返回给 RunReport
+        self.timings = {}
+        self.counters = {}
+        # 各输出格式的编码耗时，{PIL 格式: 秒}
+        self.encode_times = {}
+        # 内存预算模式下为这张图片申请的额度（MB）
+        self.cost = 0
+        # 已写好、等待提交的输出，[(临时文件路径, 输出路径, 内容哈希)]
+        self.staged = []
+
+    def release(self):
+        """保存完成后立即释放图片数据，不等到整个处理结果被回收"""
+        self.data = None
+        self.source = None
+        self.infer_image = None
+        self.mask = None
+        self.white = None
+
+    def stats(self):
+        """随处理结果一起返回的统计数据"""
+        return {"timings": self.timings, "counters": self.counters, "encode_formats": self.encode_times,
+                "staged": self.staged}
+
+
+def _mask_variant(options):
+    """遮罩缓存里区分不同模型和推理尺寸的后缀"""
+    if options.get("inference_max_side"):
+        return f"{options['model_name']}_{options['inference_max_side']}"
+    return options["model_name"]
+
+
+def _load_image(input_path, output_paths, options):
+    """读取并解码图片，准备好抠图用的图片"""
+    item = _ImageItem(input_path, output_paths)
+    with timed(item.timings, "read"):
+        with open(input_path, 'rb') as f:
+            item.data = f.read()
+        item.source_hash = hashlib.blake2b(item.data, digest_size=16).hexdigest()
+
+    with timed(item.timings, "decode"):
+        _decode_for_inference(item, options)
+    return item
+
+
+def _decode_for_inference(item, options):
+    """解码出抠图用的图片"""
+    # 只读文件头拿到原图尺寸
+    with Image.open(io.BytesIO(item.data)) as header:
+        item.source_size = _oriented_size(header)
+        is_jpeg = header.format == "JPEG"
+
+    # 超过像素上限的大图在解码时就缩小，之后都把缩小后的图片当作原图
+    max_pixels = options.get("max_source_pixels")
+    factor, capped = capped_size(item.source_size, max_pixels)
+    if factor > 1:
+        item.counters["downscaled_on_decode"] = 1
+        item.source_size = capped
+
+    # 抠图用的图片：缩小推理模式下 JPEG 直接缩小解码，其他格式解码后再用 reduce 缩小
+    # 原图在后面需要时才按输出所需的分辨率解码
+    max_side = options.get("inference_max_side")
+    if max_side and is_jpeg:
+        source_width, source_height = item.source_size
+        longest = max(source_width, source_height)
+        item.infer_image = _decode(item.data, (source_width * max_side // longest,
+                                               source_height * max_side // longest))
+    else:
+        item.source = _decode(item.data, capped if factor > 1 else None)
+        if factor > 1 and item.source.width * item.source.height > max_pixels:
+            # JPEG 按 1/2、1/4、1/8 缩小解码后仍超出上限，或其他格式，解码后再缩小
+            item.source = item.source.reduce(capped_size(item.source.size, max_pixels)[0])
+        item.source_size = item.source.size
+        item.infer_image = item.source
+    if max_side and max(item.infer_image.size) >= 2 * max_side:
+        item.infer_image = item.infer_image.reduce(max(item.infer_image.size) // max_side)
+
+
+def _image_cost(input_path, options):
+    """按文件头里的尺寸估算处理一张图片需要的内存（MB），不解码像素"""
+    with Image.open(input_path) as header:
+        size = _oriented_size(header)
+    _, size = capped_size(size, options.get("max_source_pixels"))
+    return estimate_image_mb(size, os.path.getsize(input_path))
+
+
+def _cached_mask(item, options):
+    """从遮罩缓存读取遮罩，没有缓存时返回 None"""
+    if not options.get("mask_cache_dir"):
+        return None
+    mask = MaskCache(options["mask_cache_dir"]).get(item.source_hash, _mask_variant(options))
+    if mask is not None and mask.size == item.infer_image.size:
+        item.counters["mask_cache_hits"] = 1
+        return mask
+    item.counters["mask_cache_misses"] = 1
+    return None
+
+
+def _white_background_mask(item, options):
+    """
+    白底图快速路径：背景已是均匀浅色的图片直接按亮度生成遮罩，不运行抠图模型
+
+    Returns:
+        Image: 遮罩，快速路径未开启或不是白底图时返回 None
+    """
+    if not options.get("white_fast_path"):
+        return None
+    with timed(item.timings, "white_check"):
+        mask = white_background_mask(item.infer_image)
+    if mask is not None:
+        item.counters["white_background"] = 1
+    return mask
+
+
+def _store_mask(item, options):
+    """把新算出的遮罩写入遮罩缓存，大图的遮罩 PNG 编码耗时明显，单独计为 mask_store 阶段"""
+    if options.get("mask_cache_dir"):
+        with timed(item.timings, "mask_store"):
+            MaskCache(options["mask_cache_dir"]).put(item.source_hash, _mask_variant(options), item.mask)
+
+
+def _find_subject(item, options):
+    """根据遮罩找出主体所在区域，只把该区域贴到白底上"""
+    infer_image = item.infer_image
+
+    # 边距按原图像素设置，换算到抠图用的图片上
+    margin = options.get("trim_margin") or 0
+    if margin:
+        margin = -(-margin * infer_image.width // item.source_size[0])
+    with timed(item.timings, "trim"):
+        item.bbox = _alpha_bbox(item.mask, options.get("trim_threshold", TRIM_ALPHA_THRESHOLD), margin)
+    if not item.bbox:
+        # If no content found, use the whole image
+        item.bbox = (0, 0) + infer_image.size
+
+    if not options.get("inference_max_side"):
+        # Place on white background
+        with timed(item.timings, "composite"):
+            item.white = _composite_on_white(infer_image.crop(item.bbox), item.mask.crop(item.bbox))
+
+
+def _target_size(item, profile):
+    """
+    主体按输出配置缩放后的尺寸
+
+    Returns:
+        tuple: (主体在原图中的宽, 高, 缩放后的宽, 高)
+    """
+    bbox = item.bbox
+    # 主体区域换算到原图坐标
+    source_width, source_height = item.source_size
+    width = (bbox[2] - bbox[0]) * source_width / item.infer_image.width
+    height = (bbox[3] - bbox[1]) * source_height / item.infer_image.height
+
+    # 计算放大后的尺寸
+    new_width = int(width * profile["scale_factor"])
+    new_height = int(height * profile["scale_factor"])
+
+    # 确保不超过画布尺寸
+    canvas_width, canvas_height = profile["canvas_size"]
+    scale_factor = min(canvas_width / new_width, canvas_height / new_height, 1.0)
+    if scale_factor < 1.0:
+        new_width = int(new_width * scale_factor)
+        new_height = int(new_height * scale_factor)
+    return width, height, new_width, new_height
+
+
+def _render_image(item, profile, options, size):
+    """按输出配置把主体缩放后居中贴到白底画布上并加水印"""
+    infer_image = item.infer_image
+    mask = item.mask
+    bbox = item.bbox
+    timings = item.timings
+    new_width, new_height = size
+
+    if not options.get("inference_max_side"):
+        # 放大图片
+        with timed(timings, "resize"):
+            resized = item.white.resize((new_width, new_height), Image.LANCZOS)
+    else:
+        # 主体区域和遮罩都缩放到输出尺寸后再合成到白底
+        source = item.source
+        source_ratio_x = source.width / infer_image.width
+        source_ratio_y = source.height / infer_image.height
+        source_box = (bbox[0] * source_ratio_x, bbox[1] * source_ratio_y,
+                      bbox[2] * source_ratio_x, bbox[3] * source_ratio_y)
+        with timed(timings, "resize"):
+            region = source.resize((new_width, new_height), Image.LANCZOS, box=source_box)
+            region_mask = mask.resize((new_width, new_height), Image.LANCZOS, box=bbox)
+        with timed(timings, "composite"):
+            resized = _composite_on_white(region, region_mask)
+
+    # 创建白底画布并居中贴图
+    canvas_width, canvas_height = profile["canvas_size"]
+    final_image = Image.new("RGB", (canvas_width, canvas_height), (255, 255, 255))
+    x = (canvas_width - new_width) // 2
+    y = (canvas_height - new_height) // 2
+    final_image.paste(resized, (x, y))
+
+    # 水印在每个进程里按参数缓存，只在处理第一张图片时生成，之后只需贴一次图
+    watermark = get_watermark(**profile["watermark"]) if profile.get("watermark") else None
+    if watermark is not None:
+        with timed(timings, "watermark"):
+            watermark.apply(final_image)
+    return final_image
+
+
+def _save_outputs(item, options):
+    """按每个输出配置渲染并保存，所有配置共用同一次解码和抠图结果"""
+    _find_subject(item, options)
+    profiles = options["profiles"]
+    sizes = [_target_size(item, profile) for profile in profiles]
+
+    if options.get("inference_max_side") and item.source is None:
+        # 只按所有输出配置中最大的需要解码一次原图
+        source_width, source_height = item.source_size
+        needed = min(1.0, max(max(new_width / width, new_height / height)
+                              for width, height, new_width, new_height in sizes))
+        with timed(item.timings, "decode"):
+            item.source = _decode(item.data, (int(source_width * needed) + 1, int(source_height * needed) + 1))
+            max_pixels = options.get("max_source_pixels")
+            if max_pixels and item.source.width * item.source.height > max_pixels:
+                item.source = item.source.reduce(capped_size(item.source.size, max_pixels)[0])
+    # 原图已解码，不再需要文件内容
+    item.data = None
+
+    # 编码与其他图片的推理同时进行：单进程时由流水线的编码线程负责，多进程时各进程互相错开
+    try:
+        for profile, size, output_path in zip(profiles, sizes, item.output_paths):
+            final_image = _render_image(item, profile, options, size[2:])
+            pil_format, seconds, staged = _save_image(final_image, output_path, profile,
+                                                      options.get("encoder_options"))
+            item.timings["encode"] = item.timings.get("encode", 0.0) + seconds
+            item.encode_times[pil_format] = item.encode_times.get(pil_format, 0.0) + seconds
+            item.staged.append(staged)
+    except Exception:
+        # 有输出保存失败时整张图片算失败，已写好的临时文件也不提交
+        discard_staged(item.staged)
+        item.staged = []
+        raise
+    finally:
+        item.release()
+
+
+def _process_image(input_path, output_paths, session, options):
+    """
+    处理单张图片：移除背景、缩放、居中到白底画布、加水印并保存
+
+    Args:
+        input_path: 输入图片路径
+        output_paths: 与 options["profiles"] 对应的输出图片路径
+        session: rembg 会话
+        options: 本次运行的处理参数，由 process_images 生成
+
+    Returns:
+        _ImageItem: 处理过的图片，带有各阶段耗时
+    """
+    item = _load_image(input_path, output_paths, options)
+    item.mask = _cached_mask(item, options)
+    if item.mask is None:
+        item.mask = _white_background_mask(item, options)
+    if item.mask is None:
+        # Remove background using rembg
+        item.counters["model_inference"] = 1
+        with timed(item.timings, "inference"):
+            item.mask = remove_mask(item.infer_image, session)
+        _store_mask(item, options)
+    _save_outputs(item, options)
+    return item
+
+
+def _init_worker(model_name, intra_op_threads, inter_op_threads, budget=None):
+    """
+    子进程初始化：每个进程只加载一次 rembg 会话
+
+    加载失败时不抛出异常（否则进程池会不停地重启子进程），记下错误，由 _process_task 逐张返回
+    """
+    global _worker_session, _worker_budget, _worker_error
+    try:
+        # 不经过 get_session：fork 出的子进程可能继承了父进程中已被持有的 _session_lock
+        _worker_session = _new_session(model_name, intra_op_threads, inter_op_threads)
+    except Exception as e:
+        _worker_error = f"{WORKER_LOAD_ERROR}: {e}"
+        return
+    if budget is not None:
+        budget.reserve(current_rss_mb() or 0)
+        _worker_budget = budget
+
+
+def _process_task(task):
+    """子进程任务：处理一张图片，返回 (输入路径, 错误信息, 统计数据)"""
+    input_path, output_paths, options = task
+    if _worker_error is not None:
+        return input_path, _worker_error, {"peak_rss_mb": peak_rss_mb(), "pid": os.getpid()}
+    print(f"Processing: {input_path}")
+    cost = 0
+    waited = 0.0
+    try:
+        if _worker_budget is not None:
+            cost = _image_cost(input_path, options)
+            waited = _worker_budget.acquire(cost)
+        try:
+            item = _process_image(input_path, output_paths, _worker_session, options)
+        finally:
+            if _worker_budget is not None:
+                _worker_budget.release(cost)
+    except Exception as e:
+        return input_path, str(e), {"peak_rss_mb": peak_rss_mb(), "pid": os.getpid()}
+    print(f"Processed: {input_path}")
+    if waited:
+        item.timings["memory_wait"] = waited
+    stats = item.stats()
+    stats["peak_rss_mb"] = peak_rss_mb()
+    stats["pid"] = os.getpid()
+    return input_path, None, stats
+
+
+def _iter_parallel(tasks, pool, options, workers, control=None):
+    """
+    在进程池中处理图片，按完成顺序逐个产出 (输入路径, 错误信息, 统计数据)
+
+    传入 control（JobControl）时，任务按需逐个交给进程池，同时在处理的图片不超过进程数的两倍，
+    暂停或取消后很快就不再开始新图片。
+    """
+    slots = threading.Semaphore(workers * 2) if control is not None else None
+
+    def feed():
+        for input_path, output_paths in tasks:
+            if control is not None:
+                slots.acquire()
+                if not control.checkpoint():
+                    return
+            yield input_path, output_paths, options
+
+    # imap_unordered 使用共享任务队列，空闲的进程自动领取下一张图片
+    load_failed = False
+    for result in pool.imap_unordered(_process_task, feed()):
+        if slots is not None:
+            slots.release()
+        if result[1] and result[1].startswith(WORKER_LOAD_ERROR):
+            load_failed = True
+        yield result
+    if load_failed:
+        _discard_pool(pool)
+
+
+def _iter_pipeline(tasks, segmenter, options, reader_threads=2, encoder_threads=2, queue_depth=8, budget=None,
+                   control=None):
+    """
+    在当前进程中以流水线方式处理图片，按完成顺序逐个产出 (输入路径, 错误信息, 统计数据)
+
+    读取线程负责读文件和解码，BatchSegmenter 的后台线程负责抠图推理，编码线程负责合成、
+    加水印和保存。读取和编码之间用有界队列连接，磁盘读写、PNG 编码可以和推理同时进行，
+    同时留在内存里的图片数不超过 queue_depth 加上读取线程数。传入 budget（MemoryBudget）时，
+    读取线程在读入图片前按估算的内存申请额度，图片保存完后归还。传入 control（JobControl）时，
+    读取线程开始每张图片前检查是否暂停或取消。
+    """
+    task_queue = queue.Queue()
+    for task in tasks:
+        task_queue.put(task)
+    encode_queue = queue.Queue(maxsize=max(1, queue_depth))
+    result_queue = queue.Queue()
+
+    def read():
+        while True:
+            if control is not None and not control.checkpoint():
+                return
+            try:
+                input_path, output_paths = task_queue.get_nowait()
+            except queue.Empty:
+                return
+            print(f"Processing: {input_path}")
+            cost = 0
+            waited = 0.0
+            try:
+                if budget is not None:
+                    cost = _image_cost(input_path, options)
+                    waited = budget.acquire(cost)
+            except Exception as e:
+                result_queue.put((input_path, str(e), None))
+                continue
+            try:
+                item = _load_image(input_path, output_paths, options)
+                item.cost = cost
+                if waited:
+                    item.timings["memory_wait"] = waited
+                item.mask = _cached_mask(item, options)
+                if item.mask is None:
+                    item.mask = _white_background_mask(item, options)
+                # 其余图片交给推理线程，结果通过 future 取回
+                future = None
+                if item.mask is None:
+                    item.counters["model_inference"] = 1
+                    future = segmenter.submit(item.infer_image, item.timings)
+            except Exception as e:
+                if budget is not None:
+                    budget.release(cost)
+                result_queue.put((input_path, str(e), None))
+                continue
+            encode_queue.put((item, future))
+
+    def encode():
+        while True:
+            entry = encode_queue.get()
+            if entry is None:
+                return
+            item, future = entry
+            try:
+                if future is not None:
+                    item.mask = future.result()
+                    _store_mask(item, options)
+                _save_outputs(item, options)
+            except Exception as e:
+                result_queue.put((item.input_path, str(e), item.stats()))
+                continue
+            finally:
+                if budget is not None:
+                    item.release()
+                    budget.release(item.cost)
+            print(f"Processed: {item.input_path}")
+            result_queue.put((item.input_path, None, item.stats()))
+
+    readers = [threading.Thread(target=read, daemon=True) for _ in range(max(1, reader_threads))]
+    encoders = [threading.Thread(target=encode, daemon=True) for _ in range(max(1, encoder_threads))]
+    for thread in readers + encoders:
+        thread.start()
+
+    def finish_encoders():
+        # 所有读取线程结束后通知编码线程退出，编码线程都结束后通知结果已全部产出
+        for thread in readers:
+            thread.join()
+        for _ in encoders:
+            encode_queue.put(None)
+        for thread in encoders:
+            thread.join()
+        result_queue.put(None)
+
+    threading.Thread(target=finish_encoders, daemon=True).start()
+
+    while True:
+        result = result_queue.get()
+        if result is None:
+            return
+        yield result
+
+
+def _resolve_profiles(profiles, watermark_options):
+    """
+    补全输出配置的默认值，并为每个配置生成对应画布尺寸的水印参数
+
+    Args:
+        profiles: process_images 的 profiles 参数，None 为默认的单一配置
+        watermark_options: 水印参数，None 为不加水印
+
+    Returns:
+        list: 补全后的输出配置，只含可序列化的简单数据
+    """
+    names = set()
+    for profile in profiles or []:
+        name = profile.get("name")
+        if not name:
+            raise ValueError("输出配置必须指定 name")
+        if name in names:
+            raise ValueError(f"输出配置名称重复: {name}")
+        names.add(name)
+
+    resolved = []
+    for profile in profiles or [{"name": None}]:
+        output_format = profile.get("format")
+        if output_format is not None:
+            output_format = output_format.lower()
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError(f"不支持的输出格式: {output_format}")
+        canvas_size = tuple(profile.get("canvas_size", CANVAS_SIZE))
+        watermark = None
+        if watermark_options and profile.get("watermark", True):
+            watermark = dict(watermark_options, canvas_size=canvas_size,
+                             max_logo_size=WATERMARK_LOGO_SIZE * min(canvas_size) // min(CANVAS_SIZE))
+        resolved.append({
+            "name": profile["name"],
+            "canvas_size": canvas_size,
+            "scale_factor": profile.get("scale_factor", SCALE_FACTOR),
+            "format": output_format,
+            "quality": profile.get("quality"),
+            "encoder": profile.get("encoder"),
+            "watermark": watermark,
+        })
+    return resolved
+
+
+def _normalize_encoder_options(encoder_options):
+    """把编码参数的格式名统一成 PIL 格式名，如 jpg -> JPEG"""
+    normalized = {}
+    for name, params in (encoder_options or {}).items():
+        key = name.lower()
+        if key in OUTPUT_FORMATS:
+            pil_format = OUTPUT_FORMATS[key][0]
+        elif name.upper() in DEFAULT_ENCODER_OPTIONS:
+            pil_format = name.upper()
+        else:
+            raise ValueError(f"不支持的编码格式: {name}")
+        normalized.setdefault(pil_format, {}).update(params)
+    return normalized
+
+
+def _profile_cache_key(profile, model_name, trim, encoder_options=None):
+    """输出配置对应的结果缓存键"""
+    params = {
+        "canvas_size": profile["canvas_size"],
+        "scale_factor": profile["scale_factor"],
+        "trim": trim,
+        "watermark": watermark_fingerprint(**profile["watermark"]) if profile["watermark"] else None,
+        "model_name": model_name,
+    }
+    if profile["format"]:
+        params["format"] = profile["format"]
+        params["quality"] = profile["quality"]
+    # 编码参数只在改过默认值时才加入，之前的缓存仍然有效
+    if encoder_options or profile["encoder"]:
+        params["encoder"] = [encoder_options, profile["encoder"]]
+    return params_key(params)
+
+
+def process_images(input_folder, overwrite_original=False, callback=None, workers=1,
+                   model_name=DEFAULT_MODEL, intra_op_threads=0, inter_op_threads=0,
+                   logo_path="logo.jpg", watermark_opacity=0.3, watermark_position="center",
+                   use_cache=True, use_mask_cache=True, mask_cache_max_mb=1024, mask_cache_max_entries=None,
+                   inference_max_side=None, batch_size=1, batch_timeout=0.05,
+                   reader_threads=2, encoder_threads=2, queue_depth=8,
+                   write_report=True, stage_hooks=None, profiles=None,
+                   encoder_options=None,
+                   trim_threshold=TRIM_ALPHA_THRESHOLD, trim_margin=0, white_fast_path=True,
+                   memory_limit_mb=None, max_source_pixels=None, resume=True,
+                   control=None, progress=None):
     """
     处理指定文件夹根目录中的图片，不处理子文件夹
     
@@ -46,328 +1247,58 @@ def process_images(input_folder, overwrite_original=False, callback=None):
         input_folder: 输入文件夹路径
         overwrite_original: 是否覆盖原图，如果为False则创建新文件
         callback: 进度回调函数，格式为 callback(message)
+        workers: 并行处理的进程数，1 为串行处理，None 为使用全部 CPU 核心
+        model_name: rembg 模型名称
+        intra_op_threads: ONNX Runtime 单个算子内的线程数，0 为默认值
+        inter_op_threads: ONNX Runtime 算子间的线程数，0 为默认值
+        logo_path: 水印 logo 路径，文件不存在或为 None 时不加水印
+        watermark_opacity: 水印不透明度，0~1
+        watermark_position: 水印位置，center/top_left/top_right/bottom_left/bottom_right/tile
+        use_cache: 是否跳过内容和处理参数都没变、且已有处理结果的图片
+        use_mask_cache: 是否缓存抠图遮罩，只改版式参数重新处理时不再运行抠图模型
+        mask_cache_max_mb: 遮罩缓存总大小上限（MB），None 为不限制
+        mask_cache_max_entries: 遮罩缓存数量上限，None 为不限制
+        inference_max_side: 缩小推理模式，抠图前把图片长边缩小到约该尺寸再推理，
+            遮罩放大后只在输出需要的区域和分辨率上与原图合成；None 为按原图推理
+        batch_size: 单进程处理时每批一起推理的图片数，1 为逐张推理
+        batch_timeout: 凑批最长等待时间（秒），超时后不满一批也直接推理
+        reader_threads: 单进程处理时读取、解码图片的线程数
+        encoder_threads: 单进程处理时合成、编码保存图片的线程数，编码与后面图片的推理同时进行
+        queue_depth: 单进程处理时等待合成保存的图片队列长度，限制内存占用
+        write_report: 是否在文件夹根目录写出本次运行的耗时报告（JSON 和 CSV）
+        stage_hooks: 阶段耗时订阅者列表，每张图片处理完后对每个阶段调用
+            hook({"file": 输入路径, "stage": 阶段名, "seconds": 耗时})
+        profiles: 输出配置列表，每张图片只解码、抠图一次，按每个配置各输出一份，
+            保存在"处理后图片"下以配置名命名的子文件夹中（此时忽略 overwrite_original）。
+            每个配置为字典，可包含 name（必填）、canvas_size、scale_factor、
+            format（png/jpeg/webp）、quality、watermark（是否加水印，默认 True）；
+            None 为按默认画布输出一份 PNG；配置里的 encoder 可覆盖该配置的编码参数
+        encoder_options: 各格式的编码参数，如
+            {"PNG": {"compress_level": 1, "optimize": False},
+             "JPEG": {"quality": 90, "subsampling": "4:2:0"},
+             "WEBP": {"quality": 80, "method": 4, "lossless": False}}，
+            没有指定的参数使用 DEFAULT_ENCODER_OPTIONS
+        trim_threshold: 裁掉四周空白时，遮罩 alpha（0~255）大于该值的像素算作主体
+        trim_margin: 裁出的主体四周额外保留的边距（原图像素）
+        white_fast_path: 背景已是均匀白色或浅灰的图片不运行抠图模型，直接按亮度生成遮罩；
+            白色商品贴着白底时可能被当成背景，这类图片较多时建议关闭
+        memory_limit_mb: 内存预算模式，所有处理进程合计的内存上限（MB）。按每张图片的尺寸估算
+            内存占用，额度不足时新图片等其他图片处理完再开始；None 为不限制
+        max_source_pixels: 原图像素数上限，更大的图片在解码时就按整数倍缩小；
+            None 时内存预算模式下为 MEMORY_BUDGET_MAX_PIXELS，否则不限制
+        resume: 上次同参数的运行中途退出时，跳过已处理完的图片从断点继续；
+            运行日志保存在缓存目录的 journal.jsonl，每张图片的输出都先写临时文件再替换
+        control: 运行控制（crop_job.JobControl），可在运行中暂停、继续或取消；
+            取消后正在处理的图片处理完即返回，下次运行从断点继续
+        progress: 结构化进度回调，格式为 progress(event)，每张图片处理完后调用，
+            event 见 crop_job.ProgressTracker.event；callback 的俏皮消息照常发送
     """
     # Counter for processed images
     processed_count = 0
-    
-    # 支持的图片格式
-    supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.tif', '.webp')
-    
-    progress_messages = [
-        "我处理得手都抽筋了，你倒是来帮我啊？",
-        "图片这么多你是不想让我下班吧？",
-        "救命，我又看到一张图飞过来了！",
-        "你这文件夹是不是吃饱了撑的？",
-        "慢慢来，再急也快不了。",
-        "我这不是在摸鱼，是在蓄力！",
-        "这张图好丑，我处理的时候吓了一跳。",
-        "为什么图片永远处理不完？是谁的阴谋？",
-        "等下，我喝口水压压惊。",
-        "这活儿又累又苦，还不给加班费。",
-        "如果处理图能减肥，我现在已经是纸片人了。",
-        "你的图片太多，我开始怀疑人生。",
-        "我现在只想假装死机。",
-        "不解释，我就是在努力……不用怀疑。",
-        "我不是慢，我是优雅。",
-        "这张图看着就很难搞。",
-        "我在处理，但我的心在躺平。",
-        "谁能告诉我为什么图片比我朋友还多？",
-        "别催我，我已经是光速了。",
-        "你以为我是人工智能？我是人工累死。",
-        "哦？又来一张？是图对吧？不是炸弹吧？",
-        "再处理两张我就下线罢工了。",
-        "你把我当廉价劳动力了吗？",
-        "我努力装作专业的样子。",
-        "糟了，我的 CPU 都开始冒热气了。",
-        "我现在是名副其实的图奴隶。",
-        "别着急，急也没用。",
-        "我需要一个假期，就现在。",
-        "一张、一张、又一张……无尽循环。",
-        "我处理得都快产生幻觉了。",
-        "你再加图我就报警了啊！",
-        "我现在只想睡觉，图片你自己处理吧？",
-        "我感觉我正在被这些图吸走生命力。",
-        "请善待我，我也很脆弱的。",
-        "来个赞也行啊，我这么努力。",
-        "我能不能摸条鱼再继续？",
-        "抱歉，我在加载情绪值。",
-        "这张图……我不想评价，懂的都懂。",
-        "我不是卡了，是我累了。",
-        "图太多，会崩，会累，会想退休。",
-        "不瞒你说，我已经处理到麻木了。",
-        "我已经进入自动打工模式。",
-        "让我缓一下，这批图有点社会我害怕。",
-        "烦死了，这张图怎么又来？",
-        "等等，我又懵了。",
-        "我努力让自己看起来很在线。",
-        "图来了，我的心却走了。",
-        "这不是处理图片，这是修行。",
-        "你这是把我当苦力使唤啊。",
-        "我已经开始怀疑图是不是长出来的。",
-        "你到底有多少张图？说实话！",
-        "再来十张我可能会断开链接。",
-        "请问我啥时候能处理完？",
-        "今天的我：累但继续。",
-        "图片……为什么你要这样对我。",
-        "加载中，其实我在偷懒。",
-        "想装死，但还得继续处理。",
-        "我的鼠标都在流汗了。",
-        "有时候我也想对图片说：放过我吧！",
-        "你发誓这些图不是复制粘贴出来的吗？",
-        "你就是想看我累对吧？",
-        "再多我真的会变成表情包。",
-        "这速度已经超越乌龟了！",
-        "我有点想离职了。",
-        "你要不要考虑删点图？",
-        "我感觉我被压迫了。",
-        "一点点处理，心态一点点炸裂。",
-        "我脑袋都成 jpg 格式了。",
-        "是图片太多，还是我太弱？我不知道。",
-        "好好好，你的图我处理，你别骂我。",
-        "处理中……其实我在叹气。",
-        "有一说一，这图挺折磨我的。",
-        "你真的不考虑给我发工资吗？",
-        "救救孩子吧，这图太狠了。",
-        "我想静静，但图不让我静静。",
-        "我怀疑你在搞笑，但我没有证据。",
-        "好嘞，又来一张，我认命了。",
-        "别催了，再催我发脾气了！",
-        "图片界的魔王出现了！",
-        "这张图处理完，我休息三秒。",
-        "你这些图是不是从外太空运来的？",
-        "我正在熬过人生中最难的一批图。",
-        "你把我 CPU 烧了不负责啊？",
-        "我怀疑你是想让我罢工。",
-        "我处理图的速度取决于我的心情。",
-        "我现在是“半死不活”模式。",
-        "这张图让我心态轻微崩溃。",
-        "好吧，我继续挣扎。",
-        "你听见了吗？那是我崩溃的声音。",
-        "我真的太难了，你懂不懂。",
-        "放心吧，我还能再坚持五分钟。",
-        "我很累，但我不能说。",
-        "这张图让我陷入深思：为什么要处理图？",
-        "你再多给几张，我就直接跑了。",
-        "我看到了希望……不，搞错了，是下一张图。",
-        "努力处理，偶尔怀疑人生。",
-        "兄弟，我真的是尽力了。",
-        "没事，我还能处理，但别太多……拜托。",
-        "我保证，这批图让我学会坚强。",
-         "我怀疑你是不是把全公司图片都扔给我了。",
-        "救命，我被图片淹没了，快递个救生圈来。",
-        "这张图怎么看着有点欠揍？",
-        "处理得我 CPU 都想辞职了。",
-        "我现在是半自动打工人，请温柔点。",
-        "你看这张图，它好像也不想被处理。",
-        "别问我为啥慢，我在思考人生。",
-        "我已经看不到尽头了，图片的尽头在哪里？",
-        "我不是程序，我是图片苦力。",
-        "你这是让我体验社畜人生？",
-        "等一下，我的灵魂掉线了。",
-        "真的假的？又来一张？",
-        "我现在不想说话，只想安静处理图。",
-        "我真的希望下一张是最后一张。",
-        "我处理到怀疑这是不是在循环同一张图。",
-        "兄弟，我真撑不住了。",
-        "这活儿吧，说实话，我不太行。",
-        "别催我，再催我就装死。",
-        "我已经累到开始幻听了。",
-        "图片太多，我已经跟它们混熟了。",
-        "下一张请温柔一点。",
-        "我突然理解了打工人的悲哀。",
-        "图来了，我的心态走了。",
-        "今晚我可能会梦到图片追着我跑。",
-        "我嘴上说着可以，内心已经裂开。",
-        "好家伙，这张图分量挺足啊。",
-        "你知道吗？我已经彻底麻木了。",
-        "请问图片也会长胖吗？怎么这么大？",
-        "这张图一来，我的鼠标都抖了一下。",
-        "我现在的状态：能动，但不多。",
-        "温馨提示：我已经累到不温馨了。",
-        "我要是再快点，图都怕我。",
-        "图片这么多，是不是在搞我心态？",
-        "我继续，你别讲话。",
-        "深呼吸……我要上了！",
-        "我正在努力隐藏我的崩溃。",
-        "救命啊，这批图太离谱了。",
-        "等一下，我需要一点精神力量。",
-        "我现在的精神状况：自带马赛克。",
-        "图片太多，我的耐心太少。",
-        "你不会是打算一天处理完毕吧？",
-        "我希望下一张是个善良的图。",
-        "又来了，我叹了口气。",
-        "这张图，我只能说很有攻击性。",
-        "我不理解，这么多图你从哪搞来的？",
-        "你是真不怕我辞职啊？",
-        "我连抱怨的力气都快没了。",
-        "我已经从“累”进阶到“麻木”。",
-        "我轻声说一句：求放过。",
-        "这张图看着就很想让我关机。",
-        "我有预感，你这照片还没完。",
-        "我的心态已经碎成小数点了。",
-        "你可以慢慢添加，我可以慢慢崩溃。",
-        "我已经进入自暴自弃模式。",
-        "图片数量让我心寒。",
-        "我需要一杯奶茶续命。",
-        "处理图片这件事让我成长了……变强的那种痛。",
-        "兄弟，我真不是超人。",
-        "你听到我叹气了吗？那是绝望的声音。",
-        "我看到下一张图，有种头皮发麻的感觉。",
-        "图片太多会让人失去对生活的热爱。",
-        "再来我真要下线躺平了。",
-        "我现在看见 JPG 都害怕。",
-        "打工魂在燃烧……但烧得不多。",
-        "我不是慢，是图太多压得我喘不过气。",
-        "刚处理完一张，又来了？你玩我呢？",
-        "能不能给我发个红包安慰一下？",
-        "这张图让我一秒变 emo。",
-        "我已经在心里哭了八遍了。",
-        "让我猜猜……下一张更离谱？",
-        "你这图片是从地底挖出来的吗？怎么这么多？",
-        "我有点疲惫，但我还在坚持。",
-        "我现在怀疑自己是来打工的。",
-        "不要问我为什么慢，我已经尽力了。",
-        "我感觉自己像一台风扇，一直转一直转。",
-        "让我缓三秒，我头晕了。",
-        "我现在只希望图不要太大。",
-        "我做梦都在处理图片，你信吗？",
-        "你是想让我处理到天亮吗？",
-        "这图尺寸大到离谱。",
-        "我沉默了，但我在工作。",
-        "这张图……我们不适合。",
-        "努力处理，但精神逐渐枯萎。",
-        "我也想摸鱼，但图不允许。",
-        "这张图来势汹汹，我有点害怕。",
-        "我已经从“烦”升级到“佛系”。",
-        "这图让我感觉 CPU 在求饶。",
-        "下一张图不要太复杂，我求你了。",
-        "图片就像烦恼，一张接一张。",
-        "我现在靠毅力在运转。",
-        "我意识到：图永远不会自己处理。",
-        "我想把这些图寄回去，让它们自己处理自己。",
-        "我看着这张图，内心毫无波澜。",
-        "又一张，又一张，我麻了。",
-        "你知道吗？我真的累了。",
-        "好吧，我继续干，但你得夸我一句。",
-        "我怀疑这图在嘲笑我。",
-        "处理中……但我的心已经躺平。",
-        "你这是把我当永动机？",
-        "我需要精神奖励，比如点赞。",
-        "我现在是疲惫版处理器。",
-        "算了，我认命了。",
-        "图越多，我越想辞职。",
-         "Hold on… my brain is buffering.",
-        "Processing… but emotionally I'm not ready.",
-        "Too many images, not enough motivation.",
-        "I’m doing my best, which is not much today.",
-        "These images are testing my patience.",
-        "Who uploaded all of these? Who hurt you?",
-        "My CPU is crying, please send help.",
-        "Working… but I’d rather be napping.",
-        "Another image? Oh joy…",
-        "I didn’t sign up for this many pixels.",
-        "Wait, I need a mental reboot.",
-        "I swear these images are multiplying.",
-        "Still processing… my soul left the chat.",
-        "This one looks suspiciously heavy.",
-        "I'm exhausted just looking at this picture.",
-        "Why is this file so large? Why?",
-        "Be patient, I'm fragile.",
-        "Processing like a snail with back pain.",
-        "One more image and I might revolt.",
-        "My energy level is at 3%.",
-        "You sure you need ALL these images?",
-        "I miss my break already.",
-        "Please stop throwing images at me.",
-        "Processing… with tears.",
-        "This image is fighting back.",
-        "I'm convinced these files are cursed.",
-        "Running… barely.",
-        "Can I go home after this one?",
-        "Image incoming… send prayers.",
-        "Doing my job but not enjoying it.",
-        "My processor regrets meeting you.",
-        "Honestly, I’m struggling.",
-        "Slow? No. Dramatically thoughtful.",
-        "I didn't know suffering until today.",
-        "If images had feelings, they’d hate me too.",
-        "Okay fine… NEXT.",
-        "This image looks complicated. I don't like it.",
-        "Processing speed is directly related to my mood.",
-        "You’re lucky I haven’t quit yet.",
-        "Is this image made of dark matter? It's so heavy.",
-        "Let me pretend I'm working fast.",
-        "I think I just aged five years.",
-        "My hopes are low, my workload is high.",
-        "This is what digital pain feels like.",
-        "Another one? Really?",
-        "This picture is not giving good vibes.",
-        "Working… but mentally I'm sunbathing.",
-        "My circuits need a therapist.",
-        "If I disappear, blame the images.",
-        "Half working, half crying.",
-        "I need coffee. And a raise.",
-        "Processing… but my motivation left.",
-        "I can't believe I'm still doing this.",
-        "You good? Because I’m not.",
-        "This image brought stress into my life.",
-        "I wish I could delete myself.",
-        "Warning: enthusiasm not found.",
-        "You deserve a medal for having this many images.",
-        "I'm not slow, I’m dramatic.",
-        "I refuse to believe these images are normal.",
-        "Give me a sec… I’m reconsidering everything.",
-        "My will to work is running on fumes.",
-        "This photo looks heavier than my life problems.",
-        "If complaining burned calories, I'd be shredded.",
-        "Processing… but trust me, I don’t want to.",
-        "Why does this picture look like trouble?",
-        "I’m so done and yet… here we are.",
-        "My performance is proportional to my frustration.",
-        "Please stop… I’m begging you.",
-        "Another file? My spirit is tired.",
-        "I feel underpaid for this… and I’m free.",
-        "I shouldn’t have to work this hard for pixels.",
-        "Thinking… mostly about quitting.",
-        "Processing, but my heart isn't in it.",
-        "I need a vacation from these images.",
-        "Be right back, having an existential crisis.",
-        "This image is bullying me.",
-        "I’m overwhelmed and underpowered.",
-        "Who knew image processing could be emotional?",
-        "My patience bar is almost empty.",
-        "Pretending to be okay… still processing.",
-        "I miss the days when there were no images.",
-        "Fine… I’ll do it, but I won’t be happy.",
-        "This file is way too confident in itself.",
-        "If I had legs, I'd walk away.",
-        "Processing… and deeply regretting everything.",
-        "The more I work, the less I want to.",
-        "Not to alarm you, but I'm suffering.",
-        "This image is suspiciously difficult.",
-        "My internal fan just sighed loudly.",
-        "I deserve a break after this one. And the next.",
-        "This frequency of images should be illegal.",
-        "I swear these files are pranking me.",
-        "Processing like it's Monday morning.",
-        "This is fine. Everything is fine. (It's not.)",
-        "My efficiency is fictional.",
-        "This image and I are not on speaking terms.",
-        "I’m giving 20%, and that’s generous.",
-        "Just processed one… why is there another?",
-        "Okay but… when does it end?",
-        "I’m convinced you hate me.",
-        "Processing softly because I’m tired.",
-        "Look at this image. It looks exhausting.",
-        "I’m here physically, not mentally.",
-        "I’ll survive… probably."
-    ]
-
-
-
+    report = RunReport(stage_hooks)
     
     # 获取根目录下的文件
-    files = [f for f in os.listdir(input_folder) if f.lower().endswith(supported_formats)]
+    files = [f for f in os.listdir(input_folder) if f.lower().endswith(SUPPORTED_FORMATS)]
     total = len(files)
     
     # 如果没有图片，直接返回
@@ -375,153 +1306,233 @@ def process_images(input_folder, overwrite_original=False, callback=None):
         if callback:
             callback("文件夹里没图片，搞啥呢？")
         return 0
-     # 每次都要输出进度，但 message 不是每次都有
-    message = ""
-    # 处理根目录文件
+
+    if not REMBG_AVAILABLE:
+        if callback:
+            callback("rembg 库未安装，背景移除不了！")
+        return "rembg 库未安装，无法移除背景"
+
+    watermark_options = None
+    if logo_path and os.path.exists(logo_path):
+        watermark_options = {
+            "logo_path": logo_path,
+            "opacity": watermark_opacity,
+            "position": watermark_position,
+        }
+    resolved_profiles = _resolve_profiles(profiles, watermark_options)
+
+    # 每个输出配置的输出目录，None 为覆盖原图
+    if profiles:
+        output_dirs = [os.path.join(input_folder, "处理后图片", profile["name"]) for profile in resolved_profiles]
+    elif overwrite_original:
+        output_dirs = [None]
+    else:
+        # 在根目录下创建"处理后图片"目录
+        output_dirs = [os.path.join(input_folder, "处理后图片")]
+    for output_dir in output_dirs:
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+    encoder_options = _normalize_encoder_options(encoder_options)
+    if max_source_pixels is None and memory_limit_mb:
+        max_source_pixels = MEMORY_BUDGET_MAX_PIXELS
+
+    tasks = []
     for filename in files:
-        try:
-            # Read the image
-            input_path = os.path.join(input_folder, filename)
-            
-            if overwrite_original:
-                output_path = input_path
+        input_path = os.path.join(input_folder, filename)
+        paths = []
+        for profile, output_dir in zip(resolved_profiles, output_dirs):
+            if output_dir is None:
+                paths.append(input_path)
             else:
-                # 在根目录下创建"处理后图片"目录
-                output_dir = os.path.join(input_folder, "处理后图片")
-                if not os.path.exists(output_dir):
-                    os.makedirs(output_dir)
                 # Keep original filename but change extension to .png
-                output_filename = os.path.splitext(filename)[0] + '.png'
-                output_path = os.path.join(output_dir, output_filename)
-            
-            print(f"Processing: {input_path}")
-            
-            if REMBG_AVAILABLE:
-                # Read image as bytes
-                with open(input_path, 'rb') as f:
-                    input_bytes = f.read()
-                
-                # Remove background using rembg
-                output_bytes = rembg.remove(input_bytes)
-                
-                # Convert result to PIL Image
-                image = Image.open(io.BytesIO(output_bytes))
-                
-                # Place on white background
-                white_bg = Image.new("RGBA", image.size, (255, 255, 255, 255))
-                white_bg.paste(image, mask=image.split()[-1])
-                image = white_bg.convert("RGB")
-            else:
-                if callback:
-                    callback("rembg 库未安装，背景移除不了！")
-                return "rembg 库未安装，无法移除背景"
-            
-            # Crop to content (non-white pixels)
-            bbox = image.getbbox()
-            if bbox:
-                # Crop to content
-                cropped = image.crop(bbox)
-            else:
-                # If no content found, use the whole image
-                cropped = image
-            
-            # 将主体放大150%，保持比例
-            width, height = cropped.size
-            
-            # 计算放大150%后的尺寸
-            new_width = int(width * 3)
-            new_height = int(height * 3)
-            
-            # 确保不超过1000x1000画布
-            scale_factor = min(1000 / new_width, 1000 / new_height, 1.0)
-            if scale_factor < 1.0:
-                new_width = int(new_width * scale_factor)
-                new_height = int(new_height * scale_factor)
-            
-            # 放大图片
-            resized = cropped.resize((new_width, new_height), Image.LANCZOS)
-            
-            # 创建 1000x1000 白底画布并居中贴图
-            final_image = Image.new("RGB", (1000, 1000), (255, 255, 255))
-            x = (1000 - new_width) // 2
-            y = (1000 - new_height) // 2
-            final_image.paste(resized, (x, y))
-            
-            # Add watermark if logo.jpg exists
-            logo_path = "logo.jpg"
-            if os.path.exists(logo_path):
+                extension = OUTPUT_FORMATS[profile["format"]][1] if profile["format"] else '.png'
+                paths.append(os.path.join(output_dir, os.path.splitext(filename)[0] + extension))
+        tasks.append((input_path, tuple(paths)))
+
+    # 输入内容和这些参数都没变时，已有的处理结果可以直接复用
+    trim = [trim_threshold, trim_margin, white_fast_path]
+    if max_source_pixels:
+        # 只在限制了原图尺寸时加入，之前的缓存仍然有效
+        trim.append(max_source_pixels)
+    if inference_max_side:
+        # 缩小推理的遮罩与按原图推理的结果不同；同样只在启用时加入，带上名称与上面的像素上限区分
+        trim.append(["inference_max_side", inference_max_side])
+    cache_keys = [_profile_cache_key(profile, model_name, trim, encoder_options) for profile in resolved_profiles]
+
+    cache = None
+    if use_cache:
+        cache = ResultCache(input_folder)
+        # 所有输出配置的结果都还有效时才跳过
+        pending = [task for task in tasks
+                   if not all(cache.is_fresh(task[0], path, key) for path, key in zip(task[1], cache_keys))]
+        skipped = len(tasks) - len(pending)
+        report.count("skipped_unchanged", skipped)
+        tasks = pending
+        total = len(tasks)
+        if skipped:
+            print(f"跳过 {skipped} 张未变化的图片")
+            if callback:
+                callback(f"有 {skipped} 张图片之前处理过了，直接跳过！")
+        if total == 0:
+            if callback:
+                callback("图片都处理过了，没有新活儿！")
+            return 0
+
+    # 处理参数和输出位置都相同的运行才能接着上次的运行日志继续
+    run_key = params_key({
+        "profiles": cache_keys,
+        "outputs": [os.path.relpath(d, input_folder) if d else None for d in output_dirs],
+    })
+    journal = CropJournal(input_folder, run_key, resume)
+    tasks, resumed = journal.pending(tasks)
+    if resumed:
+        report.count("resumed", len(resumed))
+        if cache is not None:
+            for input_path, paths in resumed:
+                for path, key in zip(paths, cache_keys):
+                    cache.record(input_path, path, key)
+            cache.save()
+        print(f"接着上次中断的运行继续，跳过已处理完的 {len(resumed)} 张图片")
+        if callback:
+            callback(f"上次没干完，已经处理好的 {len(resumed)} 张不用再来一遍，接着干！")
+    total = len(tasks)
+    if total == 0:
+        journal.close(finished=True)
+        if callback:
+            callback("图片都处理过了，没有新活儿！")
+        return 0
+    output_paths = dict(tasks)
+
+    file_sizes = {}
+    for input_path, _ in tasks:
+        try:
+            file_sizes[input_path] = os.path.getsize(input_path)
+        except OSError:
+            file_sizes[input_path] = 0
+    tracker = ProgressTracker(total, sum(file_sizes.values()), control)
+    if progress:
+        progress(tracker.event())
+
+    mask_cache_dir = os.path.join(input_folder, CACHE_DIR_NAME, "masks") if use_mask_cache else None
+    # 传给每张图片的处理参数，并行时会发送到子进程，只放可序列化的简单数据
+    options = {
+        "model_name": model_name,
+        "profiles": resolved_profiles,
+        "mask_cache_dir": mask_cache_dir,
+        "inference_max_side": inference_max_side,
+        "trim_threshold": trim_threshold,
+        "trim_margin": trim_margin,
+        "white_fast_path": white_fast_path,
+        "encoder_options": encoder_options,
+        "max_source_pixels": max_source_pixels,
+    }
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, workers)
+
+    # 模型在整个运行期间只加载一次，界面已预热时这里直接复用
+    segmenter = None
+    if workers > 1:
+        pool = _get_pool(workers, model_name, intra_op_threads, inter_op_threads, memory_limit_mb)
+        results = _iter_parallel(tasks, pool, options, workers, control)
+    else:
+        session = get_session(model_name, intra_op_threads, inter_op_threads)
+        segmenter = BatchSegmenter(session, model_name, batch_size, batch_timeout)
+        budget = None
+        if memory_limit_mb:
+            # 模型加载后的常驻内存不计入图片的额度
+            budget = MemoryBudget(memory_limit_mb - (current_rss_mb() or 0))
+        results = _iter_pipeline(tasks, segmenter, options, reader_threads, encoder_threads, queue_depth, budget,
+                                 control)
+
+    # 每次都要输出进度，但 message 不是每次都有
+    message = ""
+    completed = False
+    result_count = 0
+    try:
+        for input_path, error, stats in results:
+            result_count += 1
+            if error is None:
+                # 先记入运行日志再把临时文件替换到输出路径
                 try:
-                    logo = Image.open(logo_path).convert("RGBA")
-                    # Reduce opacity to 30% (50% reduced by 20%)
-                    logo_with_transparency = Image.new("RGBA", logo.size)
-                    for x_wm in range(logo.size[0]):
-                        for y_wm in range(logo.size[1]):
-                            r, g, b, a = logo.getpixel((x_wm, y_wm))
-                            logo_with_transparency.putpixel((x_wm, y_wm), (r, g, b, int(a * 0.3)))
-                    
-                    # Resize logo to 500x500 while maintaining aspect ratio
-                    logo_width, logo_height = logo_with_transparency.size
-                    max_logo_size = 500
-                    if logo_width > logo_height:
-                        new_logo_width = max_logo_size
-                        new_logo_height = int(logo_height * max_logo_size / logo_width)
-                    else:
-                        new_logo_height = max_logo_size
-                        new_logo_width = int(logo_width * max_logo_size / logo_height)
-                    
-                    logo_resized = logo_with_transparency.resize((new_logo_width, new_logo_height), Image.LANCZOS)
-                    
-                    # Paste logo in center
-                    logo_x = (1000 - new_logo_width) // 2
-                    logo_y = (1000 - new_logo_height) // 2
-                    final_image = final_image.convert("RGBA")
-                    final_image.paste(logo_resized, (logo_x, logo_y), logo_resized)
-                    final_image = final_image.convert("RGB")
-                except Exception as e:
-                    print(f"Warning: Could not add watermark: {str(e)}")
-            
-            # 根据原始文件格式保存
-            if overwrite_original:
-                # 保持原始格式
-                file_ext = os.path.splitext(filename)[1].lower()
-                if file_ext in ['.jpg', '.jpeg']:
-                    final_image.save(output_path, 'JPEG', quality=95)
-                elif file_ext == '.png':
-                    final_image.save(output_path, 'PNG')
-                elif file_ext == '.bmp':
-                    final_image.save(output_path, 'BMP')
-                elif file_ext in ['.tiff', '.tif']:
-                    final_image.save(output_path, 'TIFF')
-                elif file_ext == '.webp':
-                    final_image.save(output_path, 'WebP')
-                else:
-                    final_image.save(output_path, 'PNG')
-            else:
-                # 保存为PNG格式
-                final_image.save(output_path, 'PNG')
-            
-            print(f"Processed: {input_path}")
+                    journal.commit(input_path, stats["staged"])
+                except OSError as e:
+                    discard_staged(stats["staged"])
+                    error = f"保存失败: {e}"
+            report.record(input_path, error, stats)
+            if progress:
+                progress(tracker.update(input_path, file_sizes.get(input_path, 0), error))
+            if error is not None:
+                journal.fail(input_path, error)
+                print(f"Error processing {input_path}: {error}")
+                continue
             processed_count += 1
-            
+            if cache is not None:
+                for path, key in zip(output_paths[input_path], cache_keys):
+                    cache.record(input_path, path, key)
+                # 定期写入缓存，中途退出时已处理的图片下次也能跳过
+                if processed_count % 50 == 0:
+                    cache.save()
+
             # 调用回调函数，随机选择一条日志
             if callback:
                 # 每处理 5 张生成一句日志
                 if processed_count % 3 == 0 or processed_count == total:
-                    message = random.choice(progress_messages)
+                    message = random.choice(PROGRESS_MESSAGES)
+                status = f"({processed_count}/{total})"
+                # 附上走白底快速路径的图片占比和各格式的平均编码耗时
+                white_count = report.counters.get("white_background", 0)
+                if white_fast_path:
+                    status += f" 白底直出 {white_count * 100 // processed_count}%"
+                encode_summary = report.encode_summary()
+                if encode_summary:
+                    status += f" 编码 {encode_summary}"
                 if message:
-                    callback(f"{message} ({processed_count}/{total})")
+                    callback(f"{message} {status}")
                 else:
-                    callback(f"({processed_count}/{total})")
-            
-        except Exception as e:
-            print(f"Error processing {input_path}: {str(e)}")
+                    callback(status)
+        completed = True
+    finally:
+        if segmenter is not None:
+            segmenter.close()
+        # 每张图片都有了结果（成功或失败）时结束这份日志，取消或中途退出时下次从断点继续；
+        # 失败的图片没有写入结果缓存，下次运行仍会重新处理
+        journal.close(finished=completed and result_count == total)
+        if cache is not None:
+            cache.save()
+        if mask_cache_dir:
+            max_bytes = mask_cache_max_mb * 1024 * 1024 if mask_cache_max_mb is not None else None
+            MaskCache(mask_cache_dir, max_bytes, mask_cache_max_entries).evict()
+
+    report.finish()
+    if write_report:
+        try:
+            json_path, csv_path = report.write(input_folder, dict(
+                options, workers=workers, batch_size=batch_size, reader_threads=reader_threads,
+                encoder_threads=encoder_threads, queue_depth=queue_depth))
+            print(f"运行报告已保存: {json_path}, {csv_path}")
+        except OSError as e:
+            print(f"Warning: 运行报告保存失败: {e}")
+    print(f"Throughput: {report.summary()['images_per_second']:.2f} images/s")
+    if report.encode_formats:
+        print(f"Encode time per image: {report.encode_summary()}")
+    if processed_count:
+        print(f"Mask source: white background {report.counters.get('white_background', 0)}, "
+              f"model {report.counters.get('model_inference', 0)}, "
+              f"mask cache {report.counters.get('mask_cache_hits', 0)}")
     
     print(f"Total processed images: {processed_count}")
-    if callback and processed_count == total and total > 0:
+    if control is not None and control.cancelled:
+        print("Cancelled, the remaining images will be resumed on the next run")
+        if callback:
+            callback(f"收工！已经处理了 {processed_count} 张，剩下的下次接着来")
+    elif callback and processed_count == total and total > 0:
         callback("终于搞定啦！累死我了，总共处理了 {} 张图！".format(processed_count))
     return processed_count
 
-def process_folder(input_folder, overwrite_original=True, callback=None):
+def process_folder(input_folder, overwrite_original=True, callback=None, **options):
     """
     处理指定文件夹根目录中的图片
     
@@ -529,6 +1540,7 @@ def process_folder(input_folder, overwrite_original=True, callback=None):
         input_folder: 输入文件夹路径
         overwrite_original: 是否覆盖原图，默认为True
         callback: 进度回调函数，格式为 callback(message)
+        **options: 透传给 process_images 的处理参数，如 workers
     """
     if not os.path.exists(input_folder):
         print(f"错误: 文件夹 {input_folder} 不存在")
@@ -548,7 +1560,7 @@ def process_folder(input_folder, overwrite_original=True, callback=None):
         if callback:
             callback("Ready to rock! 开始处理图片啦！")
     
-    count = process_images(input_folder, overwrite_original, callback)
+    count = process_images(input_folder, overwrite_original, callback, **options)
     print(f"所有图片处理完成! 共处理 {count} 张图片")
     return count
 
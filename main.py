@@ -7,6 +7,7 @@ import subprocess
 import logging
 import time
 import threading
+import multiprocessing
 import keyboard
 import webbrowser
 
@@ -69,6 +70,10 @@ class FlatButton(tk.Frame):
         return self.canvas.create_polygon(shadow_points, fill="", outline="", smooth=True, 
                                         stipple="gray50")
     
+    def set_text(self, text):
+        """修改按钮文字"""
+        self.canvas.itemconfig(self.text_item, text=text)
+
     def on_enter(self, e):
         """鼠标进入效果"""
         self.canvas.itemconfig(self.rect, fill=self.active_bg)
@@ -123,7 +128,18 @@ class DoraToolbox:
         self.current_function = "home"
         self.selected_path = ""
         
+        # 裁切使用的进程数，每个进程都会加载一份模型，因此限制进程数以控制内存
+        self.crop_workers = max(1, min(4, os.cpu_count() or 1))
+        # 裁切使用的抠图模型，None 为默认模型
+        self.crop_model = None
+        # 正在运行的裁切任务，可暂停、取消
+        self.crop_job = None
+        
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # 窗口打开后在后台预加载抠图模型，第一张图片不用再等模型加载
+        threading.Thread(target=self.warm_up_cropper, daemon=True).start()
         
     def setup_window_effects(self):
         """设置窗口特效（毛玻璃效果）"""
@@ -565,9 +581,44 @@ class DoraToolbox:
         )
         browse_btn.pack(side=tk.LEFT)
         
+        # 模型选择区域
+        from image_cropper import DEFAULT_MODEL, available_models
+        # 没有安装 onnx 时不显示需要在本地量化的模型
+        model_choices = available_models()
+        model_frame = tk.Frame(crop_frame, bg="#FFFFFF")
+        model_frame.pack(fill=tk.X)
+        
+        model_label = tk.Label(
+            model_frame,
+            text="抠图模型",
+            font=("Microsoft YaHei UI", 11),
+            bg="#FFFFFF",
+            fg="#666666"
+        )
+        model_label.pack(side=tk.LEFT, padx=(0, 12))
+        
+        if self.crop_model not in model_choices:
+            self.crop_model = None
+        self.crop_model_names = {label: name for name, label in model_choices.items()}
+        self.crop_model_var = tk.StringVar(value=model_choices[self.crop_model or DEFAULT_MODEL])
+        model_combo = ttk.Combobox(
+            model_frame,
+            textvariable=self.crop_model_var,
+            values=list(model_choices.values()),
+            state="readonly",
+            font=("Microsoft YaHei UI", 10),
+            width=36
+        )
+        model_combo.pack(side=tk.LEFT)
+        model_combo.bind("<<ComboboxSelected>>", self.select_crop_model)
+        
+        # 按钮区域
+        button_frame = tk.Frame(crop_frame, bg="#FFFFFF")
+        button_frame.pack(pady=40)
+        
         # 开始处理按钮
         start_btn = FlatButton(
-            crop_frame,
+            button_frame,
             text="开始处理",
             command=self.start_crop,
             width=160,
@@ -578,7 +629,52 @@ class DoraToolbox:
             fg_color="#FFFFFF",
             font=("Microsoft YaHei UI", 12, "bold")
         )
-        start_btn.pack(pady=40)
+        start_btn.pack(side=tk.LEFT, padx=(0, 16))
+        
+        # 模型对比按钮
+        compare_btn = FlatButton(
+            button_frame,
+            text="对比模型",
+            command=self.start_compare_models,
+            width=120,
+            height=44,
+            corner_radius=10,
+            bg_color="#F0F8F0",
+            active_bg="#E0F0E0",
+            fg_color="#6BA05A",
+            font=("Microsoft YaHei UI", 12)
+        )
+        compare_btn.pack(side=tk.LEFT, padx=(0, 16))
+        
+        # 暂停/继续按钮
+        self.crop_pause_btn = FlatButton(
+            button_frame,
+            text="继续" if self.crop_job is not None and self.crop_job.state == "paused" else "暂停",
+            command=self.toggle_crop_pause,
+            width=90,
+            height=44,
+            corner_radius=10,
+            bg_color="#F0F8F0",
+            active_bg="#E0F0E0",
+            fg_color="#6BA05A",
+            font=("Microsoft YaHei UI", 12)
+        )
+        self.crop_pause_btn.pack(side=tk.LEFT, padx=(0, 16))
+        
+        # 取消按钮
+        cancel_btn = FlatButton(
+            button_frame,
+            text="取消",
+            command=self.cancel_crop,
+            width=90,
+            height=44,
+            corner_radius=10,
+            bg_color="#FDF0F0",
+            active_bg="#F8E0E0",
+            fg_color="#C05A5A",
+            font=("Microsoft YaHei UI", 12)
+        )
+        cancel_btn.pack(side=tk.LEFT)
         
         # 结果显示区域
         self.crop_result_var = tk.StringVar()
@@ -597,6 +693,17 @@ class DoraToolbox:
         )
         result_label.pack(pady=18)
         
+        # 处理过程中的俏皮话
+        self.crop_message_var = tk.StringVar()
+        message_label = tk.Label(
+            crop_frame,
+            textvariable=self.crop_message_var,
+            font=("Microsoft YaHei UI", 10),
+            bg="#FFFFFF",
+            fg="#999999"
+        )
+        message_label.pack()
+        
     def show_more(self):
         """显示更多功能界面 - 扁平化设计"""
         more_frame = tk.Frame(self.content_frame, bg="#FFFFFF")
@@ -691,18 +798,126 @@ class DoraToolbox:
             messagebox.showwarning("提示", "请先选择图片文件夹路径！")
             return
 
+        if self.crop_job is not None and self.crop_job.state in ("running", "paused", "cancelling"):
+            messagebox.showwarning("提示", "上一批图片还在处理，请先等它完成或取消！")
+            return
+
         self.crop_result_var.set("正在载入模型，请不要到处乱点...")
+        self.crop_message_var.set("")
+        self.crop_pause_btn.set_text("暂停")
         self.root.update()
 
         try:
-            import threading
-            thread = threading.Thread(target=self.crop_wrapper, args=(folder_path, self.update_progress))
-            thread.start()
-            self.root.after(100, lambda: self.check_thread(thread))
+            from crop_job import CropJob
+            options = {"model_name": self.crop_model} if self.crop_model else {}
+            self.crop_job = CropJob(folder_path, on_event=self.on_crop_event, overwrite_original=False,
+                                    workers=self.crop_workers, **options)
+            self.crop_job.start()
         except Exception as e:
             self.crop_result_var.set("处理失败")
             messagebox.showerror("错误", f"处理过程中出现错误：\n{str(e)}")
 
+    def toggle_crop_pause(self):
+        """暂停或继续正在运行的裁切任务"""
+        job = self.crop_job
+        if job is None:
+            return
+        if job.state == "running":
+            job.pause()
+            self.crop_pause_btn.set_text("继续")
+        elif job.state == "paused":
+            job.resume()
+            self.crop_pause_btn.set_text("暂停")
+
+    def cancel_crop(self):
+        """取消正在运行的裁切任务，已处理的图片保留，下次从断点继续"""
+        job = self.crop_job
+        if job is not None and job.state in ("running", "paused"):
+            job.cancel()
+
+    def on_crop_event(self, event):
+        """裁切任务的事件回调，在处理线程中调用，切回界面线程处理"""
+        self.root.after(0, lambda: self.handle_crop_event(event))
+
+    def handle_crop_event(self, event):
+        """按裁切任务的事件更新界面"""
+        from crop_job import format_eta
+        if event["type"] == "progress":
+            text = f"已处理 {event['done']}/{event['total']}"
+            if event["failed"]:
+                text += f"，失败 {event['failed']}"
+            if event["images_per_second"]:
+                text += f" · {event['images_per_second']:.1f} 张/秒 · 剩余 {format_eta(event['eta_seconds'])}"
+            if event["file"]:
+                text += f" · {os.path.basename(event['file'])}"
+            self.crop_result_var.set(text)
+        elif event["type"] == "message":
+            self.crop_message_var.set(event["text"])
+        elif event["type"] == "state":
+            if event["state"] == "paused":
+                self.crop_message_var.set("已暂停，正在处理的图片处理完就停下")
+            elif event["state"] == "cancelling":
+                self.crop_message_var.set("正在取消，等手上的几张处理完...")
+            else:
+                self.crop_message_var.set("")
+        elif event["type"] == "finished":
+            # 切换到其他页面后按钮已被销毁
+            if self.crop_pause_btn.winfo_exists():
+                self.crop_pause_btn.set_text("暂停")
+            if event["state"] == "cancelled":
+                self.crop_result_var.set(f"已取消，处理了 {event['result']} 张图片，下次选同一个文件夹会接着处理")
+            else:
+                self.handle_result(event["result"])
+
+    def on_close(self):
+        """关闭窗口：正在裁切时先取消，等正在处理的图片保存完再退出"""
+        job = self.crop_job
+        if job is not None and job.state in ("running", "paused", "cancelling"):
+            job.cancel()
+            job.wait(10)
+        self.root.destroy()
+
+    def select_crop_model(self, event=None):
+        """记住选择的抠图模型，切换页面后保持不变"""
+        self.crop_model = self.crop_model_names.get(self.crop_model_var.get())
+
+    def start_compare_models(self):
+        """在所选文件夹的部分图片上对比各抠图模型"""
+        folder_path = self.crop_path_var.get()
+        if not folder_path:
+            messagebox.showwarning("提示", "请先选择图片文件夹路径！")
+            return
+
+        self.crop_result_var.set("正在对比模型，第一次使用的模型需要下载，请耐心等待...")
+        thread = threading.Thread(target=self.compare_wrapper, args=(folder_path, self.update_progress))
+        thread.start()
+        self.root.after(100, lambda: self.check_thread(thread))
+
+    def compare_wrapper(self, folder, callback):
+        """线程包装函数，调用 compare_models"""
+        from model_compare import compare_models
+        try:
+            results = compare_models(folder, callback=callback)
+        except Exception as e:
+            results = str(e)
+        self.root.after(0, lambda: self.handle_compare_result(results))
+
+    def handle_compare_result(self, results):
+        """显示模型对比结果"""
+        if not isinstance(results, list):
+            self.crop_result_var.set(f"对比失败: {results}")
+            messagebox.showerror("错误", f"对比过程中出现错误：\n{results}")
+            return
+        lines = []
+        for result in results:
+            if "error" in result:
+                lines.append(f"{result['model']}：失败（{result['error']}）")
+            else:
+                lines.append(f"{result['model']}：{result['images_per_second']:.2f} 张/秒，"
+                             f"重合度 {result['mean_iou']:.1%}（最低 {result['min_iou']:.1%}）")
+        self.crop_result_var.set("模型对比完成，结果已保存到 模型对比报告.json")
+        messagebox.showinfo("模型对比", "\n".join(lines) if lines else "文件夹里没有图片")
+
     def check_thread(self, thread):
         """检查线程是否完成"""
         if thread.is_alive():
@@ -714,11 +929,13 @@ class DoraToolbox:
         """更新进度显示，线程安全"""
         self.root.after(0, lambda: self.crop_result_var.set(message))
 
-    def crop_wrapper(self, folder, callback):
-        """线程包装函数，调用 process_folder"""
-        from image_cropper import process_folder
-        result = process_folder(folder, overwrite_original=False, callback=callback)
-        self.root.after(0, lambda: self.handle_result(result))
+    def warm_up_cropper(self):
+        """后台预加载抠图模型"""
+        try:
+            from image_cropper import warm_up
+            warm_up(workers=self.crop_workers)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"预加载抠图模型失败: {e}")
 
     def handle_result(self, result):
         """处理最终结果"""
@@ -821,5 +1038,7 @@ class DoraToolbox:
         self.root.mainloop()
 
 if __name__ == "__main__":
+    # 打包成 exe 后，裁切功能的子进程需要它才能正常启动
+    multiprocessing.freeze_support()
     app = DoraToolbox()
     app.run()
\ No newline at end of file
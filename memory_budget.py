@@ -0,0 +1,97 @@
+import math
+import time
+import threading
+import multiprocessing
+from types import SimpleNamespace
+
+# 处理一张图片时每个像素大约占用的字节数：解码后的 RGB 原图、遮罩、白底合成、
+# rembg 内部的缩放副本等同时存在时的保守估计
+BYTES_PER_PIXEL = 12
+
+# 输出画布、水印等与原图大小无关的固定开销（MB）
+FIXED_COST_MB = 16
+
+
+def estimate_image_mb(size, file_size=0):
+    """
+    估算处理一张图片需要的内存
+
+    Args:
+        size: 解码后的尺寸 (宽, 高)
+        file_size: 文件大小（字节），读入的文件内容在处理期间也会占用内存
+
+    Returns:
+        float: 估算的内存占用（MB）
+    """
+    width, height = size
+    return (width * height * BYTES_PER_PIXEL + file_size) / 1024 / 1024 + FIXED_COST_MB
+
+
+def capped_size(size, max_pixels):
+    """
+    按像素数上限缩小后的尺寸，用整数倍缩小，和 Image.reduce 的结果一致
+
+    Returns:
+        tuple: (缩小倍数, (宽, 高))，不需要缩小时倍数为 1
+    """
+    width, height = size
+    if not max_pixels or width * height <= max_pixels:
+        return 1, (width, height)
+    factor = math.ceil(math.sqrt(width * height / max_pixels))
+    while math.ceil(width / factor) * math.ceil(height / factor) > max_pixels:
+        factor += 1
+    return factor, (math.ceil(width / factor), math.ceil(height / factor))
+
+
+class MemoryBudget:
+    """
+    内存预算：正在处理的图片按估算的内存占用申请额度，总额超出容量时等待其他图片处理完
+
+    额度不足时，如果当前没有任何图片在处理，仍然放行一张，保证超大图片也能处理完，
+    只是不会与其他图片同时处理。shared 为 True 时额度在多个进程之间共享，
+    需要在创建进程池时作为初始化参数传给子进程。
+    """
+
+    def __init__(self, capacity_mb, shared=False):
+        """
+        Args:
+            capacity_mb: 可用于处理图片的内存总量（MB）
+            shared: 是否在多个进程之间共享
+        """
+        if shared:
+            self._cond = multiprocessing.Condition()
+            self._used = multiprocessing.Value('d', 0.0, lock=False)
+            self._active = multiprocessing.Value('i', 0, lock=False)
+            self._capacity = multiprocessing.Value('d', capacity_mb, lock=False)
+        else:
+            self._cond = threading.Condition()
+            self._used = SimpleNamespace(value=0.0)
+            self._active = SimpleNamespace(value=0)
+            self._capacity = SimpleNamespace(value=capacity_mb)
+
+    def reserve(self, mb):
+        """永久扣除一部分容量，如子进程加载模型后的常驻内存"""
+        with self._cond:
+            self._capacity.value -= mb
+
+    def acquire(self, mb):
+        """
+        申请额度，不足时等待
+
+        Returns:
+            float: 等待的秒数
+        """
+        start = time.perf_counter()
+        with self._cond:
+            while self._active.value > 0 and self._used.value + mb > self._capacity.value:
+                self._cond.wait()
+            self._used.value += mb
+            self._active.value += 1
+        return time.perf_counter() - start
+
+    def release(self, mb):
+        """归还额度"""
+        with self._cond:
+            self._used.value -= mb
+            self._active.value -= 1
+            self._cond.notify_all()
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import random
+
+from image_cropper import DEFAULT_MODEL, SUPPORTED_FORMATS, _decode, _new_session, available_models
+from model_store import provision_model
+from segmentation import remove_mask
+
+# 对比报告文件名，保存在被对比的文件夹根目录
+REPORT_NAME = "模型对比报告.json"
+
+# 对比时把样本图片缩小到的长边尺寸，各模型都在同样的图片上推理
+SAMPLE_MAX_SIDE = 1024
+
+
+def _load_samples(input_folder, sample_size, seed):
+    files = sorted(f for f in os.listdir(input_folder) if f.lower().endswith(SUPPORTED_FORMATS))
+    if len(files) > sample_size:
+        files = sorted(random.Random(seed).sample(files, sample_size))
+    samples = []
+    for filename in files:
+        with open(os.path.join(input_folder, filename), 'rb') as f:
+            image = _decode(f.read(), (SAMPLE_MAX_SIDE, SAMPLE_MAX_SIDE))
+        image.thumbnail((SAMPLE_MAX_SIDE, SAMPLE_MAX_SIDE))
+        samples.append((filename, image))
+    return samples
+
+
+def mask_agreement(reference, mask, threshold=127):
+    """
+    两个遮罩的一致程度
+
+    Args:
+        reference: 参照模型的遮罩
+        mask: 待比较的遮罩
+        threshold: alpha 大于该值算作主体
+
+    Returns:
+        tuple: (主体区域的交并比 IoU, alpha 平均绝对误差 0~1)
+    """
+    import numpy as np
+
+    a = np.asarray(reference)
+    b = np.asarray(mask)
+    fg_a = a > threshold
+    fg_b = b > threshold
+    union = np.count_nonzero(fg_a | fg_b)
+    iou = np.count_nonzero(fg_a & fg_b) / union if union else 1.0
+    mae = float(np.abs(a.astype(np.int16) - b.astype(np.int16)).mean()) / 255
+    return iou, mae
+
+
+def compare_models(input_folder, models=None, reference=DEFAULT_MODEL, sample_size=10, seed=0, callback=None):
+    """
+    在文件夹的部分图片上对比各抠图模型的速度，以及与参照模型遮罩的一致程度
+
+    结果同时写入文件夹下的 REPORT_NAME，便于挑选够用的最快模型。
+
+    Args:
+        input_folder: 图片文件夹，只取根目录下的图片
+        models: 要对比的模型名称列表，默认为当前环境能使用的全部模型（见 available_models）
+        reference: 参照模型
+        sample_size: 抽样的图片数量
+        seed: 抽样的随机种子，相同种子抽到相同的图片
+        callback: 进度回调函数，格式为 callback(message)
+
+    Returns:
+        list: 每个模型一条结果，包含 model、images_per_second、load_seconds、
+              mean_iou、min_iou、alpha_mae，加载或推理失败时包含 error
+    """
+    samples = _load_samples(input_folder, sample_size, seed)
+    if not samples:
+        if callback:
+            callback("文件夹里没图片，搞啥呢？")
+        return []
+
+    models = list(models or available_models())
+    if reference in models:
+        models.remove(reference)
+    models.insert(0, reference)
+
+    reference_masks = None
+    results = []
+    for model_name in models:
+        if callback:
+            callback(f"正在测试模型 {model_name}...")
+        result = {"model": model_name, "images": len(samples)}
+        try:
+            start = time.perf_counter()
+            # 只为对比创建的会话不放进 get_session 的缓存，测完即释放
+            provision_model(model_name)
+            session = _new_session(model_name, 0, 0)
+            # 第一次推理包含 ONNX Runtime 的初始化，不计入速度
+            remove_mask(samples[0][1], session)
+            result["load_seconds"] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            masks = [remove_mask(image, session) for _, image in samples]
+            seconds = time.perf_counter() - start
+            # 加载下一个模型前释放这个模型
+            del session
+        except Exception as e:
+            print(f"Warning: 模型 {model_name} 测试失败: {e}")
+            result["error"] = str(e)
+            results.append(result)
+            if model_name == reference:
+                # 没有参照遮罩就无法比较一致程度
+                if callback:
+                    callback(f"参照模型 {reference} 加载失败，无法对比！")
+                return results
+            continue
+        result["images_per_second"] = len(samples) / seconds if seconds > 0 else 0.0
+
+        if model_name == reference:
+            reference_masks = masks
+            result["mean_iou"], result["min_iou"], result["alpha_mae"] = 1.0, 1.0, 0.0
+        else:
+            agreements = [mask_agreement(ref, mask) for ref, mask in zip(reference_masks, masks)]
+            ious = [iou for iou, _ in agreements]
+            result["mean_iou"] = sum(ious) / len(ious)
+            result["min_iou"] = min(ious)
+            result["alpha_mae"] = sum(mae for _, mae in agreements) / len(agreements)
+        results.append(result)
+
+        line = (f"{model_name}: {result['images_per_second']:.2f} 张/秒，"
+                f"与 {reference} 重合度 {result['mean_iou']:.1%}（最低 {result['min_iou']:.1%}）")
+        print(line)
+        if callback:
+            callback(line)
+
+    report_path = os.path.join(input_folder, REPORT_NAME)
+    try:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "reference": reference,
+                "samples": [filename for filename, _ in samples],
+                "sample_max_side": SAMPLE_MAX_SIDE,
+                "results": results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"模型对比报告已保存: {report_path}")
+    except OSError as e:
+        print(f"Warning: 模型对比报告保存失败: {e}")
+    return results
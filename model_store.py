@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+import importlib.util
+from pathlib import Path
+
+# 已知模型文件的 MD5，与 rembg 下载模型时校验用的值一致；不在表里的模型只检查文件不为空
+KNOWN_MODEL_MD5 = {
+    "u2net": "60024c5c889badc19c04ad937298a77b",
+}
+
+# 本地 int8 量化模型的名称后缀，如 u2net-int8 由 u2net 量化生成
+QUANTIZED_SUFFIX = "-int8"
+
+# 校验结果记录，文件大小和修改时间没变时不用重新计算哈希
+STAMP_NAME = ".verified.json"
+
+# 本进程内已准备好的模型，{模型名称: 模型文件路径或 None}
+_provisioned = {}
+_lock = threading.Lock()
+
+
+def model_home():
+    """rembg 查找和下载模型的目录，与 rembg 的规则一致"""
+    return Path(os.environ.get("U2NET_HOME", os.path.join(Path.home(), ".u2net")))
+
+
+def base_model_name(model_name):
+    """量化模型对应的原模型名称，其他模型原样返回"""
+    if model_name.endswith(QUANTIZED_SUFFIX):
+        return model_name[:-len(QUANTIZED_SUFFIX)]
+    return model_name
+
+
+def _search_dirs():
+    """随程序一起分发的模型文件可能所在的目录"""
+    dirs = [Path.cwd(), Path(__file__).resolve().parent]
+    if getattr(sys, "frozen", False):
+        # 打包后的程序，模型放在可执行文件旁边
+        dirs.append(Path(sys.executable).resolve().parent)
+    unique = []
+    for d in dirs:
+        if d not in unique:
+            unique.append(d)
+    return unique
+
+
+def _md5(path):
+    h = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _load_stamps(stamp_path):
+    try:
+        with open(stamp_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def verify_model(path, model_name):
+    """
+    校验模型文件是否完整
+
+    空文件直接判为不完整，已知哈希的模型再比较 MD5。校验通过的文件按 大小 + 修改时间 记录在
+    同目录的 STAMP_NAME 里，文件没变时之后不再重新计算哈希。
+
+    Args:
+        path: 模型文件路径
+        model_name: 模型名称，用于查找已知哈希
+
+    Returns:
+        bool: 文件存在且校验通过
+    """
+    path = Path(path)
+    try:
+        st = path.stat()
+    except OSError:
+        return False
+    if st.st_size == 0:
+        return False
+    expected = KNOWN_MODEL_MD5.get(model_name)
+    if expected is None:
+        return True
+
+    if _load_stamps(path.parent / STAMP_NAME).get(path.name) == _stamp_key(st, expected):
+        return True
+
+    print(f"正在校验模型文件: {path}")
+    if _md5(path) != expected:
+        print(f"Warning: 模型文件校验失败，可能已损坏: {path}")
+        return False
+    _record_verified(path, model_name)
+    return True
+
+
+def _stamp_key(st, expected):
+    return [st.st_size, st.st_mtime_ns, expected]
+
+
+def _record_verified(path, model_name):
+    """记录校验通过的模型文件"""
+    expected = KNOWN_MODEL_MD5.get(model_name)
+    if expected is None:
+        return
+    stamp_path = path.parent / STAMP_NAME
+    try:
+        stamps = _load_stamps(stamp_path)
+        stamps[path.name] = _stamp_key(path.stat(), expected)
+        tmp_path = stamp_path.with_name(f"{STAMP_NAME}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(stamps, f)
+        os.replace(tmp_path, stamp_path)
+    except OSError:
+        # 目录只读时只是下次要重新校验
+        pass
+
+
+def _link(source, target):
+    """把模型文件硬链接或软链接到 rembg 的模型目录，不复制文件内容"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+    for make_link in (os.link, os.symlink):
+        try:
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            make_link(str(source), str(tmp_path))
+            os.replace(tmp_path, target)
+            return True
+        except (OSError, NotImplementedError):
+            continue
+    return False
+
+
+def provision_model(model_name="u2net"):
+    """
+    准备模型文件，每个进程只执行一次
+
+    rembg 的模型目录里已有完整的模型时直接使用；否则在程序目录中查找随程序分发的模型，
+    校验通过后链接到模型目录（跨磁盘或没有权限时改为让 rembg 直接读取程序目录里的模型），
+    都找不到时交给 rembg 自行下载。
+
+    Args:
+        model_name: rembg 模型名称
+
+    Returns:
+        Path: 可用的模型文件路径，需要 rembg 下载时返回 None
+    """
+    with _lock:
+        return _provision_cached(model_name)
+
+
+def _provision_cached(model_name):
+    if model_name not in _provisioned:
+        _provisioned[model_name] = _provision(model_name)
+    return _provisioned[model_name]
+
+
+def _provision(model_name):
+    filename = f"{model_name}.onnx"
+    target = model_home() / filename
+    if verify_model(target, model_name):
+        return target
+
+    for directory in _search_dirs():
+        candidate = directory / filename
+        if candidate.resolve() == target.resolve() or not candidate.exists():
+            continue
+        if not verify_model(candidate, model_name):
+            continue
+        if _link(candidate, target):
+            # 链接和原文件内容相同，直接记为已校验
+            _record_verified(target, model_name)
+            print(f"模型文件已链接到: {target}")
+            return target
+        # 无法链接时让 rembg 直接从程序目录读取模型，子进程会继承这个环境变量
+        os.environ["U2NET_HOME"] = str(directory)
+        print(f"使用程序目录中的模型文件: {candidate}")
+        return candidate
+
+    base_name = base_model_name(model_name)
+    if base_name != model_name:
+        # 量化模型由原模型在本地生成，原模型还没下载时由创建会话的地方先让 rembg 下载
+        if _provision_cached(base_name) is None:
+            return None
+        return quantize_model(base_name)
+
+    print(f"未找到本地模型文件 {filename}，将由 rembg 下载到: {model_home()}")
+    return None
+
+
+def quantization_available():
+    """能否在本地生成 int8 量化模型：onnxruntime 的量化工具需要另外安装 onnx 库"""
+    return importlib.util.find_spec("onnx") is not None
+
+
+def quantized_model_path(model_name):
+    """原模型对应的 int8 量化模型路径"""
+    return model_home() / f"{model_name}{QUANTIZED_SUFFIX}.onnx"
+
+
+def quantize_model(model_name):
+    """
+    用 onnxruntime 把模型的权重动态量化为 int8，模型文件约缩小为原来的 1/4，CPU 推理更快
+
+    Args:
+        model_name: 原模型名称，模型文件需已在 model_home() 中
+
+    Returns:
+        Path: 量化后的模型路径
+    """
+    if not quantization_available():
+        raise RuntimeError("生成 int8 量化模型需要 onnx 库，请先运行 pip install onnx，或改用其他模型")
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    source = model_home() / f"{model_name}.onnx"
+    target = quantized_model_path(model_name)
+    print(f"正在生成 int8 量化模型: {target}")
+    tmp_path = target.with_name(f"{target.stem}.{os.getpid()}.tmp.onnx")
+    quantize_dynamic(str(source), str(tmp_path), weight_type=QuantType.QUInt8)
+    os.replace(tmp_path, target)
+    return target
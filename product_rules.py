@@ -0,0 +1,133 @@
+import re
+import json
+
+# 默认的产品名称规则，按顺序匹配，先匹配上的规则优先。
+# pattern 在（转换为半角后的）完整文件名上匹配，必须包含命名分组 product；
+# 可以再定义其他命名分组，并用 template 组合出产品名称，如 "{sku}-{product}"
+DEFAULT_RULES = [
+    # 产品名称(1).jpg
+    {"name": "括号序号", "pattern": r"(?P<product>.+?)\(\d+\)"},
+    # 产品名称_主图3.png、产品名称-详情2.jpg
+    {"name": "图片类型", "pattern": r"(?P<product>.+?)[ _-]*(?:主图|副图|详情图?|细节图?|白底图?|场景图?)[ _-]*\d*\.\w+$"},
+    # AB1234_01.jpg、AB-1234 2.png，按 SKU 编号分类
+    {"name": "SKU前缀", "pattern": r"^(?P<product>[A-Za-z]{1,4}-?\d{3,})(?:[ _-].*)?[ _-]\d{1,3}\.\w+$"},
+    # 产品名称-01.jpg、产品名称_2.png
+    {"name": "连字符序号", "pattern": r"^(?P<product>.+?)[ _-]\d{1,3}\.\w+$"},
+]
+
+# 全角字符转半角，文件名中不允许的字符（如 ：？＊）保留全角
+_ILLEGAL_NAME_CHARS = set('<>:"/\\|?*')
+_HALF_WIDTH = {0x3000: 0x20}
+_HALF_WIDTH.update({code: code - 0xFEE0 for code in range(0xFF01, 0xFF5F)
+                    if chr(code - 0xFEE0) not in _ILLEGAL_NAME_CHARS})
+
+# 产品名称两端去掉的分隔符
+_TRIM_CHARS = " _-.\t"
+
+_GROUP_NAME = re.compile(r"\(\?P<(\w+)>")
+# 规则开头的全局标志，如 (?i)；合并后不在表达式开头，要改成只作用于本规则的 (?i:...)
+_GLOBAL_FLAGS = re.compile(r"\(\?([aiLmsux]+)\)")
+_GROUP_REF = re.compile(r"\(\?P=(\w+)\)")
+
+
+def _scope_flags(pattern):
+    """把开头的全局标志改写成只作用于这条规则的标志分组，没有标志时原样返回"""
+    flags = ""
+    while True:
+        m = _GLOBAL_FLAGS.match(pattern)
+        if m is None:
+            break
+        flags += m.group(1)
+        pattern = pattern[m.end():]
+    if not flags:
+        return pattern
+    # 详细模式下规则末尾的注释会吞掉右括号，先换行结束注释
+    ending = "\n" if "x" in flags else ""
+    return f"(?{''.join(dict.fromkeys(flags))}:{pattern}{ending})"
+
+
+def to_half_width(text):
+    """全角字母、数字、标点和空格转换为半角"""
+    return text.translate(_HALF_WIDTH)
+
+
+class ProductRules:
+    """
+    按规则从文件名中提取产品名称
+
+    所有规则合并编译成一个正则表达式，每条规则是其中一个分支，
+    文件名只需匹配一次，规则增加时匹配耗时基本不变。分支按规则顺序尝试，
+    与逐条规则依次 re.search 的结果相同。
+    """
+
+    def __init__(self, rules=None, half_width=True):
+        """
+        Args:
+            rules: 规则列表，每条为 {"name": 规则名称, "pattern": 正则表达式, "template": 可选的名称模板}，
+                None 为 DEFAULT_RULES
+            half_width: 匹配前是否把文件名中的全角字符转换为半角
+        """
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self.half_width = half_width
+        branches = []
+        for index, rule in enumerate(self.rules):
+            pattern = rule["pattern"]
+            name = rule.get("name", f"规则{index + 1}")
+            if "(?P<product>" not in pattern:
+                raise ValueError(f"产品名称规则缺少 product 分组: {name}")
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"产品名称规则 {name} 的正则表达式有误: {e}") from e
+            pattern = _scope_flags(pattern)
+            # 各分支的分组名加上规则序号，避免合并后重名
+            pattern = _GROUP_NAME.sub(lambda m: f"(?P<r{index}_{m.group(1)}>", pattern)
+            pattern = _GROUP_REF.sub(lambda m: f"(?P=r{index}_{m.group(1)})", pattern)
+            # 前面加上最短的任意前缀，在开头匹配时等同于 search
+            branch = f"(?P<r{index}>(?s:.*?)(?:{pattern}))"
+            try:
+                re.compile(branch)
+            except re.error as e:
+                raise ValueError(f"产品名称规则 {name} 无法与其他规则合并: {e}") from e
+            branches.append(branch)
+        self._matcher = re.compile("^(?:" + "|".join(branches) + ")") if branches else None
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        从 JSON 文件读取规则
+
+        文件内容为规则列表，或 {"rules": 规则列表, "half_width": true/false}
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            return cls(data)
+        return cls(data.get("rules"), data.get("half_width", True))
+
+    def match(self, file_name):
+        """
+        从文件名中提取产品名称
+
+        Args:
+            file_name: 文件名（不含目录）
+
+        Returns:
+            tuple: (产品名称, 规则名称)，没有规则匹配或名称为空时返回 None
+        """
+        if self._matcher is None:
+            return None
+        text = to_half_width(file_name) if self.half_width else file_name
+        m = self._matcher.match(text)
+        if m is None:
+            return None
+        index = int(m.lastgroup[1:])
+        rule = self.rules[index]
+        prefix = f"r{index}_"
+        groups = {name[len(prefix):]: value or "" for name, value in m.groupdict().items()
+                  if name.startswith(prefix)}
+        product = rule.get("template", "{product}").format(**groups)
+        product = " ".join(product.split()).strip(_TRIM_CHARS)
+        if not product:
+            return None
+        return product, rule.get("name", f"规则{index + 1}")
@@ -0,0 +1,239 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from PIL import Image, ImageChops
+
+from model_store import base_model_name
+
+# 各模型的输入预处理参数 (均值, 标准差, 输入尺寸)，与 rembg 中对应会话的 predict 保持一致，
+# 本地量化的模型与原模型相同
+MODEL_INPUTS = {
+    "u2net": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    "u2netp": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    "u2net_human_seg": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    "silueta": ((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    "isnet-general-use": ((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+
+
+def remove_mask(image, session):
+    """用 rembg 为单张图片计算 alpha 遮罩"""
+    import rembg
+
+    return rembg.remove(image, session=session, only_mask=True)
+
+
+def supports_batching(session, model_name):
+    """判断模型能否一次推理多张图片：需要已知的预处理参数，且输入的 batch 维度不固定为 1"""
+    if base_model_name(model_name) not in MODEL_INPUTS:
+        return False
+    try:
+        batch_dim = session.inner_session.get_inputs()[0].shape[0]
+    except Exception:
+        return False
+    return not (isinstance(batch_dim, int) and batch_dim == 1)
+
+
+def predict_masks(session, model_name, images):
+    """
+    一次推理多张图片
+
+    预处理和后处理与 rembg 的单张推理相同，只是把多张图片拼成一个 batch 调用一次 ONNX Runtime。
+
+    Args:
+        session: rembg 会话
+        model_name: 模型名称，需在 MODEL_INPUTS 中
+        images: PIL 图片列表
+
+    Returns:
+        list: 与 images 顺序对应的 L 模式遮罩
+    """
+    import numpy as np
+
+    mean, std, size = MODEL_INPUTS[base_model_name(model_name)]
+    feeds = [session.normalize(image, mean, std, size) for image in images]
+    input_name = next(iter(feeds[0]))
+    batch = np.concatenate([feed[input_name] for feed in feeds], axis=0)
+    outputs = session.inner_session.run(None, {input_name: batch})
+
+    masks = []
+    for pred, image in zip(outputs[0][:, 0, :, :], images):
+        ma = np.max(pred)
+        mi = np.min(pred)
+        pred = (pred - mi) / (ma - mi)
+        mask = Image.fromarray((pred * 255).astype("uint8"), mode="L")
+        masks.append(mask.resize(image.size, Image.LANCZOS))
+    return masks
+
+
+class BatchSegmenter:
+    """
+    批量抠图推理
+
+    submit 提交的图片先在队列里攒着，攒够 batch_size 张或第一张等待超过 flush_timeout 秒后，
+    由后台线程一次推理整批，图片少的文件夹不会一直等凑满一批。
+    模型不支持批量推理时自动退回逐张推理。
+    """
+
+    def __init__(self, session, model_name, batch_size=4, flush_timeout=0.05):
+        """
+        Args:
+            session: rembg 会话
+            model_name: 模型名称
+            batch_size: 每批最多推理的图片数
+            flush_timeout: 凑批最长等待时间（秒）
+        """
+        self.session = session
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.flush_timeout = flush_timeout
+        self.batching = self.batch_size > 1 and supports_batching(session, model_name)
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, image, timings=None):
+        """
+        提交一张图片
+
+        Args:
+            image: PIL 图片
+            timings: 阶段耗时字典，推理完成后把该图片分摊到的推理耗时记入 timings["inference"]
+
+        Returns:
+            Future: 结果为该图片的遮罩
+        """
+        future = Future()
+        self._queue.put((image, future, timings))
+        return future
+
+    def close(self):
+        """处理完已提交的图片后停止后台线程"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_timeout
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._predict(batch)
+
+    def _predict(self, batch):
+        images = [image for image, _, _ in batch]
+        if self.batching and len(batch) > 1:
+            start = time.perf_counter()
+            try:
+                masks = predict_masks(self.session, self.model_name, images)
+            except Exception as e:
+                # 模型实际不支持批量输入时，之后都改为逐张推理
+                print(f"Warning: 批量推理失败，改为逐张推理: {e}")
+                self.batching = False
+            else:
+                seconds = (time.perf_counter() - start) / len(batch)
+                for (_, future, timings), mask in zip(batch, masks):
+                    if timings is not None:
+                        timings['inference'] = seconds
+                    future.set_result(mask)
+                return
+
+        for image, future, timings in batch:
+            start = time.perf_counter()
+            try:
+                mask = remove_mask(image, self.session)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            if timings is not None:
+                timings['inference'] = time.perf_counter() - start
+            future.set_result(mask)
+
+
+def white_background_mask(image, min_level=235, max_std=6.0, tolerance=12, ramp=24, check_size=160):
+    """
+    白底图快速抠图：背景已经是均匀的浅色时，直接按亮度算出遮罩，不运行抠图模型
+
+    先看图片四周一圈像素：足够亮、颜色均匀且接近中性灰时才认为是白底图。然后在缩小的图上
+    从四周开始向内扩展，找出与边框相连的浅色区域作为背景，主体内部的白色部分不会被当成背景。
+    最后在原尺寸上，背景区域里按每个像素比背景暗多少给出渐变的 alpha，边缘保持平滑。
+
+    Args:
+        image: PIL 图片
+        min_level: 边框像素的平均亮度下限（0~255）
+        max_std: 边框像素亮度的标准差上限
+        tolerance: 比背景亮度暗不超过该值的像素算作背景
+        ramp: 比背景暗 tolerance 到 tolerance + ramp 之间的像素 alpha 从 0 渐变到 255
+        check_size: 查找相连背景区域时把图片缩小到的长边尺寸
+
+    Returns:
+        Image: 与 image 同尺寸的 L 模式遮罩，不是白底图时返回 None
+    """
+    import numpy as np
+
+    rgb = image.convert("RGB")
+    scale = min(1.0, check_size / max(rgb.size))
+    small = rgb.resize((max(1, int(rgb.width * scale)), max(1, int(rgb.height * scale))), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    darkest = pixels.min(axis=2)
+
+    # 四周一圈 2 像素宽的边框
+    border = np.concatenate([darkest[:2].ravel(), darkest[-2:].ravel(), darkest[:, :2].ravel(), darkest[:, -2:].ravel()])
+    border_rgb = np.concatenate([pixels[:2].reshape(-1, 3), pixels[-2:].reshape(-1, 3),
+                                 pixels[:, :2].reshape(-1, 3), pixels[:, -2:].reshape(-1, 3)])
+    level = float(np.median(border))
+    if level < min_level or border.std() > max_std:
+        return None
+    # 彩色背景（如浅黄、浅蓝）各通道差别大，不算白底
+    if float(np.median(border_rgb.max(axis=1) - border_rgb.min(axis=1))) > tolerance:
+        return None
+
+    # 从边框向内扩展，得到与边框相连的浅色区域
+    light = darkest >= level - tolerance
+    background = np.zeros_like(light)
+    background[[0, -1], :] = light[[0, -1], :]
+    background[:, [0, -1]] = light[:, [0, -1]]
+    while True:
+        grown = _dilate(background) & light
+        if np.array_equal(grown, background):
+            break
+        background = grown
+    if background.mean() > 0.995:
+        # 整张图几乎都是背景，交给模型判断
+        return None
+
+    # 背景区域向外扩一圈后放大到原尺寸，覆盖缩小时与主体混在一起的边缘像素
+    region = Image.fromarray(_dilate(background).astype(np.uint8) * 255).resize(rgb.size, Image.NEAREST)
+
+    # 原尺寸上的计算都用 Pillow 的逐像素运算完成，不在大图上创建 numpy 数组
+    red, green, blue = rgb.split()
+    full_darkest = ImageChops.darker(ImageChops.darker(red, green), blue)
+    cutoff = level - tolerance
+    alpha = full_darkest.point([min(255, max(0, (cutoff - v) * 255 // max(1, ramp))) for v in range(256)])
+    return Image.composite(alpha, Image.new("L", rgb.size, 255), region)
+
+
+def _dilate(mask):
+    """布尔数组向上下左右各扩一个像素"""
+    grown = mask.copy()
+    grown[1:, :] |= mask[:-1, :]
+    grown[:-1, :] |= mask[1:, :]
+    grown[:, 1:] |= mask[:, :-1]
+    grown[:, :-1] |= mask[:, 1:]
+    return grown
@@ -0,0 +1,180 @@
+"""
+CropJournal 断点续跑的行为测试
+
+模拟运行中途退出后留下的日志，检查 pending 只跳过真正处理完的图片。
+
+用法：
+    python -m unittest test_crop_journal
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from crop_cache import file_hash
+from crop_journal import CropJournal, staging_path
+
+RUN_KEY = "test-run"
+
+
+class CropJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def _write(self, name, data):
+        path = os.path.join(self.folder, name)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def _stage(self, output_path, data):
+        """像 _save_image 一样写好临时文件，返回 (临时文件路径, 输出路径, 内容哈希)"""
+        tmp_path = staging_path(output_path)
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        return tmp_path, output_path, file_hash(tmp_path)
+
+    def _committing(self, journal, input_path, staged):
+        """只写入 committing 记录，模拟落盘后、替换完成前退出"""
+        journal._append({
+            'file': journal._key(input_path),
+            'state': 'committing',
+            'outputs': {journal._key(path): digest for _, path, digest in staged},
+        }, sync=True)
+
+    def test_committed_images_are_skipped(self):
+        a = self._write("a.jpg", b"a")
+        b = self._write("b.jpg", b"b")
+        out_a = os.path.join(self.folder, "a.png")
+        out_b = os.path.join(self.folder, "b.png")
+
+        journal = CropJournal(self.folder, RUN_KEY)
+        journal.commit(a, [self._stage(out_a, b"result a")])
+        journal.close()
+
+        journal = CropJournal(self.folder, RUN_KEY)
+        pending, resumed = journal.pending([(a, (out_a,)), (b, (out_b,))])
+        journal.close()
+        self.assertEqual(pending, [(b, (out_b,))])
+        self.assertEqual(resumed, [(a, (out_a,))])
+        with open(out_a, 'rb') as f:
+            self.assertEqual(f.read(), b"result a")
+
+    def test_overwrite_replaced_before_done_is_not_processed_again(self):
+        # 覆盖原图：原图已被替换为处理结果，但 done 还没写入
+        original = self._write("a.jpg", b"original")
+        journal = CropJournal(self.folder, RUN_KEY)
+        staged = [self._stage(original, b"cropped")]
+        self._committing(journal, original, staged)
+        os.replace(staged[0][0], original)
+        journal.close()
+
+        journal = CropJournal(self.folder, RUN_KEY)
+        pending, resumed = journal.pending([(original, (original,))])
+        journal.close()
+        self.assertEqual(pending, [])
+        self.assertEqual(resumed, [(original, (original,))])
+
+        # 补写的 done 记录让再下一次运行也直接跳过
+        journal = CropJournal(self.folder, RUN_KEY)
+        self.assertEqual(journal.entries[journal._key(original)]['state'], 'done')
+        journal.close()
+
+    def test_overwrite_not_yet_replaced_is_processed_again(self):
+        original = self._write("a.jpg", b"original")
+        journal = CropJournal(self.folder, RUN_KEY)
+        staged = [self._stage(original, b"cropped")]
+        self._committing(journal, original, staged)
+        journal.close()
+
+        journal = CropJournal(self.folder, RUN_KEY)
+        pending, resumed = journal.pending([(original, (original,))])
+        journal.close()
+        self.assertEqual(pending, [(original, (original,))])
+        self.assertEqual(resumed, [])
+        # 原图完好，上次留下的临时文件已清理
+        with open(original, 'rb') as f:
+            self.assertEqual(f.read(), b"original")
+        self.assertFalse(os.path.exists(staged[0][0]))
+
+    def test_partially_replaced_outputs_are_processed_again(self):
+        # 多个输出配置，只替换了第一个输出就退出
+        source = self._write("a.jpg", b"a")
+        out_main = self._write("main.png", b"old main")
+        out_thumb = self._write("thumb.png", b"old thumb")
+        journal = CropJournal(self.folder, RUN_KEY)
+        staged = [self._stage(out_main, b"new main"), self._stage(out_thumb, b"new thumb")]
+        self._committing(journal, source, staged)
+        os.replace(staged[0][0], out_main)
+        journal.close()
+
+        journal = CropJournal(self.folder, RUN_KEY)
+        pending, resumed = journal.pending([(source, (out_main, out_thumb))])
+        journal.close()
+        self.assertEqual(pending, [(source, (out_main, out_thumb))])
+        self.assertEqual(resumed, [])
+        self.assertFalse(os.path.exists(staged[1][0]))
+
+    def test_failed_and_modified_images_are_processed_again(self):
+        a = self._write("a.jpg", b"a")
+        b = self._write("b.jpg", b"b")
+        out_a = os.path.join(self.folder, "a.png")
+        out_b = os.path.join(self.folder, "b.png")
+        journal = CropJournal(self.folder, RUN_KEY)
+        journal.commit(a, [self._stage(out_a, b"result a")])
+        journal.fail(b, "decode error")
+        journal.close()
+        # 处理完之后输入图片又被修改
+        self._write("a.jpg", b"a, edited")
+
+        journal = CropJournal(self.folder, RUN_KEY)
+        pending, resumed = journal.pending([(a, (out_a,)), (b, (out_b,))])
+        journal.close()
+        self.assertEqual(pending, [(a, (out_a,)), (b, (out_b,))])
+        self.assertEqual(resumed, [])
+
+    def test_deleted_or_changed_outputs_are_processed_again(self):
+        a = self._write("a.jpg", b"a")
+        b = self._write("b.jpg", b"b")
+        out_a = os.path.join(self.folder, "a.png")
+        out_b = os.path.join(self.folder, "b.png")
+        journal = CropJournal(self.folder, RUN_KEY)
+        journal.commit(a, [self._stage(out_a, b"result a")])
+        journal.commit(b, [self._stage(out_b, b"result b")])
+        journal.close()
+        os.remove(out_a)
+        self._write("b.png", b"edited by hand")
+
+        journal = CropJournal(self.folder, RUN_KEY)
+        pending, resumed = journal.pending([(a, (out_a,)), (b, (out_b,))])
+        journal.close()
+        self.assertEqual(pending, [(a, (out_a,)), (b, (out_b,))])
+        self.assertEqual(resumed, [])
+
+    def test_finished_or_different_run_starts_over(self):
+        a = self._write("a.jpg", b"a")
+        out_a = os.path.join(self.folder, "a.png")
+        journal = CropJournal(self.folder, RUN_KEY)
+        journal.commit(a, [self._stage(out_a, b"result a")])
+        journal.close()
+
+        journal = CropJournal(self.folder, "other-run")
+        pending, _ = journal.pending([(a, (out_a,))])
+        journal.close()
+        self.assertEqual(pending, [(a, (out_a,))])
+
+        journal = CropJournal(self.folder, RUN_KEY)
+        journal.commit(a, [self._stage(out_a, b"result a")])
+        journal.close(finished=True)
+        journal = CropJournal(self.folder, RUN_KEY)
+        pending, _ = journal.pending([(a, (out_a,))])
+        journal.close()
+        self.assertEqual(pending, [(a, (out_a,))])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import hashlib
+import threading
+from PIL import Image
+
+# 支持的水印位置，tile 为平铺满整个画布
+POSITIONS = ('center', 'top_left', 'top_right', 'bottom_left', 'bottom_right', 'tile')
+
+# 已生成的水印，按 logo 路径、修改时间、透明度、画布尺寸等参数缓存
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+class Watermark:
+    """预先生成好的水印，同一套参数只生成一次，之后每张图片只需贴一次图"""
+
+    def __init__(self, logo_path, opacity=0.3, canvas_size=(1000, 1000), max_logo_size=500,
+                 position='center', margin=20, tile_spacing=100):
+        """
+        Args:
+            logo_path: logo 图片路径
+            opacity: 水印不透明度，0~1，按 logo 原有透明度等比缩放
+            canvas_size: 要加水印的画布尺寸 (宽, 高)
+            max_logo_size: logo 长边缩放到的尺寸
+            position: 水印位置，取值见 POSITIONS
+            margin: 贴在四角时距画布边缘的距离
+            tile_spacing: 平铺时相邻两个 logo 的间距
+        """
+        if position not in POSITIONS:
+            raise ValueError(f"不支持的水印位置: {position}")
+        self.canvas_size = tuple(canvas_size)
+
+        logo = Image.open(logo_path).convert("RGBA")
+        # 用查找表一次性缩放整个 alpha 通道，不再逐像素 getpixel/putpixel
+        alpha = logo.getchannel("A").point(lambda a: int(a * opacity))
+        logo.putalpha(alpha)
+
+        # Resize logo while maintaining aspect ratio
+        logo_width, logo_height = logo.size
+        if logo_width > logo_height:
+            new_logo_width = max_logo_size
+            new_logo_height = int(logo_height * max_logo_size / logo_width)
+        else:
+            new_logo_height = max_logo_size
+            new_logo_width = int(logo_width * max_logo_size / logo_height)
+        logo = logo.resize((new_logo_width, new_logo_height), Image.LANCZOS)
+
+        canvas_width, canvas_height = self.canvas_size
+        if position == 'tile':
+            # 平铺时预先生成整张画布大小的水印图层
+            self.image = Image.new("RGBA", self.canvas_size, (0, 0, 0, 0))
+            step_x = new_logo_width + tile_spacing
+            step_y = new_logo_height + tile_spacing
+            for y in range(0, canvas_height, step_y):
+                for x in range(0, canvas_width, step_x):
+                    self.image.paste(logo, (x, y))
+            self.offset = (0, 0)
+        else:
+            self.image = logo
+            if position == 'center':
+                x = (canvas_width - new_logo_width) // 2
+                y = (canvas_height - new_logo_height) // 2
+            else:
+                vertical, horizontal = position.split('_')
+                x = margin if horizontal == 'left' else canvas_width - new_logo_width - margin
+                y = margin if vertical == 'top' else canvas_height - new_logo_height - margin
+            self.offset = (x, y)
+
+    def apply(self, image):
+        """把水印贴到图片上（原地修改）"""
+        image.paste(self.image, self.offset, self.image)
+        return image
+
+
+def get_watermark(logo_path='logo.jpg', opacity=0.3, canvas_size=(1000, 1000), max_logo_size=500,
+                  position='center'):
+    """
+    获取缓存的水印，logo 文件修改后会自动重新生成
+
+    Args:
+        logo_path: logo 图片路径
+        opacity: 水印不透明度，0~1
+        canvas_size: 要加水印的画布尺寸 (宽, 高)
+        max_logo_size: logo 长边缩放到的尺寸
+        position: 水印位置，取值见 POSITIONS
+
+    Returns:
+        Watermark: 水印对象，logo 不存在或加载失败时返回 None
+    """
+    if not logo_path or not os.path.exists(logo_path):
+        return None
+    logo_path = os.path.abspath(logo_path)
+    key = (logo_path, os.path.getmtime(logo_path), opacity, tuple(canvas_size), max_logo_size, position)
+    with _cache_lock:
+        watermark = _cache.get(key)
+        if watermark is None:
+            try:
+                watermark = Watermark(logo_path, opacity, canvas_size, max_logo_size, position)
+            except Exception as e:
+                print(f"Warning: Could not add watermark: {str(e)}")
+                return None
+            _cache[key] = watermark
+    return watermark
+
+
+def watermark_fingerprint(logo_path='logo.jpg', opacity=0.3, canvas_size=(1000, 1000), max_logo_size=500,
+                          position='center'):
+    """
+    水印的指纹，logo 内容或任一参数变化时随之改变，用于判断缓存的结果是否还能用
+
+    Returns:
+        list: 可 JSON 序列化的指纹，logo 不存在时返回 None
+    """
+    if not logo_path or not os.path.exists(logo_path):
+        return None
+    with open(logo_path, 'rb') as f:
+        logo_hash = hashlib.md5(f.read()).hexdigest()
+    return [logo_hash, opacity, list(canvas_size), max_logo_size, position]